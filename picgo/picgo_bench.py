@@ -0,0 +1,539 @@
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# ---------------------------------------------------------
+# 모델 로딩 벤치마크
+# - 작은 랜덤 가중치 SD1.5 / SDXL 구조 single-file 체크포인트를 직접 만들어 (네트워크 불필요)
+#   실제 load_model 경로를 단계별로 측정합니다. 생성 시간도 측정해 CPU 성능 모드의 속도 향상을 보고합니다.
+# - 결과는 JSON 으로 저장하고, 저장해 둔 기준값과 비교해 느려진 항목을 표시합니다.
+#   (CPU 전용 CI 에서도 실행 가능)
+#
+#   python picgo_bench.py --output bench.json
+#   python picgo_bench.py --compare baseline.json --threshold 0.25
+# ---------------------------------------------------------
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+ARCHS = ("sd1", "sdxl")
+DEFAULT_THRESHOLD = 0.25
+# 이보다 작은 차이(초)는 측정 잡음으로 보고 무시
+MIN_REGRESSION_SECONDS = 0.005
+
+
+# ---------------------------------------------------------
+# 작은 체크포인트 생성
+# ---------------------------------------------------------
+def _write_tiny_tokenizer(out_dir):
+    """바이트 단위 토큰만 있는 CLIP 토크나이저 (merge 없음)"""
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    os.makedirs(out_dir, exist_ok=True)
+    chars = list(bytes_to_unicode().values())
+    vocab = {}
+    for suffix in ("", "</w>"):
+        for c in chars:
+            vocab[c + suffix] = len(vocab)
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(out_dir, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(os.path.join(out_dir, "vocab.json"), os.path.join(out_dir, "merges.txt"), model_max_length=77)
+
+
+def build_tiny_pipeline(arch, work_dir, seed=0):
+    """arch("sd1"/"sdxl") 구조의 작은 랜덤 가중치 파이프라인"""
+    import torch
+    from diffusers import (AutoencoderKL, EulerDiscreteScheduler, StableDiffusionPipeline,
+                           StableDiffusionXLPipeline, UNet2DConditionModel)
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProjection
+
+    torch.manual_seed(seed)
+    tokenizer = _write_tiny_tokenizer(os.path.join(work_dir, "tokenizer"))
+    text_config = dict(
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.eos_token_id,
+        hidden_size=32, intermediate_size=37, num_attention_heads=4, num_hidden_layers=2,
+        vocab_size=len(tokenizer), hidden_act="gelu", projection_dim=32,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(32, 64), down_block_types=("DownEncoderBlock2D",) * 2,
+        up_block_types=("UpDecoderBlock2D",) * 2, latent_channels=4, layers_per_block=1,
+        norm_num_groups=32, sample_size=32,
+    )
+    scheduler = EulerDiscreteScheduler(
+        beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear", timestep_spacing="leading", steps_offset=1,
+    )
+    if arch == "sd1":
+        unet = UNet2DConditionModel(
+            sample_size=16, layers_per_block=1, block_out_channels=(32, 64),
+            down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+            up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+            cross_attention_dim=32, attention_head_dim=8, norm_num_groups=32,
+        )
+        return StableDiffusionPipeline(
+            vae=vae, text_encoder=CLIPTextModel(CLIPTextConfig(**text_config)), tokenizer=tokenizer, unet=unet,
+            scheduler=scheduler, safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+        )
+
+    unet = UNet2DConditionModel(
+        sample_size=16, layers_per_block=1, block_out_channels=(32, 64),
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4), use_linear_projection=True,
+        addition_embed_type="text_time", addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 2), projection_class_embeddings_input_dim=80,
+        cross_attention_dim=80, norm_num_groups=32,
+    )
+    # 실제 SDXL 처럼 두 텍스트 인코더의 hidden 크기가 달라야 diffusers 가 구분함
+    text_encoder_2 = CLIPTextModelWithProjection(CLIPTextConfig(**dict(text_config, hidden_size=48)))
+    return StableDiffusionXLPipeline(
+        vae=vae, text_encoder=CLIPTextModel(CLIPTextConfig(**text_config)), text_encoder_2=text_encoder_2,
+        tokenizer=tokenizer, tokenizer_2=tokenizer, unet=unet, scheduler=scheduler,
+    )
+
+
+# diffusers -> LDM(원본 single-file) 키 변환
+_RESNET_NAMES = [("norm1", "in_layers.0"), ("conv1", "in_layers.2"), ("norm2", "out_layers.0"),
+                 ("conv2", "out_layers.3"), ("time_emb_proj", "emb_layers.1"), ("conv_shortcut", "skip_connection")]
+
+
+def _ldm_resnet(rest):
+    for name, ldm_name in _RESNET_NAMES:
+        if rest.startswith(name + "."):
+            return ldm_name + rest[len(name):]
+    return rest
+
+
+def _unet_to_ldm(unet):
+    from diffusers.loaders.single_file_utils import DIFFUSERS_TO_LDM_MAPPING
+
+    top = dict(DIFFUSERS_TO_LDM_MAPPING["unet"]["layers"])
+    top.update(DIFFUSERS_TO_LDM_MAPPING["unet"]["addition_embed_type"])
+    per_block = unet.config.layers_per_block
+    stride = per_block + 1
+    out = {}
+    for key, value in unet.state_dict().items():
+        if key in top:
+            new = top[key]
+        elif m := re.match(r"down_blocks\.(\d+)\.resnets\.(\d+)\.(.*)", key):
+            new = f"input_blocks.{int(m[1]) * stride + int(m[2]) + 1}.0.{_ldm_resnet(m[3])}"
+        elif m := re.match(r"down_blocks\.(\d+)\.attentions\.(\d+)\.(.*)", key):
+            new = f"input_blocks.{int(m[1]) * stride + int(m[2]) + 1}.1.{m[3]}"
+        elif m := re.match(r"down_blocks\.(\d+)\.downsamplers\.0\.conv\.(.*)", key):
+            new = f"input_blocks.{(int(m[1]) + 1) * stride}.0.op.{m[2]}"
+        elif m := re.match(r"mid_block\.resnets\.(\d+)\.(.*)", key):
+            new = f"middle_block.{2 * int(m[1])}.{_ldm_resnet(m[2])}"
+        elif m := re.match(r"mid_block\.attentions\.0\.(.*)", key):
+            new = f"middle_block.1.{m[1]}"
+        elif m := re.match(r"up_blocks\.(\d+)\.resnets\.(\d+)\.(.*)", key):
+            new = f"output_blocks.{int(m[1]) * stride + int(m[2])}.0.{_ldm_resnet(m[3])}"
+        elif m := re.match(r"up_blocks\.(\d+)\.attentions\.(\d+)\.(.*)", key):
+            new = f"output_blocks.{int(m[1]) * stride + int(m[2])}.1.{m[3]}"
+        elif m := re.match(r"up_blocks\.(\d+)\.upsamplers\.0\.conv\.(.*)", key):
+            block = int(m[1])
+            index = 2 if hasattr(unet.up_blocks[block], "attentions") else 1
+            new = f"output_blocks.{block * stride + per_block}.{index}.conv.{m[2]}"
+        else:
+            raise KeyError(f"Unmapped UNet key: {key}")
+        out["model.diffusion_model." + new] = value
+    return out
+
+
+def _vae_to_ldm(vae):
+    blocks = len(vae.config.block_out_channels)
+    attention = {"group_norm": "norm", "to_q": "q", "to_k": "k", "to_v": "v", "to_out.0": "proj_out"}
+    out = {}
+    for key, value in vae.state_dict().items():
+        new = key
+        if m := re.match(r"encoder\.down_blocks\.(\d+)\.resnets\.(\d+)\.(.*)", key):
+            new = f"encoder.down.{m[1]}.block.{m[2]}.{m[3]}"
+        elif m := re.match(r"encoder\.down_blocks\.(\d+)\.downsamplers\.0\.(.*)", key):
+            new = f"encoder.down.{m[1]}.downsample.{m[2]}"
+        elif m := re.match(r"decoder\.up_blocks\.(\d+)\.resnets\.(\d+)\.(.*)", key):
+            new = f"decoder.up.{blocks - 1 - int(m[1])}.block.{m[2]}.{m[3]}"
+        elif m := re.match(r"decoder\.up_blocks\.(\d+)\.upsamplers\.0\.(.*)", key):
+            new = f"decoder.up.{blocks - 1 - int(m[1])}.upsample.{m[2]}"
+        elif m := re.match(r"(encoder|decoder)\.mid_block\.resnets\.(\d+)\.(.*)", key):
+            new = f"{m[1]}.mid.block_{int(m[2]) + 1}.{m[3]}"
+        elif m := re.match(r"(encoder|decoder)\.mid_block\.attentions\.0\.(.*)\.(weight|bias)", key):
+            new = f"{m[1]}.mid.attn_1.{attention[m[2]]}.{m[3]}"
+            # LDM VAE 는 attention 을 1x1 conv 로 저장
+            if m[3] == "weight" and value.ndim == 2:
+                value = value[:, :, None, None]
+        new = new.replace("conv_shortcut", "nin_shortcut").replace("conv_norm_out", "norm_out")
+        out["first_stage_model." + new] = value
+    return out
+
+
+def _clip_to_ldm(text_encoder, prefix):
+    return {prefix + k: v for k, v in text_encoder.state_dict().items() if not k.endswith("position_ids")}
+
+
+def _open_clip_to_ldm(text_encoder, prefix):
+    """SDXL 두 번째 텍스트 인코더 (OpenCLIP 형식: q/k/v 를 in_proj 하나로 합침)"""
+    import torch
+
+    out = {}
+    qkv = {}
+    for key, value in text_encoder.state_dict().items():
+        if key.endswith("position_ids"):
+            continue
+        if key == "text_model.embeddings.position_embedding.weight":
+            out[prefix + "positional_embedding"] = value
+        elif key == "text_model.embeddings.token_embedding.weight":
+            out[prefix + "token_embedding.weight"] = value
+        elif key.startswith("text_model.final_layer_norm."):
+            out[prefix + "ln_final." + key.split(".")[-1]] = value
+        elif key == "text_projection.weight":
+            out[prefix + "text_projection"] = value.T.contiguous()
+        elif m := re.match(r"text_model\.encoder\.layers\.(\d+)\.self_attn\.(q|k|v)_proj\.(weight|bias)", key):
+            qkv.setdefault((int(m[1]), m[3]), {})[m[2]] = value
+        else:
+            m = re.match(r"text_model\.encoder\.layers\.(\d+)\.(.*)", key)
+            rest = (m[2].replace("layer_norm1", "ln_1").replace("layer_norm2", "ln_2")
+                    .replace("mlp.fc1", "mlp.c_fc").replace("mlp.fc2", "mlp.c_proj")
+                    .replace("self_attn.out_proj", "attn.out_proj"))
+            out[f"{prefix}transformer.resblocks.{m[1]}.{rest}"] = value
+    for (layer, kind), parts in qkv.items():
+        out[f"{prefix}transformer.resblocks.{layer}.attn.in_proj_{kind}"] = torch.cat([parts["q"], parts["k"], parts["v"]])
+    return out
+
+
+def pipeline_to_ldm_state_dict(pipe, arch):
+    state_dict = {}
+    state_dict.update(_unet_to_ldm(pipe.unet))
+    state_dict.update(_vae_to_ldm(pipe.vae))
+    if arch == "sd1":
+        state_dict.update(_clip_to_ldm(pipe.text_encoder, "cond_stage_model.transformer."))
+    else:
+        state_dict.update(_clip_to_ldm(pipe.text_encoder, "conditioner.embedders.0.transformer."))
+        state_dict.update(_open_clip_to_ldm(pipe.text_encoder_2, "conditioner.embedders.1.model."))
+    return {k: v.contiguous() for k, v in state_dict.items()}
+
+
+def make_tiny_checkpoints(work_dir):
+    """
+    work_dir 에 tiny-<arch>.safetensors 와 components/<arch> (로컬 컴포넌트 저장소 형식) 를 만듭니다.
+    저장소 폴더가 from_single_file 의 config 로 쓰이므로 네트워크 없이 로드됩니다.
+    반환: {arch: 체크포인트 경로}
+    """
+    from safetensors.torch import save_file
+
+    paths = {}
+    for arch in ARCHS:
+        pipe = build_tiny_pipeline(arch, os.path.join(work_dir, "_build", arch))
+        pipe.save_pretrained(os.path.join(work_dir, "components", arch))
+        paths[arch] = os.path.join(work_dir, f"tiny-{arch}.safetensors")
+        save_file(pipeline_to_ldm_state_dict(pipe, arch), paths[arch])
+    shutil.rmtree(os.path.join(work_dir, "_build"), ignore_errors=True)
+    return paths
+
+
+# ---------------------------------------------------------
+# 측정
+# ---------------------------------------------------------
+class PhaseTimer:
+    """load_model 진행 이벤트로 단계별 소요 시간 기록"""
+
+    def __init__(self):
+        self.marks = []
+
+    def __call__(self, event):
+        if not self.marks or self.marks[-1][0] != event["phase"]:
+            self.marks.append((event["phase"], time.perf_counter()))
+
+    def durations(self, end):
+        result = {}
+        for i, (phase, start) in enumerate(self.marks):
+            if phase == "done":
+                break
+            stop = self.marks[i + 1][1] if i + 1 < len(self.marks) else end
+            result[phase] = result.get(phase, 0.0) + stop - start
+        return result
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _new_engine(work_dir, run_dir):
+    import picgo_local
+    from picgo_checkpoint import ConvertedModelCache, FileHashMemo, LocalComponentStore
+
+    engine = picgo_local.TextToImageModel()
+    engine.device = "cpu"
+    engine.component_store = LocalComponentStore(os.path.join(work_dir, "components"))
+    engine.converted_cache = ConvertedModelCache(
+        os.path.join(run_dir, "converted"), hash_memo=FileHashMemo(os.path.join(run_dir, "hashes.json"))
+    )
+    # 변환 캐시 저장/재사용 시간도 재야 하므로 켜 둠 (앱 기본값은 꺼짐)
+    engine.converted_cache_enabled = True
+    engine.quantized_cache = picgo_local.QuantizedWeightCache(os.path.join(run_dir, "quantized"))
+    return engine
+
+
+def _timed_load(engine, path, metrics, prefix):
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    if not engine.load_model(path, progress_callback=timer):
+        raise RuntimeError(f"{prefix}: load failed: {engine.last_error}")
+    end = time.perf_counter()
+    metrics[f"{prefix}.total"] = end - start
+    for phase, seconds in timer.durations(end).items():
+        metrics[f"{prefix}.{phase}"] = seconds
+
+
+GENERATE_STEPS = 8
+# int8 품질 비교에 쓰는 고정 시드
+QUALITY_SEEDS = (0, 1, 2)
+# DeepCache 속도/품질을 잴 간격 (GENERATE_STEPS 보다 작아야 의미가 있음)
+DEEP_CACHE_INTERVALS = (2, 3)
+
+
+def _timed_generate(engine, metrics, name, **request_kwargs):
+    import picgo_local
+
+    request = picgo_local.GenerationRequest("a photo of a cat", "blurry", steps=GENERATE_STEPS, seed=0, **request_kwargs)
+    engine.generate_images(request)  # 설정 적용/컴파일 등 첫 실행 비용은 제외
+    _, metrics[name] = _timed(engine.generate_images, request)
+
+
+def bench_generation(engine, arch, metrics, compile_unet=False):
+    """기본 경로와 CPU 성능 모드의 생성 시간"""
+    engine.set_cpu_performance(False)
+    _timed_generate(engine, metrics, f"{arch}.generate.default")
+    engine.set_cpu_performance(True)
+    _timed_generate(engine, metrics, f"{arch}.generate.cpu_performance")
+    if compile_unet:
+        engine.set_cpu_performance(True, compile_unet=True)
+        _timed_generate(engine, metrics, f"{arch}.generate.cpu_performance_compiled")
+    engine.set_cpu_performance(False)
+
+
+def _generate_fixed(engine, **request_kwargs):
+    import numpy as np
+    import picgo_local
+
+    request = picgo_local.GenerationRequest("a photo of a cat", "blurry", steps=GENERATE_STEPS,
+                                            seed=list(QUALITY_SEEDS), num_images_per_prompt=len(QUALITY_SEEDS),
+                                            **request_kwargs)
+    return [np.asarray(image, dtype=np.float64) for image in engine.generate_images(request)]
+
+
+def psnr(a, b):
+    mse = float(((a - b) ** 2).mean())
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def bench_int8(engine, path, arch, metrics, quality):
+    """int8 양자화 경로의 생성 시간과, 같은 시드로 만든 float 결과 대비 품질 (이미지별 최저 PSNR)"""
+    engine.quantize_int8 = False
+    if not engine.load_model(path):
+        raise RuntimeError(f"{arch}: load failed: {engine.last_error}")
+    reference = _generate_fixed(engine)
+    engine.quantize_int8 = True
+    if not engine.load_model(path):
+        raise RuntimeError(f"{arch}: int8 load failed: {engine.last_error}")
+    _timed_generate(engine, metrics, f"{arch}.generate.int8")
+    quantized = _generate_fixed(engine)
+    engine.quantize_int8 = False
+    quality.setdefault(arch, {}).update(image_quality("int8", reference, quantized))
+
+
+def image_quality(name, reference, images):
+    """{name_psnr_db: 이미지별 최저 PSNR, name_mean_abs_diff: 평균 절대 차이}"""
+    return {
+        f"{name}_psnr_db": min(psnr(a, b) for a, b in zip(reference, images)),
+        f"{name}_mean_abs_diff": sum(float(abs(a - b).mean()) for a, b in zip(reference, images)) / len(reference),
+    }
+
+
+def bench_deep_cache(engine, path, arch, metrics, quality):
+    """DeepCache 간격별 생성 시간과 전체 UNet 결과 대비 품질"""
+    if not engine.load_model(path):
+        raise RuntimeError(f"{arch}: load failed: {engine.last_error}")
+    reference = _generate_fixed(engine)
+    for interval in DEEP_CACHE_INTERVALS:
+        _timed_generate(engine, metrics, f"{arch}.generate.deep_cache_{interval}", deep_cache_interval=interval)
+        cached = _generate_fixed(engine, deep_cache_interval=interval)
+        quality.setdefault(arch, {}).update(image_quality(f"deep_cache_{interval}", reference, cached))
+
+
+def bench_onnx(engine, path, arch, metrics, quality):
+    """ONNX Runtime 백엔드의 내보내기/생성 시간과 PyTorch 결과 대비 품질 (onnxruntime 이 없으면 건너뜀)"""
+    import picgo_local
+    from picgo_onnx import onnx_folder_for
+
+    if not picgo_local.onnx_available():
+        return
+    # 내보내기 시간도 매번 측정하도록 이전 실행의 그래프 삭제
+    shutil.rmtree(onnx_folder_for(path), ignore_errors=True)
+    if not engine.load_model(path):
+        raise RuntimeError(f"{arch}: load failed: {engine.last_error}")
+    reference = _generate_fixed(engine)
+    engine.set_backend("onnx")
+    try:
+        _, metrics[f"{arch}.onnx_export"] = _timed(engine._execution_pipeline)
+        _timed_generate(engine, metrics, f"{arch}.generate.onnx")
+        exported = _generate_fixed(engine)
+    finally:
+        engine.set_backend("pytorch")
+    quality.setdefault(arch, {}).update(image_quality("onnx", reference, exported))
+
+
+def speedups(metrics):
+    """{이름: 기본 경로 대비 배속} (generate.* 지표)"""
+    result = {}
+    for name, seconds in metrics.items():
+        arch, _, variant = name.partition(".generate.")
+        if variant and variant != "default" and seconds > 0:
+            result[f"{arch}.{variant}"] = metrics[f"{arch}.generate.default"] / seconds
+    return result
+
+
+def bench_once(work_dir, paths, run_dir, compile_unet=False, quality=None):
+    """모든 시나리오를 한 번씩 실행해 {지표 이름: 초} 반환. quality 에는 int8/ONNX/DeepCache 품질 비교 결과를 채움"""
+    import torch
+    import picgo_checkpoint
+
+    metrics = {}
+    for arch, path in paths.items():
+        # 개별 단계: 헤더 판별, mmap 텐서 구성, 전체 읽기, dtype 변환, 내용 해시
+        _, metrics[f"{arch}.header_parse"] = _timed(picgo_checkpoint.detect_architecture, path)
+        state_dict, metrics[f"{arch}.mmap_open"] = _timed(picgo_checkpoint.load_state_dict_mmap, path)
+        _, metrics[f"{arch}.tensor_read"] = _timed(lambda: sum(float(t.float().sum()) for t in state_dict.values()))
+        _, metrics[f"{arch}.dtype_cast_fp16"] = _timed(
+            lambda: [t.to(torch.float16) for t in state_dict.values() if t.is_floating_point()]
+        )
+        del state_dict
+        memo = picgo_checkpoint.FileHashMemo(os.path.join(run_dir, f"hash-{arch}.json"))
+        _, metrics[f"{arch}.content_hash"] = _timed(memo.content_hash, path)
+
+        # 실제 load_model 경로: 변환 캐시 없음 -> 변환 캐시 -> 메모리 캐시
+        engine = _new_engine(work_dir, run_dir)
+        _timed_load(engine, path, metrics, f"{arch}.single_file")
+        engine.pipeline_cache.clear()
+        _timed_load(engine, path, metrics, f"{arch}.converted_cache")
+        _timed_load(engine, path, metrics, f"{arch}.memory_cache")
+        bench_generation(engine, arch, metrics, compile_unet)
+        quality = quality if quality is not None else {}
+        bench_int8(engine, path, arch, metrics, quality)
+        bench_onnx(engine, path, arch, metrics, quality)
+        bench_deep_cache(engine, path, arch, metrics, quality)
+        engine.pipeline_cache.clear()
+    return metrics
+
+
+def run_benchmark(work_dir=None, repeat=3, compile_unet=False):
+    """repeat 번 실행한 각 지표의 중앙값과 실행 환경 정보 반환"""
+    import torch
+    import diffusers
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="picgo-bench-")
+    try:
+        metrics = {}
+        quality = {}  # 시드가 고정이므로 마지막 실행 값 사용
+        paths, setup_seconds = _timed(make_tiny_checkpoints, work_dir)
+        runs = []
+        for i in range(repeat):
+            run_dir = os.path.join(work_dir, f"run{i}")
+            runs.append(bench_once(work_dir, paths, run_dir, compile_unet, quality))
+            shutil.rmtree(run_dir, ignore_errors=True)
+        for name in runs[0]:
+            metrics[name] = statistics.median(run[name] for run in runs)
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "torch": torch.__version__,
+                "diffusers": diffusers.__version__,
+                "repeat": repeat,
+                "setup_seconds": setup_seconds,
+            },
+            "metrics": metrics,
+            "speedups": speedups(metrics),
+            "quality": quality,
+        }
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """baseline 보다 threshold 비율 이상 느려진 지표 목록 [(이름, 기준, 현재)]"""
+    regressions = []
+    for name, base in sorted(baseline["metrics"].items()):
+        now = current["metrics"].get(name)
+        if now is None:
+            continue
+        if now > base * (1 + threshold) and now - base > MIN_REGRESSION_SECONDS:
+            regressions.append((name, base, now))
+    return regressions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PicGo model loading benchmark (tiny local checkpoints, CPU)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown that counts as a regression (default: 0.25)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    parser.add_argument("--work-dir", help="Keep generated checkpoints in this folder")
+    parser.add_argument("--compile", action="store_true", help="Also time CPU performance mode with a compiled UNet")
+    parser.add_argument("--min-psnr", type=float,
+                        help="Fail if int8/ONNX/deep cache images differ from the default path by more than this (PSNR in dB)")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    result = run_benchmark(args.work_dir, args.repeat, args.compile)
+
+    for name, seconds in sorted(result["metrics"].items()):
+        print(f"{name:40s} {seconds * 1000:10.1f} ms")
+    for name, factor in sorted(result["speedups"].items()):
+        print(f"{name:40s} {factor:10.2f}x vs default")
+    for arch, values in sorted(result["quality"].items()):
+        for key in sorted(k for k in values if k.endswith("_psnr_db")):
+            variant = key[:-len("_psnr_db")]
+            print(f"{arch + '.' + variant + '_quality':40s} {values[key]:10.1f} dB PSNR "
+                  f"(mean abs diff {values[variant + '_mean_abs_diff']:.2f})")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.min_psnr is not None:
+        low = [(arch, key[:-len("_psnr_db")], value) for arch, values in sorted(result["quality"].items())
+               for key, value in sorted(values.items()) if key.endswith("_psnr_db") and value < args.min_psnr]
+        for arch, variant, value in low:
+            print(f"QUALITY {arch}: {variant} PSNR {value:.1f} dB < {args.min_psnr} dB")
+        if low:
+            sys.exit(1)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        for name, base, now in regressions:
+            print(f"REGRESSION {name}: {base * 1000:.1f} ms -> {now * 1000:.1f} ms (+{(now / base - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (threshold {args.threshold:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
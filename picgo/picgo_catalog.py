@@ -0,0 +1,274 @@
+import json
+import os
+import threading
+import time
+
+from picgo_checkpoint import (
+    get_base_path, read_safetensors_header, read_tensor_shapes, classify_checkpoint, yaml_prediction_type,
+    content_hash, quick_hash,
+)
+
+# ---------------------------------------------------------
+# 모델 카탈로그
+# - model 폴더의 체크포인트 정보를 (헤더 메타데이터, 크기, 구조, 정밀도, 해시) 작은 JSON 인덱스에 기록합니다.
+# - 다시 스캔할 때는 (크기, mtime) 이 바뀐 파일만 읽으므로 대용량 파일이 많아도 바로 끝납니다.
+# - torch 없이 동작합니다 (GUI 와 배치 도구에서 공용으로 사용).
+# ---------------------------------------------------------
+DEFAULT_MODEL_DIR = os.path.join(get_base_path(), "model")
+DEFAULT_CATALOG_PATH = os.path.join(get_base_path(), "cache", "catalog.json")
+MODEL_EXTENSIONS = (".safetensors", ".ckpt")
+
+# 헤더 메타데이터 중 카탈로그에 남길 항목 (학습 태그 통계 등 큰 값은 제외)
+KEPT_METADATA_PREFIXES = ("modelspec.", "ss_base_model_version", "ss_sd_model_name", "ss_v2", "ss_v_parameterization")
+MAX_METADATA_VALUE_CHARS = 200
+
+# safetensors dtype -> 정밀도 표기
+PRECISION_NAMES = {"F64": "fp64", "F32": "fp32", "F16": "fp16", "BF16": "bf16", "F8_E4M3": "fp8", "F8_E5M2": "fp8"}
+
+
+def _trim_metadata(metadata):
+    kept = {}
+    for key, value in (metadata or {}).items():
+        if key.startswith(KEPT_METADATA_PREFIXES):
+            kept[key] = str(value)[:MAX_METADATA_VALUE_CHARS]
+    return kept
+
+
+def _precision_from_header(header):
+    """가장 많은 바이트를 차지하는 부동소수 dtype (fp16/fp32/bf16...)"""
+    totals = {}
+    for name, info in header.items():
+        if name == "__metadata__" or info["dtype"] not in PRECISION_NAMES:
+            continue
+        start, end = info["data_offsets"]
+        precision = PRECISION_NAMES[info["dtype"]]
+        totals[precision] = totals.get(precision, 0) + (end - start)
+    if not totals:
+        return None
+    return max(totals, key=totals.get)
+
+
+def describe_checkpoint(path, hash_file=True):
+    """체크포인트 하나의 카탈로그 항목 생성 (가중치는 읽지 않음, 해시는 선택)"""
+    st = os.stat(path)
+    entry = {
+        "path": os.path.abspath(path),
+        "name": os.path.basename(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "arch": None,
+        "label": None,
+        "prediction_type": None,
+        "inpainting": False,
+        "precision": None,
+        "tensor_count": None,
+        "metadata": {},
+        "quick_hash": None,
+        "hash": None,
+        "error": None,
+    }
+    try:
+        if path.lower().endswith(".safetensors"):
+            header = read_safetensors_header(path)
+            metadata = header.get("__metadata__") or {}
+            entry["precision"] = _precision_from_header(header)
+            shapes = {name: tuple(info["shape"]) for name, info in header.items() if name != "__metadata__"}
+        else:
+            shapes, metadata = read_tensor_shapes(path)
+        if shapes is not None:
+            entry["tensor_count"] = len(shapes)
+            entry["metadata"] = _trim_metadata(metadata)
+            info = classify_checkpoint(shapes, metadata)
+            if info:
+                entry.update(arch=info["arch"], label=info["label"],
+                             prediction_type=info["prediction_type"] or yaml_prediction_type(path),
+                             inpainting=info["inpainting"])
+        entry["quick_hash"] = quick_hash(path)
+        if hash_file:
+            entry["hash"] = content_hash(path)
+    except Exception as e:
+        entry["error"] = str(e)
+    return entry
+
+
+class ModelCatalog:
+    VERSION = 3
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, index_path=DEFAULT_CATALOG_PATH, hash_files=True):
+        self.model_dir = model_dir
+        self.index_path = index_path
+        self.hash_files = hash_files
+        self._lock = threading.Lock()
+        self._entries = self._read_index()
+
+    # --- index 파일 관리 ---
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get("version") != self.VERSION:
+            return {}
+        return index.get("entries", {})
+
+    def _write_index(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "scanned_at": time.time(), "entries": self._entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    # --- 스캔 ---
+    def _list_files(self):
+        found = {}
+        if not os.path.isdir(self.model_dir):
+            return found
+        for root, _, files in os.walk(self.model_dir):
+            for name in files:
+                if name.lower().endswith(MODEL_EXTENSIONS):
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        found[path] = os.stat(path)
+                    except OSError:
+                        pass
+        return found
+
+    def scan(self, progress=None):
+        """
+        model 폴더를 다시 스캔합니다. 크기/mtime 이 그대로인 파일은 건너뜁니다.
+        progress(done, total, name) 콜백은 새로 읽는 파일마다 호출됩니다.
+        반환: {"added": n, "updated": n, "removed": n, "unchanged": n}
+        """
+        files = self._list_files()
+        with self._lock:
+            known = dict(self._entries)
+
+        stale = []
+        for path, st in files.items():
+            entry = known.get(path)
+            if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+                stale.append(path)
+                continue
+            # 이전 스캔에서 해시를 생략했다면 이번에 채움
+            if self.hash_files and entry.get("hash") is None and entry.get("error") is None:
+                stale.append(path)
+        removed = [path for path in known if path not in files]
+
+        stats = {"added": 0, "updated": 0, "removed": len(removed), "unchanged": len(files) - len(stale)}
+        for done, path in enumerate(stale):
+            if progress:
+                progress(done, len(stale), os.path.basename(path))
+            entry = describe_checkpoint(path, hash_file=self.hash_files)
+            stats["updated" if path in known else "added"] += 1
+            with self._lock:
+                self._entries[path] = entry
+
+        with self._lock:
+            for path in removed:
+                self._entries.pop(path, None)
+            if stale or removed or not os.path.exists(self.index_path):
+                self._write_index()
+        if progress and stale:
+            progress(len(stale), len(stale), "")
+        return stats
+
+    def hash_entries(self, paths=None, progress=None):
+        """
+        paths(없으면 해시가 없는 모든 항목)의 내용 해시를 계산해 인덱스에 기록합니다.
+        hash_files=False 로 빠르게 스캔한 뒤 필요한 파일만 해시할 때 사용. 해시한 파일 수를 반환.
+        """
+        with self._lock:
+            if paths is None:
+                paths = [path for path, e in self._entries.items() if e.get("hash") is None and e.get("error") is None]
+            targets = [os.path.abspath(path) for path in paths if os.path.abspath(path) in self._entries]
+
+        hashed = 0
+        for done, path in enumerate(targets):
+            if progress:
+                progress(done, len(targets), os.path.basename(path))
+            try:
+                digest = content_hash(path)
+            except OSError as e:
+                print(f"Failed to hash {path}: {e}")
+                continue
+            with self._lock:
+                if path in self._entries:
+                    self._entries[path]["hash"] = digest
+                    hashed += 1
+        if hashed:
+            with self._lock:
+                self._write_index()
+        if progress and targets:
+            progress(len(targets), len(targets), "")
+        return hashed
+
+    # --- 조회 ---
+    def entries(self):
+        with self._lock:
+            return sorted((dict(e) for e in self._entries.values()), key=lambda e: e["name"].lower())
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(path))
+            return dict(entry) if entry else None
+
+    def find_by_hash(self, digest):
+        """같은 내용(해시 앞부분 일치)의 파일 목록"""
+        return [e for e in self.entries() if e["hash"] and e["hash"].startswith(digest)]
+
+    def query(self, arch=None, precision=None, name=None, min_size=None, max_size=None, inpainting=None):
+        """조건에 맞는 항목 목록. name 은 파일명 부분 일치 (대소문자 무시)"""
+        result = []
+        for e in self.entries():
+            if arch is not None and e["arch"] != arch:
+                continue
+            if precision is not None and e["precision"] != precision:
+                continue
+            if name is not None and name.lower() not in e["name"].lower():
+                continue
+            if min_size is not None and e["size"] < min_size:
+                continue
+            if max_size is not None and e["size"] > max_size:
+                continue
+            if inpainting is not None and e["inpainting"] != inpainting:
+                continue
+            result.append(e)
+        return result
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PicGo model catalog")
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--index", default=DEFAULT_CATALOG_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_scan = sub.add_parser("scan", help="Rescan the model folder (only changed files are read)")
+    p_scan.add_argument("--no-hash", action="store_true", help="Skip content hashing")
+
+    p_list = sub.add_parser("list", help="List catalog entries")
+    p_list.add_argument("--arch", help="Filter by architecture (sd1, sd2, sdxl, sdxl_refiner)")
+    p_list.add_argument("--precision", help="Filter by precision (fp16, fp32, bf16)")
+    p_list.add_argument("--name", help="Filter by file name substring")
+    p_list.add_argument("--json", action="store_true", help="Print entries as JSON")
+
+    args = parser.parse_args(argv)
+    catalog = ModelCatalog(args.model_dir, args.index, hash_files=not getattr(args, "no_hash", False))
+    if args.command == "scan":
+        start = time.perf_counter()
+        stats = catalog.scan(progress=lambda done, total, name: name and print(f"[{done + 1}/{total}] {name}"))
+        print(f"Scanned in {time.perf_counter() - start:.3f}s: "
+              f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, {stats['unchanged']} unchanged")
+    elif args.command == "list":
+        entries = catalog.query(arch=args.arch, precision=args.precision, name=args.name)
+        if args.json:
+            print(json.dumps(entries, indent=2))
+            return
+        for e in entries:
+            print(f"{e['name']:50s} {e['label'] or '?':10s} {e['precision'] or '?':5s} {e['size'] / 1024 ** 3:6.2f} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,888 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import weakref
+
+# ---------------------------------------------------------
+# 체크포인트 파일 유틸리티
+# - 가중치를 읽기 전에 파일 헤더만 보고 모델 구조를 판별합니다.
+# - torch 없이도 import 가능해야 합니다 (카탈로그/배치 도구에서 사용).
+# ---------------------------------------------------------
+
+def get_base_path():
+    """실행 파일(.exe) 또는 스크립트가 있는 폴더"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+ARCH_SD1 = "sd1"
+ARCH_SD2 = "sd2"
+ARCH_SDXL = "sdxl"
+ARCH_SDXL_REFINER = "sdxl_refiner"
+
+ARCH_LABELS = {
+    ARCH_SD1: "SD 1.x",
+    ARCH_SD2: "SD 2.x",
+    ARCH_SDXL: "SDXL Base",
+    ARCH_SDXL_REFINER: "SDXL Refiner",
+}
+
+# 손상된 파일에서 거대한 헤더를 읽지 않도록 상한을 둠
+MAX_HEADER_BYTES = 100 * 1024 * 1024
+
+UNET_PREFIX = "model.diffusion_model."
+UNET_CONV_IN_KEY = UNET_PREFIX + "input_blocks.0.0.weight"
+# cross-attention 이 시작되는 블록은 구조마다 다름 (SD1/2: input_blocks.1, SDXL: input_blocks.4)
+UNET_CROSS_ATTN_SUFFIX = ".attn2.to_k.weight"
+
+# safetensors dtype 문자열 -> torch dtype 이름
+SAFETENSORS_DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+    "F8_E4M3": "float8_e4m3fn",
+    "F8_E5M2": "float8_e5m2",
+}
+
+# 텍스트 인코더 위치로 계열을 구분 (순서 중요: SDXL 을 먼저 확인)
+TEXT_ENCODER_PREFIXES = [
+    ("conditioner.embedders.1.model.", ARCH_SDXL),
+    ("conditioner.embedders.0.model.", ARCH_SDXL_REFINER),
+    ("cond_stage_model.model.", ARCH_SD2),
+    ("cond_stage_model.transformer.", ARCH_SD1),
+]
+
+# 텍스트 인코더가 없는 (UNet 만 있는) 파일은 cross-attention 차원으로 구분
+CONTEXT_DIM_ARCH = {
+    768: ARCH_SD1,
+    1024: ARCH_SD2,
+    1280: ARCH_SDXL_REFINER,
+    2048: ARCH_SDXL,
+}
+
+
+def _read_header(f, path):
+    raw = f.read(8)
+    if len(raw) != 8:
+        raise ValueError(f"Not a safetensors file (too short): {path}")
+    (header_len,) = struct.unpack("<Q", raw)
+    if header_len > MAX_HEADER_BYTES:
+        raise ValueError(f"Invalid safetensors header size ({header_len} bytes): {path}")
+    header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+def read_safetensors_header(path):
+    """safetensors 파일의 JSON 헤더만 읽어서 반환 (텐서 데이터는 읽지 않음)"""
+    with open(path, "rb") as f:
+        header, _ = _read_header(f, path)
+    return header
+
+
+def read_tensor_shapes(path):
+    """
+    체크포인트의 {텐서 이름: shape} 과 메타데이터를 반환합니다.
+    .safetensors 는 헤더만, .ckpt 는 mmap 으로 pickle 만 읽으므로 가중치는 로드되지 않습니다.
+    판별할 수 없는 형식이면 (None, None) 을 반환합니다.
+    """
+    if path.lower().endswith(".safetensors"):
+        header = read_safetensors_header(path)
+        metadata = header.pop("__metadata__", None) or {}
+        return {name: tuple(info["shape"]) for name, info in header.items()}, metadata
+
+    try:
+        import torch
+        # zip 형식(.ckpt, torch>=1.6) 만 mmap 가능. 구형 포맷은 실패하므로 None 반환
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except Exception as e:
+        print(f"Could not read checkpoint without loading it: {e}")
+        return None, None
+
+    while isinstance(state_dict, dict) and "state_dict" in state_dict:
+        state_dict = state_dict["state_dict"]
+    shapes = {name: tuple(t.shape) for name, t in state_dict.items() if hasattr(t, "shape")}
+    return shapes, {}
+
+
+def estimate_loaded_bytes(path, float_itemsize=None):
+    """
+    로드 후 가중치가 차지할 대략적인 메모리 (바이트).
+    float_itemsize 를 주면 부동소수 텐서는 그 크기로 변환된다고 가정합니다.
+    헤더를 읽을 수 없는 형식은 파일 크기를 그대로 사용합니다.
+    """
+    if not path.lower().endswith(".safetensors"):
+        return os.path.getsize(path)
+    header = read_safetensors_header(path)
+    header.pop("__metadata__", None)
+    total = 0
+    for info in header.values():
+        nbytes = info["data_offsets"][1] - info["data_offsets"][0]
+        if float_itemsize and info["dtype"] in ("F64", "F32", "F16", "BF16"):
+            numel = 1
+            for dim in info["shape"]:
+                numel *= dim
+            nbytes = numel * float_itemsize
+        total += nbytes
+    return total
+
+
+def load_state_dict_mmap(path):
+    """
+    체크포인트를 mmap 으로 열고, 매핑된 페이지 위에 바로 텐서를 만들어 반환합니다 (zero-copy).
+    데이터는 실제로 접근될 때 페이지 단위로 읽히며, dtype 변환이 필요한 텐서만 나중에 복사됩니다.
+    """
+    import mmap
+    import torch
+
+    if not path.lower().endswith(".safetensors"):
+        # zip 형식 .ckpt 는 torch 가 직접 mmap 지원 (구형 포맷은 예외 발생)
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        while "state_dict" in state_dict:
+            state_dict = state_dict["state_dict"]
+        return state_dict
+
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f, path)
+        # ACCESS_COPY: 쓰기 가능한 private 매핑. 페이지는 수정될 때만 복사되고 원본 파일은 바뀌지 않음
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header.pop("__metadata__", None)
+    state_dict = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        if end == start:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        # 텐서가 mmap 객체를 참조하므로 마지막 텐서가 해제될 때 매핑도 해제됨
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=(end - start) // dtype.itemsize, offset=data_start + start)
+        state_dict[name] = tensor.reshape(info["shape"])
+    return state_dict
+
+
+def _prediction_type(shapes, metadata):
+    """메타데이터/마커로 알 수 있을 때만 prediction type 을 반환. 모르면 None"""
+    value = str(metadata.get("modelspec.prediction_type", "")).lower()
+    if value in ("v", "v_prediction", "v-prediction"):
+        return "v_prediction"
+    if value in ("epsilon", "eps"):
+        return "epsilon"
+    if str(metadata.get("ss_v_parameterization", "")).lower() == "true":
+        return "v_prediction"
+    # 일부 v-prediction 파인튜닝 모델이 넣어두는 마커 텐서
+    if "v_pred" in shapes:
+        return "v_prediction"
+    return None
+
+
+def yaml_prediction_type(path):
+    """
+    체크포인트 옆의 원본 설정 파일(<이름>.yaml)에서 prediction type 을 읽습니다.
+    LDM 설정은 v-prediction 일 때만 parameterization: "v" 를 적으므로, 설정 파일이 있는데 항목이 없으면 epsilon.
+    설정 파일이 없거나 읽을 수 없으면 None.
+    """
+    config_path = os.path.splitext(path)[0] + ".yaml"
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError:
+        return None
+    match = re.search(r"^\s*parameterization\s*:\s*[\"']?(\w+)", text, re.MULTILINE)
+    if match is None or match.group(1).lower() in ("eps", "epsilon"):
+        return "epsilon"
+    if match.group(1).lower() == "v":
+        return "v_prediction"
+    return None
+
+
+def _cross_attention_dim(shapes):
+    for name, shape in shapes.items():
+        if name.startswith(UNET_PREFIX) and name.endswith(UNET_CROSS_ATTN_SUFFIX):
+            return shape[-1]
+    return None
+
+
+def classify_checkpoint(shapes, metadata=None):
+    """텐서 이름/shape 으로 모델 구조를 판별. 알 수 없으면 None"""
+    metadata = metadata or {}
+    arch = None
+    for prefix, candidate in TEXT_ENCODER_PREFIXES:
+        if any(name.startswith(prefix) for name in shapes):
+            arch = candidate
+            break
+
+    if arch is None:
+        arch = CONTEXT_DIM_ARCH.get(_cross_attention_dim(shapes))
+
+    if arch is None:
+        return None
+
+    conv_in = shapes.get(UNET_CONV_IN_KEY)
+    return {
+        "arch": arch,
+        "label": ARCH_LABELS[arch],
+        # None = 파일만으로는 알 수 없음 (diffusers 가 추론한 설정을 그대로 사용)
+        "prediction_type": _prediction_type(shapes, metadata),
+        # 9채널 입력 = 인페인팅 전용 UNet
+        "inpainting": bool(conv_in and len(conv_in) > 1 and conv_in[1] == 9),
+    }
+
+
+def detect_architecture(path):
+    """파일 헤더만 읽어 체크포인트 구조를 판별. 판별 불가 시 None"""
+    try:
+        shapes, metadata = read_tensor_shapes(path)
+    except Exception as e:
+        print(f"Failed to read checkpoint header: {e}")
+        return None
+    if shapes is None:
+        return None
+    info = classify_checkpoint(shapes, metadata)
+    if info is not None and info["prediction_type"] is None:
+        info["prediction_type"] = yaml_prediction_type(path)
+    return info
+
+
+# ---------------------------------------------------------
+# .ckpt -> .safetensors 변환
+# - pickle 기반 .ckpt 는 느리고 mmap 이 안 되므로, 한 번 safetensors 로 바꿔 두면
+#   이후에는 헤더 판별/zero-copy 로딩 경로를 그대로 사용할 수 있습니다.
+# - 헤더를 먼저 계산해 쓰고 텐서를 하나씩 기록하므로, 메모리는 가장 큰 텐서 정도만 사용합니다.
+# ---------------------------------------------------------
+# 추론에 필요 없는 키 (EMA 가중치, 학습 상태)
+PRUNE_KEY_PREFIXES = ("model_ema.", "optimizer.", "optimizer_states.", "lr_scheduler.", "loss.")
+
+
+CONVERTED_FROM_KEY = "picgo.converted_from"
+
+
+def _sibling_candidates(path):
+    # 같은 이름의 다른 .safetensors 가 이미 있으면 .converted.safetensors 에 저장하므로 둘 다 확인
+    stem = os.path.splitext(path)[0]
+    return stem + ".safetensors", stem + ".converted.safetensors"
+
+
+def _converted_from(path):
+    try:
+        header = read_safetensors_header(path)
+    except (OSError, ValueError):
+        return None
+    return (header.get("__metadata__") or {}).get(CONVERTED_FROM_KEY)
+
+
+def converted_sibling(path):
+    """
+    .ckpt 를 변환해 둔 .safetensors 가 옆에 있으면 그 경로, 없으면 None.
+    변환 메타데이터가 이 .ckpt 를 가리키고 .ckpt 보다 나중에 만들어진 파일만 사용합니다
+    (이름만 같은 다른 모델이나 .ckpt 가 바뀐 뒤의 오래된 변환본은 무시).
+    """
+    if not path.lower().endswith(".ckpt"):
+        return None
+    try:
+        ckpt_mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    name = os.path.basename(path)
+    for candidate in _sibling_candidates(path):
+        if not os.path.isfile(candidate) or _converted_from(candidate) != name:
+            continue
+        if os.path.getmtime(candidate) < ckpt_mtime:
+            print(f"Ignoring {os.path.basename(candidate)}: {name} changed after it was converted")
+            continue
+        return candidate
+    return None
+
+
+def conversion_output_path(path):
+    """변환 결과를 저장할 경로. 이 .ckpt 의 변환본이 아닌 같은 이름의 파일은 덮어쓰지 않음"""
+    primary, alternate = _sibling_candidates(path)
+    if os.path.exists(primary) and _converted_from(primary) != os.path.basename(path):
+        return alternate
+    return primary
+
+
+def convert_ckpt_to_safetensors(path, output_path=None, prune=True, half=False, progress=None):
+    """
+    .ckpt 를 텐서 단위로 스트리밍해서 .safetensors 로 저장합니다.
+    prune: EMA/학습 전용 키 제거, half: float32 텐서를 float16 으로 저장.
+    progress(done, total) 는 텐서를 하나 쓸 때마다 호출됩니다. 저장한 경로를 반환합니다.
+    """
+    import torch
+
+    output_path = output_path or conversion_output_path(path)
+    torch_to_safetensors = {getattr(torch, name): code for code, name in SAFETENSORS_DTYPES.items() if hasattr(torch, name)}
+
+    try:
+        # zip 형식은 mmap 으로 열어 텐서가 쓰일 때만 읽힘
+        state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except Exception:
+        # 구형 pickle 포맷은 mmap 불가 -> 전체 로드
+        print("Checkpoint cannot be memory-mapped. Loading it fully for conversion...")
+        state_dict = torch.load(path, map_location="cpu", weights_only=True)
+    while isinstance(state_dict, dict) and "state_dict" in state_dict:
+        state_dict = state_dict["state_dict"]
+
+    names = []
+    for name, tensor in state_dict.items():
+        if not isinstance(tensor, torch.Tensor):
+            continue
+        if prune and name.startswith(PRUNE_KEY_PREFIXES):
+            continue
+        names.append(name)
+
+    def target_dtype(tensor):
+        return torch.float16 if half and tensor.dtype == torch.float32 else tensor.dtype
+
+    # 1) 헤더 계산 (데이터 오프셋은 텐서 크기로 미리 정해짐)
+    header = {"__metadata__": {"format": "pt", CONVERTED_FROM_KEY: os.path.basename(path)}}
+    offset = 0
+    for name in names:
+        tensor = state_dict[name]
+        dtype = target_dtype(tensor)
+        nbytes = tensor.numel() * dtype.itemsize
+        header[name] = {"dtype": torch_to_safetensors[dtype], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # 데이터 시작 위치를 8바이트 정렬
+    header_bytes += b" " * (-len(header_bytes) % 8)
+
+    # 2) 텐서를 하나씩 기록 (임시 파일에 쓴 뒤 교체)
+    tmp_path = output_path + ".partial"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for done, name in enumerate(names):
+                tensor = state_dict[name]
+                data = tensor.detach().to(target_dtype(tensor)).contiguous().reshape(-1)
+                if data.numel():
+                    f.write(memoryview(data.view(torch.uint8).numpy()))
+                del data
+                if progress:
+                    progress(done + 1, len(names))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    print(f"Converted {os.path.basename(path)} -> {os.path.basename(output_path)} "
+          f"({len(names)} tensors, {len(state_dict) - len(names)} skipped)")
+    return output_path
+
+
+# ---------------------------------------------------------
+# 체크포인트 내용 해시
+# - 파일을 고정 크기 청크로 나눠 스레드 풀에서 병렬로 sha256 을 계산하고(mmap),
+#   청크 해시들을 다시 해시합니다 (tree hash). hashlib 은 해시 중 GIL 을 놓기 때문에
+#   스레드 수만큼 코어를 사용해 NVMe 대역폭을 채울 수 있습니다.
+# - 결과는 (경로, 크기, mtime) 으로 메모해 두므로 파일 버전당 한 번만 계산됩니다.
+# ---------------------------------------------------------
+HASH_CHUNK_BYTES = 64 * 1024 * 1024
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+# quick hash: 앞/중간/끝 일부만 읽는 변경 감지용 해시
+QUICK_HASH_SAMPLE_BYTES = 1024 * 1024
+DEFAULT_HASH_MEMO_PATH = os.path.join(get_base_path(), "cache", "hashes.json")
+
+
+def tree_hash_file(path, chunk_size=HASH_CHUNK_BYTES, workers=HASH_WORKERS):
+    """파일 전체의 병렬 tree hash (hex)"""
+    import mmap
+    from concurrent.futures import ThreadPoolExecutor
+
+    size = os.path.getsize(path)
+    root = hashlib.sha256(f"picgo-tree-sha256:{chunk_size}:{size}".encode())
+    if size == 0:
+        return root.hexdigest()
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+
+        def hash_chunk(offset):
+            with view[offset:offset + chunk_size] as chunk:
+                return hashlib.sha256(chunk).digest()
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for digest in pool.map(hash_chunk, range(0, size, chunk_size)):
+                    root.update(digest)
+        finally:
+            view.release()
+    return root.hexdigest()
+
+
+def quick_hash_file(path, sample_bytes=QUICK_HASH_SAMPLE_BYTES):
+    """크기 + 앞/중간/끝 샘플만 해시 (변경 감지용, 내용 동일성 보장은 안 됨)"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(f"picgo-quick-sha256:{sample_bytes}:{size}".encode())
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - sample_bytes // 2), max(0, size - sample_bytes)}):
+            f.seek(offset)
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
+
+class FileHashMemo:
+    def __init__(self, memo_path=DEFAULT_HASH_MEMO_PATH):
+        self.memo_path = memo_path
+        self._lock = threading.Lock()
+        # 같은 파일을 여러 스레드가 동시에 해시하지 않도록 경로별 잠금
+        self._path_locks = {}
+        self._memo = None
+
+    def _load(self):
+        if self._memo is None:
+            try:
+                with open(self.memo_path, "r", encoding="utf-8") as f:
+                    self._memo = json.load(f)
+            except (OSError, ValueError):
+                self._memo = {}
+        return self._memo
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.memo_path), exist_ok=True)
+        tmp_path = self.memo_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._memo, f, indent=2)
+        os.replace(tmp_path, self.memo_path)
+
+    def _hash(self, path, kind, func):
+        path = os.path.abspath(path)
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        with path_lock:
+            st = os.stat(path)
+            with self._lock:
+                known = self._load().get(path)
+                if known and (known["size"], known["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+                    known = None
+                if known and kind in known:
+                    return known[kind]
+
+            if kind == "full":
+                print(f"Hashing checkpoint: {os.path.basename(path)}...")
+            start = time.perf_counter()
+            digest = func(path)
+            if kind == "full":
+                elapsed = time.perf_counter() - start
+                print(f"Hashed {st.st_size / 1024 ** 3:.2f} GB in {elapsed:.2f}s")
+
+            with self._lock:
+                memo = self._load()
+                entry = memo.get(path)
+                if not entry or (entry["size"], entry["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+                    entry = memo[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+                entry[kind] = digest
+                self._save()
+            return digest
+
+    def content_hash(self, path):
+        """전체 내용 tree hash (파일 버전당 한 번만 계산)"""
+        return self._hash(path, "full", tree_hash_file)
+
+    def quick_hash(self, path):
+        return self._hash(path, "quick", quick_hash_file)
+
+    def forget(self, path=None):
+        """path(없으면 전체)의 메모를 삭제해 다음 요청 때 다시 계산"""
+        with self._lock:
+            memo = self._load()
+            if path is None:
+                memo.clear()
+            else:
+                memo.pop(os.path.abspath(path), None)
+            self._save()
+
+
+_default_hash_memo = FileHashMemo()
+
+
+def content_hash(path):
+    """체크포인트 내용 해시 (병렬 tree hash, 메모됨)"""
+    return _default_hash_memo.content_hash(path)
+
+
+def quick_hash(path):
+    """체크포인트 변경 감지용 부분 해시 (메모됨)"""
+    return _default_hash_memo.quick_hash(path)
+
+
+# ---------------------------------------------------------
+# 변환된 모델 디스크 캐시
+# - from_single_file 의 키 변환/설정 추론 결과를 diffusers 폴더 형식으로 저장해 두고,
+#   다음 로드부터는 로컬 from_pretrained 로 바로 읽습니다.
+# - 키: 체크포인트 내용 해시 + mtime + diffusers 버전 + dtype
+# ---------------------------------------------------------
+DEFAULT_CONVERTED_CACHE_DIR = os.path.join(get_base_path(), "cache", "converted")
+DEFAULT_CONVERTED_CACHE_MAX_BYTES = 40 * 1024 ** 3
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ConvertedModelCache:
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root=DEFAULT_CONVERTED_CACHE_DIR, max_bytes=DEFAULT_CONVERTED_CACHE_MAX_BYTES, hash_memo=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hash_memo = hash_memo or _default_hash_memo
+        self._lock = threading.Lock()
+
+    # --- index 파일 관리 ---
+    def _index_path(self):
+        return os.path.join(self.root, self.INDEX_FILE)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("entries", {})
+        return index
+
+    def _write_index(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self._index_path())
+
+    # --- 키 계산 ---
+    def make_key(self, path, dtype_name, diffusers_version):
+        st = os.stat(path)
+        return f"{self.hash_memo.content_hash(path)[:16]}-{st.st_mtime_ns}-{diffusers_version}-{dtype_name}"
+
+    # --- 조회/저장 ---
+    def lookup(self, key):
+        """캐시된 diffusers 폴더 경로. 없으면 None"""
+        with self._lock:
+            index = self._read_index()
+            entry = index["entries"].get(key)
+            if entry is None:
+                return None
+            folder = os.path.join(self.root, key)
+            if not os.path.isdir(folder):
+                del index["entries"][key]
+                self._write_index(index)
+                return None
+            entry["last_used"] = time.time()
+            self._write_index(index)
+        return folder
+
+    def staging_dir(self, key):
+        """저장 중인 폴더 (완료 전에는 lookup 되지 않음)"""
+        folder = os.path.join(self.root, key + ".partial")
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def commit(self, key, staging_dir, source_path):
+        folder = os.path.join(self.root, key)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(staging_dir, folder)
+        with self._lock:
+            index = self._read_index()
+            index["entries"][key] = {
+                "source": os.path.abspath(source_path),
+                "size": _dir_size(folder),
+                "last_used": time.time(),
+            }
+            self._evict(index, keep=key)
+            self._write_index(index)
+        return folder
+
+    def _evict(self, index, keep=None):
+        entries = index["entries"]
+        total = sum(e["size"] for e in entries.values())
+        # 가장 오래 사용하지 않은 항목부터 제거
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            print(f"Evicting converted model cache entry: {key}")
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= entries.pop(key)["size"]
+
+    def invalidate(self, source_path=None):
+        """source_path 체크포인트의 캐시 항목(없으면 전체)을 삭제. 삭제한 항목 수 반환"""
+        target = os.path.abspath(source_path) if source_path else None
+        with self._lock:
+            index = self._read_index()
+            removed = [k for k, e in index["entries"].items() if target is None or e["source"] == target]
+            for key in removed:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                del index["entries"][key]
+            self._write_index(index)
+        self.hash_memo.forget(target)
+        return len(removed)
+
+    def entries(self):
+        with self._lock:
+            return dict(self._read_index()["entries"])
+
+
+# ---------------------------------------------------------
+# 컴포넌트 동시 로딩 지원
+# - 파일 읽기(I/O)는 여러 스레드에서 동시에 해도 되지만, 모듈 생성은 한 번에 하나씩 해야 합니다.
+#   transformers/accelerate 의 가중치 초기화 생략 컨텍스트(no_init_weights, init_empty_weights)가
+#   torch 함수를 전역으로 바꿔치기했다가 되돌리므로, 동시에 실행하면 복원 순서가 꼬입니다.
+# ---------------------------------------------------------
+MODULE_CONSTRUCT_LOCK = threading.Lock()
+WEIGHT_FILE_EXTENSIONS = (".safetensors", ".bin")
+
+
+def prefetch_folder(folder, chunk_size=16 * 1024 * 1024):
+    """folder 아래 가중치 파일을 순차로 읽어 페이지 캐시에 올림 (이후 로드는 메모리에서 읽음)"""
+    buffer = bytearray(chunk_size)
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.endswith(WEIGHT_FILE_EXTENSIONS):
+                continue
+            with open(os.path.join(root, name), "rb", buffering=0) as f:
+                while f.readinto(buffer):
+                    pass
+
+
+# ---------------------------------------------------------
+# 로컬 컴포넌트 저장소
+# - 체크포인트에 빠진 컴포넌트(텍스트 인코더, 토크나이저, VAE, 스케줄러)를 Hub 대신
+#   미리 받아 둔 폴더에서 읽습니다. 인터넷이 없는 환경에서도 동작해야 합니다.
+# - 구조: components/<family>/model_index.json, components/<family>/<component>/...
+#   (family 폴더는 diffusers 파이프라인 폴더와 같은 형식이라 from_single_file 의 config 로도 사용)
+# ---------------------------------------------------------
+DEFAULT_COMPONENT_STORE_DIR = os.path.join(get_base_path(), "components")
+
+# 컴포넌트 이름 -> (패키지, 클래스)
+STORE_COMPONENT_CLASSES = {
+    "text_encoder": ("transformers", "CLIPTextModel"),
+    "text_encoder_2": ("transformers", "CLIPTextModelWithProjection"),
+    "tokenizer": ("transformers", "CLIPTokenizer"),
+    "tokenizer_2": ("transformers", "CLIPTokenizer"),
+    "unet": ("diffusers", "UNet2DConditionModel"),
+    "vae": ("diffusers", "AutoencoderKL"),
+    "scheduler": ("diffusers", "EulerDiscreteScheduler"),
+}
+
+# stage 명령에서 사용할 기본 Hub 저장소
+FAMILY_HUB_REPOS = {
+    ARCH_SD1: "stable-diffusion-v1-5/stable-diffusion-v1-5",
+    ARCH_SDXL: "stabilityai/stable-diffusion-xl-base-1.0",
+}
+FAMILY_COMPONENTS = {
+    ARCH_SD1: ["text_encoder", "tokenizer", "vae", "scheduler"],
+    ARCH_SDXL: ["text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2", "vae", "scheduler"],
+}
+
+
+# single-file 체크포인트 안에서 각 가중치 컴포넌트가 들어 있는 위치 (토크나이저/스케줄러는 가중치가 없음)
+CHECKPOINT_COMPONENT_PREFIXES = {
+    ARCH_SD1: {"text_encoder": "cond_stage_model.", "vae": "first_stage_model."},
+    ARCH_SDXL: {"text_encoder": "conditioner.embedders.0.", "text_encoder_2": "conditioner.embedders.1.",
+                "vae": "first_stage_model."},
+}
+
+
+def missing_components(path, family):
+    """
+    family 컴포넌트 중 체크포인트에 들어 있지 않아 밖에서 가져와야 하는 것 (UNet 은 제외, 항상 체크포인트 것을 사용).
+    헤더를 읽을 수 없으면 모든 컴포넌트를 반환합니다.
+    """
+    names = FAMILY_COMPONENTS[family]
+    try:
+        shapes, _ = read_tensor_shapes(path)
+    except Exception:
+        shapes = None
+    if shapes is None:
+        return list(names)
+    prefixes = CHECKPOINT_COMPONENT_PREFIXES[family]
+    return [name for name in names
+            if name not in prefixes or not any(key.startswith(prefixes[name]) for key in shapes)]
+
+
+def component_class(name):
+    """저장소 컴포넌트 이름 -> 로드할 클래스"""
+    import importlib
+    package, class_name = STORE_COMPONENT_CLASSES[name]
+    return getattr(importlib.import_module(package), class_name)
+
+
+class LocalComponentStore:
+    def __init__(self, root=DEFAULT_COMPONENT_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        # 로드한 컴포넌트 재사용. 어떤 파이프라인도 쓰지 않게 되면 자동으로 해제
+        self._loaded = weakref.WeakValueDictionary()
+        self._scheduler_configs = {}
+
+    def family_dir(self, family):
+        return os.path.join(self.root, family)
+
+    def has_family(self, family):
+        """from_single_file 의 config 로 쓸 수 있는지 (model_index.json 존재 여부)"""
+        return os.path.isfile(os.path.join(self.family_dir(family), "model_index.json"))
+
+    def available(self, family):
+        """저장소에 있는 컴포넌트 이름 목록"""
+        folder = self.family_dir(family)
+        names = []
+        for name in STORE_COMPONENT_CLASSES:
+            sub = os.path.join(folder, name)
+            if not os.path.isdir(sub):
+                continue
+            files = os.listdir(sub)
+            if name.startswith("tokenizer"):
+                ok = "vocab.json" in files
+            elif name == "scheduler":
+                ok = "scheduler_config.json" in files
+            else:
+                # unet 은 config 만 있을 수 있음 (체크포인트 UNet 변환용)
+                ok = "config.json" in files and any(f.endswith((".safetensors", ".bin")) for f in files)
+            if ok:
+                names.append(name)
+        return names
+
+    def load(self, family, name, torch_dtype=None, prefetch=False):
+        """
+        컴포넌트 하나를 로컬 폴더에서 로드 (같은 family/name/dtype 은 재사용).
+        여러 스레드에서 동시에 호출할 수 있으며, prefetch=True 면 파일 읽기를 잠금 밖에서 먼저 합니다.
+        """
+        folder = os.path.join(self.family_dir(family), name)
+        cls = component_class(name)
+        if name == "scheduler":
+            # 스케줄러는 상태(timesteps)를 가지므로 설정만 재사용하고 매번 새로 생성
+            with self._lock:
+                config = self._scheduler_configs.get(family)
+            if config is None:
+                config = cls.load_config(folder)
+                with self._lock:
+                    self._scheduler_configs[family] = config
+            return cls.from_config(config)
+
+        key = (family, name, str(torch_dtype))
+        with self._lock:
+            component = self._loaded.get(key)
+        if component is not None:
+            return component
+
+        kwargs = {"local_files_only": True}
+        if name.startswith("tokenizer"):
+            component = cls.from_pretrained(folder, **kwargs)
+        else:
+            if prefetch:
+                prefetch_folder(folder)
+            if torch_dtype is not None:
+                kwargs["torch_dtype"] = torch_dtype
+            with MODULE_CONSTRUCT_LOCK:
+                component = cls.from_pretrained(folder, **kwargs)
+        with self._lock:
+            self._loaded[key] = component
+        return component
+
+    def stage_from_hub(self, family, repo_id=None, names=None):
+        """Hub 에서 컴포넌트를 받아 저장소에 저장 (인터넷 되는 환경에서 한 번 실행)"""
+        import torch
+        from huggingface_hub import hf_hub_download
+
+        repo_id = repo_id or FAMILY_HUB_REPOS[family]
+        names = names or FAMILY_COMPONENTS[family]
+        folder = self.family_dir(family)
+        os.makedirs(folder, exist_ok=True)
+
+        # 파이프라인 설정 (from_single_file 의 config 용). UNet 은 가중치 없이 설정만 저장
+        shutil.copyfile(hf_hub_download(repo_id, "model_index.json"), os.path.join(folder, "model_index.json"))
+        os.makedirs(os.path.join(folder, "unet"), exist_ok=True)
+        shutil.copyfile(hf_hub_download(repo_id, "unet/config.json"), os.path.join(folder, "unet", "config.json"))
+
+        for name in names:
+            print(f"Staging {name} from {repo_id}...")
+            cls = component_class(name)
+            target = os.path.join(folder, name)
+            if name == "scheduler":
+                cls.from_pretrained(repo_id, subfolder=name).save_pretrained(target)
+            elif name.startswith("tokenizer"):
+                cls.from_pretrained(repo_id, subfolder=name).save_pretrained(target)
+            else:
+                # fp16 으로 저장 (용량 절반). 로드 시 필요한 dtype 으로 변환됨
+                model = cls.from_pretrained(repo_id, subfolder=name, torch_dtype=torch.float16)
+                model.save_pretrained(target, safe_serialization=True)
+                del model
+        return folder
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PicGo checkpoint utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_list = sub.add_parser("cache-list", help="List converted model cache entries")
+    p_list.add_argument("--cache-dir", default=DEFAULT_CONVERTED_CACHE_DIR)
+
+    p_inv = sub.add_parser("invalidate", help="Delete converted model cache entries")
+    p_inv.add_argument("checkpoint", nargs="?", help="Checkpoint file (omit to clear the whole cache)")
+    p_inv.add_argument("--cache-dir", default=DEFAULT_CONVERTED_CACHE_DIR)
+
+    p_store = sub.add_parser("store-list", help="List components in the local component store")
+    p_store.add_argument("--store-dir", default=DEFAULT_COMPONENT_STORE_DIR)
+
+    p_stage = sub.add_parser("stage", help="Download components of a model family into the local component store")
+    p_stage.add_argument("family", choices=sorted(FAMILY_HUB_REPOS))
+    p_stage.add_argument("--repo", help="Hub repository to copy from")
+    p_stage.add_argument("--store-dir", default=DEFAULT_COMPONENT_STORE_DIR)
+
+    p_conv = sub.add_parser("convert", help="Convert a .ckpt checkpoint to .safetensors")
+    p_conv.add_argument("checkpoint")
+    p_conv.add_argument("--output", help="Output path (default: next to the checkpoint)")
+    p_conv.add_argument("--keep-ema", action="store_true", help="Keep EMA and training-only keys")
+    p_conv.add_argument("--fp16", action="store_true", help="Store float32 weights as float16")
+
+    args = parser.parse_args(argv)
+    if args.command == "cache-list":
+        cache = ConvertedModelCache(args.cache_dir)
+        for key, entry in sorted(cache.entries().items(), key=lambda kv: -kv[1]["last_used"]):
+            print(f"{key}  {entry['size'] / 1024 ** 3:6.2f} GB  {entry['source']}")
+    elif args.command == "invalidate":
+        removed = ConvertedModelCache(args.cache_dir).invalidate(args.checkpoint)
+        print(f"Removed {removed} cache entr{'y' if removed == 1 else 'ies'}.")
+    elif args.command == "convert":
+        convert_ckpt_to_safetensors(args.checkpoint, args.output, prune=not args.keep_ema, half=args.fp16)
+    elif args.command == "store-list":
+        store = LocalComponentStore(args.store_dir)
+        families = sorted(os.listdir(store.root)) if os.path.isdir(store.root) else []
+        for family in families:
+            if os.path.isdir(store.family_dir(family)):
+                config = "config" if store.has_family(family) else "no config"
+                print(f"{family} ({config}): {', '.join(store.available(family)) or '-'}")
+    elif args.command == "stage":
+        folder = LocalComponentStore(args.store_dir).stage_from_hub(args.family, args.repo)
+        print(f"Staged {args.family} components into {folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,148 +4,1998 @@ import os
 import sys
 import threading
 import time
+import contextlib
+import copy
+import functools
+import gc
+import importlib
+import importlib.util
+import inspect
+import json
+import math
+import platform
+import hashlib
+import weakref
+from collections import OrderedDict
 from PIL import Image, ImageTk
 
+from picgo_checkpoint import (
+    detect_architecture, load_state_dict_mmap, estimate_loaded_bytes, get_base_path, ConvertedModelCache,
+    LocalComponentStore, converted_sibling, convert_ckpt_to_safetensors, prefetch_folder, MODULE_CONSTRUCT_LOCK,
+    missing_components, component_class, FAMILY_HUB_REPOS,
+    ARCH_SD1, ARCH_SD2, ARCH_SDXL, ARCH_SDXL_REFINER, ARCH_LABELS,
+)
+from picgo_catalog import ModelCatalog
+
 # Dependency Check
-try:
-    import torch
-    from diffusers import AutoPipelineForText2Image, StableDiffusionPipeline, StableDiffusionXLPipeline
-    DEPENDENCIES_INSTALLED = True
-except ImportError as e:
-    DEPENDENCIES_INSTALLED = False
-    MISSING_LIB = str(e).split("'")[1] if "'" in str(e) else str(e)
+# - 설치 여부만 find_spec 으로 확인하고, torch/diffusers 실제 import 는 백그라운드 스레드에서 진행
+#   (import 가 수 초 걸려도 창은 바로 뜨도록)
+REQUIRED_LIBS = ("torch", "diffusers", "transformers")
+MISSING_LIB = next((name for name in REQUIRED_LIBS if importlib.util.find_spec(name) is None), None)
+DEPENDENCIES_INSTALLED = MISSING_LIB is None
+
+torch = None
+diffusers = None
+AutoPipelineForText2Image = None
+StableDiffusionPipeline = None
+StableDiffusionXLPipeline = None
+
+# 콜드 스타트 측정값 (모듈별 import 시간, 초)
+ML_IMPORT_TIMINGS = {}
+_ml_import_lock = threading.Lock()
+_ml_import_thread = None
+_ml_import_done = threading.Event()
+_ml_import_error = None
+
+
+def _import_ml_stack():
+    global torch, diffusers, AutoPipelineForText2Image, StableDiffusionPipeline, StableDiffusionXLPipeline
+    global _ml_import_error
+    start = time.perf_counter()
+    try:
+        import torch
+        ML_IMPORT_TIMINGS["torch"] = time.perf_counter() - start
+        import diffusers
+        from diffusers import AutoPipelineForText2Image, StableDiffusionPipeline, StableDiffusionXLPipeline
+        ML_IMPORT_TIMINGS["diffusers"] = time.perf_counter() - start - ML_IMPORT_TIMINGS["torch"]
+        ML_IMPORT_TIMINGS["total"] = time.perf_counter() - start
+        print(f"ML libraries imported in {ML_IMPORT_TIMINGS['total']:.2f}s")
+    except Exception as e:
+        _ml_import_error = e
+        print(f"Failed to import ML libraries: {e}")
+    finally:
+        _ml_import_done.set()
+
+
+def start_ml_import():
+    """torch/diffusers import 를 백그라운드로 시작 (이미 시작했으면 무시)"""
+    global _ml_import_thread
+    with _ml_import_lock:
+        if _ml_import_thread is None and DEPENDENCIES_INSTALLED:
+            _ml_import_thread = threading.Thread(target=_import_ml_stack, daemon=True)
+            _ml_import_thread.start()
+
+
+def ml_stack_ready():
+    return _ml_import_done.is_set() and _ml_import_error is None
+
+
+def ml_import_finished():
+    """import 가 (성공/실패와 관계없이) 끝났는지. GUI 스레드에서 기다리지 않고 확인할 때 사용"""
+    return _ml_import_done.is_set()
+
+
+def wait_for_ml_stack():
+    """torch/diffusers import 가 끝날 때까지 대기. 실패했으면 예외"""
+    if not DEPENDENCIES_INSTALLED:
+        raise ImportError(f"Required library is missing: {MISSING_LIB}")
+    start_ml_import()
+    _ml_import_done.wait()
+    if _ml_import_error is not None:
+        raise _ml_import_error
+
+# ---------------------------------------------------------
+# 로딩 진행 상황 / 취소
+# ---------------------------------------------------------
+class OperationCancelled(Exception):
+    """사용자가 작업을 취소함"""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """취소되었으면 OperationCancelled 발생"""
+        if self._event.is_set():
+            raise OperationCancelled("Operation cancelled.")
+
+
+class LoadProgress:
+    """
+    load_model 진행 이벤트를 콜백으로 전달하고 취소 여부를 확인합니다.
+    이벤트: {"phase", "bytes_read", "bytes_total", "components_done", "components_total", "fraction"}
+    """
+    # 전체 진행률에서 각 단계의 비중
+    PHASE_WEIGHTS = {"read": 0.45, "components": 0.4, "save": 0.1, "device": 0.05}
+
+    def __init__(self, callback=None, cancel_token=None):
+        self.callback = callback
+        self.cancel_token = cancel_token
+        self.phase = None
+        self.bytes_read = 0
+        self.bytes_total = 0
+        self.components_done = 0
+        self.components_total = 0
+        self._ranges = {}
+
+    def plan(self, phases):
+        """이번 로드에서 거칠 단계 순서 (진행률 구간 계산용)"""
+        total = sum(self.PHASE_WEIGHTS[p] for p in phases)
+        position = 0.0
+        self._ranges = {}
+        for phase in phases:
+            width = self.PHASE_WEIGHTS[phase] / total
+            self._ranges[phase] = (position, position + width)
+            position += width
+
+    def check(self):
+        if self.cancel_token is not None:
+            self.cancel_token.check()
+
+    def _fraction(self):
+        if self.phase == "done":
+            return 1.0
+        low, high = self._ranges.get(self.phase, (0.0, 0.0))
+        if self.phase == "components" and self.components_total:
+            inner = self.components_done / self.components_total
+        elif self.bytes_total:
+            inner = self.bytes_read / self.bytes_total
+        else:
+            inner = 0.0
+        return low + (high - low) * min(inner, 1.0)
+
+    def emit(self, phase, **counters):
+        self.phase = phase
+        for name, value in counters.items():
+            setattr(self, name, value)
+        if self.callback is None:
+            return
+        event = {
+            "phase": phase,
+            "bytes_read": self.bytes_read,
+            "bytes_total": self.bytes_total,
+            "components_done": self.components_done,
+            "components_total": self.components_total,
+            "fraction": self._fraction(),
+        }
+        try:
+            self.callback(event)
+        except Exception as e:
+            print(f"Progress callback failed: {e}")
+
+
+def prefault_file(path, progress, chunk_size=16 * 1024 * 1024):
+    """파일을 순차로 읽어 페이지 캐시에 올림 (바이트 단위 진행률, 청크마다 취소 확인)"""
+    total = os.path.getsize(path)
+    buffer = bytearray(chunk_size)
+    done = 0
+    progress.emit("read", bytes_read=0, bytes_total=total)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            progress.check()
+            n = f.readinto(buffer)
+            if not n:
+                break
+            done += n
+            progress.emit("read", bytes_read=done)
+
+# ---------------------------------------------------------
+# from_single_file 로딩 훅
+# - diffusers 0.29 의 파이프라인 from_single_file 은 state dict 를 직접 받지 않으므로,
+#   로드하는 동안만 체크포인트 읽기 함수를 mmap 버전으로 교체합니다.
+# - 컴포넌트 로드 함수도 감싸서 컴포넌트 사이마다 진행률 보고/취소 확인을 합니다.
+# ---------------------------------------------------------
+_single_file_patch_lock = threading.Lock()
+
+@contextlib.contextmanager
+def single_file_loading(path, use_mmap=True, progress=None):
+    """이 블록 안의 from_single_file(path) 호출은 가중치를 매핑된 페이지 위에 바로 구성"""
+    import diffusers.loaders.single_file as single_file_module
+    target = os.path.abspath(path)
+    original_checkpoint = single_file_module.load_single_file_checkpoint
+    original_sub_model = single_file_module.load_single_file_sub_model
+
+    def load_checkpoint(pretrained_model_link_or_path, **kwargs):
+        if use_mmap and os.path.abspath(pretrained_model_link_or_path) == target:
+            try:
+                return load_state_dict_mmap(target)
+            except Exception as e:
+                print(f"mmap loading failed, reading checkpoint normally: {e}")
+        return original_checkpoint(pretrained_model_link_or_path, **kwargs)
+
+    def load_sub_model(*args, **kwargs):
+        progress.check()
+        sub_model = original_sub_model(*args, **kwargs)
+        progress.emit("components", components_done=progress.components_done + 1)
+        progress.check()
+        return sub_model
+
+    with _single_file_patch_lock:
+        single_file_module.load_single_file_checkpoint = load_checkpoint
+        if progress is not None:
+            single_file_module.load_single_file_sub_model = load_sub_model
+        try:
+            yield
+        finally:
+            single_file_module.load_single_file_checkpoint = original_checkpoint
+            single_file_module.load_single_file_sub_model = original_sub_model
+
+# ---------------------------------------------------------
+# 메모리에 올라간 파이프라인 캐시 (LRU + 메모리 예산)
+# - 모델을 바꿔도 이전 파이프라인을 버리지 않고 보관해서, 다시 선택하면 즉시 전환됩니다.
+# ---------------------------------------------------------
+def pipeline_nbytes(pipe, seen=None):
+    """파이프라인 가중치(파라미터+버퍼)가 차지하는 바이트. 공유된 텐서는 한 번만 셈"""
+    seen = set() if seen is None else seen
+    total = 0
+    for component in pipe.components.values():
+        if not isinstance(component, torch.nn.Module):
+            continue
+        for tensor in list(component.parameters()) + list(component.buffers()) + _packed_tensors(component):
+            if tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _packed_tensors(module):
+    """int8 양자화 Linear 의 (파라미터가 아닌) 가중치/bias"""
+    tensors = []
+    for child in module.modules():
+        packed = getattr(child, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            tensors.extend(t for t in packed._weight_bias() if t is not None)
+    return tensors
+
+
+def default_memory_budget():
+    """기본 예산: 물리 메모리의 60% (psutil 이 없으면 개수 제한만 사용)"""
+    try:
+        import psutil
+        return int(psutil.virtual_memory().total * 0.6)
+    except ImportError:
+        return None
+
+
+class PipelineCache:
+    def __init__(self, max_models=2, max_bytes=None):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> {"pipe", "nbytes", "label"}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry["pipe"]
+
+    def put(self, key, pipe, label):
+        with self._lock:
+            self._entries[key] = {"pipe": pipe, "nbytes": pipeline_nbytes(pipe), "label": label}
+            self._entries.move_to_end(key)
+            self._evict(reserve=0, keep=key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+
+    def holds(self, pipe):
+        with self._lock:
+            return any(entry["pipe"] is pipe for entry in self._entries.values())
+
+    def make_room(self, nbytes):
+        """새 모델(nbytes)을 로드하기 전에 예산을 넘지 않도록 미리 비움"""
+        with self._lock:
+            self._evict(reserve=nbytes, reserve_slot=True)
+
+    def _total(self):
+        # 컴포넌트 풀로 공유된 모듈은 한 번만 계산
+        seen = set()
+        return sum(pipeline_nbytes(e["pipe"], seen) for e in self._entries.values())
+
+    def _evict(self, reserve=0, keep=None, reserve_slot=False):
+        evicted = False
+        max_models = self.max_models - (1 if reserve_slot else 0)
+        for key in list(self._entries):
+            over_count = len(self._entries) > max_models
+            over_bytes = self.max_bytes is not None and self._total() + reserve > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            if key == keep:
+                continue
+            print(f"Unloading cached model: {self._entries[key]['label']}")
+            del self._entries[key]
+            evicted = True
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def resident(self):
+        """메모리에 있는 모델 목록 [(key, label, nbytes)] (최근 사용 순)"""
+        with self._lock:
+            return [(key, e["label"], e["nbytes"]) for key, e in reversed(self._entries.items())]
+
+# ---------------------------------------------------------
+# 컴포넌트 풀
+# - 같은 계열 파인튜닝 모델은 VAE/텍스트 인코더가 바이트 단위로 같은 경우가 많으므로,
+#   텐서 내용으로 지문을 만들어 동일한 모듈은 파이프라인끼리 참조로 공유합니다.
+# ---------------------------------------------------------
+POOLED_COMPONENTS = ("vae", "text_encoder", "text_encoder_2")
+
+
+def _new_hasher():
+    try:
+        import xxhash
+        return xxhash.xxh3_128()
+    except ImportError:
+        return hashlib.blake2b(digest_size=16)
+
+
+def _hash_state_value(hasher, name, value):
+    # int8 양자화 모듈의 state_dict 에는 (가중치, bias) 튜플과 dtype 도 들어 있음
+    if isinstance(value, (tuple, list)):
+        for i, item in enumerate(value):
+            _hash_state_value(hasher, f"{name}.{i}", item)
+        return
+    if not isinstance(value, torch.Tensor):
+        hasher.update(f"{name}|{value!r}".encode())
+        return
+    tensor = value.detach()
+    hasher.update(f"{name}|{tensor.dtype}|{tuple(tensor.shape)}".encode())
+    if tensor.is_quantized:
+        if tensor.qscheme() in (torch.per_tensor_affine, torch.per_tensor_symmetric):
+            hasher.update(f"{tensor.q_scale()}|{tensor.q_zero_point()}".encode())
+        else:
+            _hash_state_value(hasher, f"{name}.scales", tensor.q_per_channel_scales())
+            _hash_state_value(hasher, f"{name}.zero_points", tensor.q_per_channel_zero_points())
+        tensor = tensor.int_repr()
+    data = tensor.cpu().contiguous().reshape(-1).view(torch.uint8)
+    hasher.update(data.numpy())
+
+
+def module_fingerprint(module):
+    """모듈 텐서 내용 기반 지문 (클래스, 텐서 이름/dtype/shape/바이트). 디바이스와는 무관"""
+    hasher = _new_hasher()
+    hasher.update(type(module).__name__.encode())
+    for name, value in module.state_dict().items():
+        _hash_state_value(hasher, name, value)
+    return hasher.hexdigest()
+
+
+def _module_device(module):
+    tensor = next(module.parameters(), None)
+    return None if tensor is None else tensor.device
+
+
+def module_nbytes(module):
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+
+
+class ComponentPool:
+    def __init__(self):
+        # 어떤 파이프라인도 참조하지 않게 되면 자동으로 풀에서 빠짐
+        self._modules = weakref.WeakValueDictionary()
+        # 모듈 -> 지문 (같은 모듈을 다시 해시하지 않도록)
+        self._fingerprints = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def fingerprint(self, module):
+        with self._lock:
+            fingerprint = self._fingerprints.get(module)
+        if fingerprint is None:
+            fingerprint = module_fingerprint(module)
+            with self._lock:
+                self._fingerprints[module] = fingerprint
+        return fingerprint
+
+    def share(self, pipe):
+        """pipe 의 컴포넌트를 풀의 동일 모듈로 교체. 절약한 바이트 수 반환"""
+        saved = 0
+        for name in POOLED_COMPONENTS:
+            module = getattr(pipe, name, None)
+            if not isinstance(module, torch.nn.Module):
+                continue
+            fingerprint = self.fingerprint(module)
+            with self._lock:
+                pooled = self._modules.get(fingerprint)
+                if pooled is None:
+                    self._modules[fingerprint] = module
+                    continue
+            # 다른 디바이스로 옮겨진 모듈은 공유하지 않음
+            if pooled is not module and _module_device(pooled) == _module_device(module):
+                saved += module_nbytes(module)
+                pipe.register_modules(**{name: pooled})
+                print(f"Sharing {name} with an already loaded model.")
+        return saved
+
+# ---------------------------------------------------------
+# 프롬프트 임베딩 캐시
+# - 같은 프롬프트/네거티브 프롬프트로 시드만 바꿔 생성할 때 텍스트 인코더를 다시 돌리지 않도록
+#   encode_prompt 결과(SDXL 의 pooled 임베딩 포함)를 LRU 로 보관합니다.
+# - disk_dir 를 지정하면 프로그램을 다시 켜도 재사용되도록 디스크에도 저장합니다.
+# ---------------------------------------------------------
+DEFAULT_EMBEDDING_CACHE_DIR = os.path.join(get_base_path(), "cache", "embeddings")
+# encode_prompt 반환값 순서 (SD 는 앞의 두 개만 반환)
+PROMPT_EMBED_FIELDS = ("prompt_embeds", "negative_prompt_embeds", "pooled_prompt_embeds", "negative_pooled_prompt_embeds")
+
+
+def tokenizer_signature(tokenizer):
+    """임베딩 결과에 영향을 주는 토크나이저 설정"""
+    return (f"{type(tokenizer).__name__}:{tokenizer.model_max_length}:{len(tokenizer)}:"
+            f"{tokenizer.pad_token}:{tokenizer.padding_side}")
+
+
+class PromptEmbeddingCache:
+    def __init__(self, max_entries=64, disk_dir=None, max_disk_entries=1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> {필드 이름: 텐서}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(identity, prompt, negative_prompt, clip_skip=None):
+        text = json.dumps([identity, prompt, negative_prompt, clip_skip], ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key, device=None):
+        with self._lock:
+            embeds = self._entries.get(key)
+            if embeds is not None:
+                self._entries.move_to_end(key)
+                return embeds
+        embeds = self._read_disk(key, device)
+        if embeds is not None:
+            self._remember(key, embeds)
+        return embeds
+
+    def put(self, key, embeds):
+        self._remember(key, embeds)
+        self._write_disk(key, embeds)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remember(self, key, embeds):
+        with self._lock:
+            self._entries[key] = embeds
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # --- 디스크 계층 ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".safetensors")
+
+    def _read_disk(self, key, device):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            from safetensors.torch import load_file
+            embeds = load_file(path, device=str(device) if device is not None else "cpu")
+        except Exception as e:
+            print(f"Ignoring unreadable embedding cache file {path}: {e}")
+            return None
+        os.utime(path)
+        return embeds
+
+    def _write_disk(self, key, embeds):
+        if not self.disk_dir:
+            return
+        try:
+            from safetensors.torch import save_file
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = self._disk_path(key) + ".tmp"
+            save_file({name: t.detach().contiguous().cpu() for name, t in embeds.items()}, tmp_path)
+            os.replace(tmp_path, self._disk_path(key))
+            self._trim_disk()
+        except Exception as e:
+            print(f"Could not write embedding cache: {e}")
+
+    def _trim_disk(self):
+        # 오래 사용하지 않은 파일부터 삭제 (읽을 때 mtime 갱신)
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(".safetensors")]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+# ---------------------------------------------------------
+# 이미지 생성 요청
+# ---------------------------------------------------------
+# 선택할 수 있는 스케줄러. "Default" 는 모델 기본값
+# - class: diffusers 클래스 이름, config: 모델 스케줄러 설정 위에 덮어쓸 값 (from_config 로 교체, 가중치는 그대로)
+# - steps: 권장 스텝 수 프리셋 (draft = 구도 확인용, standard = 일반, final = 최종 결과물)
+#   DPM++/UniPC 같은 다단계 솔버는 Euler 30 스텝과 비슷한 품질을 15~20 스텝에 냅니다.
+SCHEDULERS = {
+    "Default": {"class": None, "config": {}, "steps": {"draft": 15, "standard": 30, "final": 40}},
+    "Euler": {"class": "EulerDiscreteScheduler", "config": {"use_karras_sigmas": False},
+              "steps": {"draft": 15, "standard": 30, "final": 40}},
+    "Euler a": {"class": "EulerAncestralDiscreteScheduler", "config": {},
+                "steps": {"draft": 15, "standard": 30, "final": 40}},
+    "DPM++ 2M": {"class": "DPMSolverMultistepScheduler",
+                 "config": {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": False},
+                 "steps": {"draft": 10, "standard": 20, "final": 30}},
+    "DPM++ 2M Karras": {"class": "DPMSolverMultistepScheduler",
+                        "config": {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True},
+                        "steps": {"draft": 10, "standard": 18, "final": 25}},
+    # DPMSolverSDEScheduler 는 torchsde 가 필요하므로 같은 계열의 다단계 SDE 솔버 사용 (A1111 의 DPM++ 2M SDE Karras)
+    "DPM++ SDE": {"class": "DPMSolverMultistepScheduler",
+                  "config": {"algorithm_type": "sde-dpmsolver++", "solver_order": 2, "use_karras_sigmas": True},
+                  "steps": {"draft": 12, "standard": 20, "final": 30}},
+    "UniPC": {"class": "UniPCMultistepScheduler", "config": {},
+              "steps": {"draft": 8, "standard": 15, "final": 25}},
+    "DDIM": {"class": "DDIMScheduler", "config": {}, "steps": {"draft": 20, "standard": 40, "final": 50}},
+    # LCM 은 LCM 으로 학습(증류)된 모델/LoRA 와 함께 써야 합니다
+    "LCM": {"class": "LCMScheduler", "config": {}, "steps": {"draft": 4, "standard": 6, "final": 8}},
+    # SDXL-Turbo/SD-Turbo 처럼 적대적 증류(ADD)된 모델용
+    "Turbo": {"class": "EulerAncestralDiscreteScheduler", "config": {"timestep_spacing": "trailing"},
+              "steps": {"draft": 1, "standard": 2, "final": 4}},
+}
+STEP_PRESETS = ("draft", "standard", "final")
+DEFAULT_GUIDANCE_SCALE = 7.5
+
+
+def scheduler_steps(name, preset="standard"):
+    """스케줄러의 권장 스텝 수"""
+    if name not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler: {name}")
+    if preset not in STEP_PRESETS:
+        raise ValueError(f"Unknown step preset: {preset}")
+    return SCHEDULERS[name]["steps"][preset]
+
+
+class GenerationRequest:
+    """
+    이미지 생성 파라미터.
+    width/height 가 None 이면 모델 기본 해상도, seed 가 None 이면 무작위 시드를 하나 뽑습니다.
+    정수 seed 는 배치의 k 번째 이미지에 seed + k 를 사용하므로, 그 이미지는 seed + k 로 한 장만 생성한 것과 같습니다.
+    seed 에 리스트를 주면 이미지마다 그 시드를 사용합니다 (길이 = num_images_per_prompt).
+    clip_skip 은 텍스트 인코더의 마지막 레이어 몇 개를 건너뛸지 (None = 모델 기본값).
+    deep_cache_interval 이 N > 1 이면 UNet 깊은 블록을 N 스텝마다 한 번만 계산 (deep_cache 참고, 1 = 끔).
+    """
+    def __init__(self, prompt, negative_prompt="", width=None, height=None, steps=30, guidance_scale=DEFAULT_GUIDANCE_SCALE,
+                 seed=None, scheduler="Default", num_images_per_prompt=1, clip_skip=None, deep_cache_interval=1):
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.width = width
+        self.height = height
+        self.steps = steps
+        self.guidance_scale = guidance_scale
+        self.seed = seed
+        self.scheduler = scheduler
+        self.num_images_per_prompt = num_images_per_prompt
+        self.clip_skip = clip_skip
+        self.deep_cache_interval = deep_cache_interval
+
+    def validate(self):
+        for name in ("width", "height"):
+            value = getattr(self, name)
+            if value is not None and (value < 64 or value % 8):
+                raise ValueError(f"{name} must be a multiple of 8 and at least 64 (got {value}).")
+        if self.steps < 1:
+            raise ValueError("steps must be at least 1.")
+        if self.num_images_per_prompt < 1:
+            raise ValueError("num_images_per_prompt must be at least 1.")
+        if isinstance(self.seed, (list, tuple)) and len(self.seed) != self.num_images_per_prompt:
+            raise ValueError("Number of seeds must match num_images_per_prompt.")
+        if self.scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler: {self.scheduler}")
+        if self.clip_skip is not None and self.clip_skip < 0:
+            raise ValueError("clip_skip must be 0 or greater.")
+        if self.deep_cache_interval < 1:
+            raise ValueError("deep_cache_interval must be at least 1.")
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in REQUEST_FIELDS}
+
+    @classmethod
+    def from_record(cls, record):
+        """실행 기록에서 그 이미지 한 장을 다시 만드는 요청"""
+        params = dict(record["request"], seed=record["seed"], num_images_per_prompt=1)
+        return cls(**{name: params[name] for name in REQUEST_FIELDS if name in params})
+
+
+REQUEST_FIELDS = ("prompt", "negative_prompt", "width", "height", "steps", "guidance_scale", "seed", "scheduler",
+                  "num_images_per_prompt", "clip_skip", "deep_cache_interval")
+
+
+def expand_seeds(seed, count):
+    """요청 시드 -> 이미지별 시드 리스트 (None 이면 무작위 시작값)"""
+    if isinstance(seed, (list, tuple)):
+        return [int(s) for s in seed]
+    if seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+    return [(int(seed) + k) % 2 ** 32 for k in range(count)]
+
+# ---------------------------------------------------------
+# 단계별 미리보기
+# - VAE 디코드 대신 latent 4채널 -> RGB 선형 근사로 아주 싸게 저해상도(1/8) 미리보기를 만듭니다.
+# - 계수는 ComfyUI 의 latent_formats 값 (SD 1.x/2.x 공용, SDXL 별도)
+# ---------------------------------------------------------
+LATENT_RGB_FACTORS = {
+    "sd": ([[0.3512, 0.2297, 0.3227],
+            [0.3250, 0.4974, 0.2350],
+            [-0.2829, 0.1762, 0.2721],
+            [-0.2120, -0.2616, -0.7177]], None),
+    "sdxl": ([[0.3651, 0.4232, 0.4341],
+              [-0.2533, -0.0042, 0.1068],
+              [0.1076, 0.1111, -0.0362],
+              [-0.3165, -0.2492, -0.2188]], [0.1084, -0.0175, -0.0011]),
+}
+
+
+def latent_rgb_factors(pipe):
+    """파이프라인에 맞는 (계수, bias). 4채널 latent 가 아니면 None"""
+    if getattr(pipe.unet.config, "in_channels", None) not in (4, 9) or getattr(pipe.vae.config, "latent_channels", 4) != 4:
+        return None
+    return LATENT_RGB_FACTORS["sdxl" if "XL" in type(pipe).__name__ else "sd"]
+
+
+def latents_to_previews(latents, factors, bias=None):
+    """latents [B, 4, h, w] -> 이미지별 h x w 미리보기 PIL 이미지 리스트"""
+    weights = torch.tensor(factors, dtype=torch.float32)
+    rgb = torch.einsum("bchw,cr->bhwr", latents.detach().float().cpu(), weights)
+    if bias is not None:
+        rgb = rgb + torch.tensor(bias, dtype=torch.float32)
+    pixels = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8).numpy()
+    return [Image.fromarray(p) for p in pixels]
+
+# ---------------------------------------------------------
+# 실행 기록 (재현용)
+# - 생성한 이미지마다 모델 해시, 시드, 전체 파라미터, 스케줄러 설정, 라이브러리 버전을 남겨
+#   같은 이미지를 다시 만들 수 있게 합니다. 저장 시 PNG 텍스트와 옆의 .json 파일에 함께 기록됩니다.
+# ---------------------------------------------------------
+RUN_RECORD_KEY = "picgo_run"
+RUN_RECORD_VERSION = 1
+
+
+def library_versions():
+    versions = {"python": platform.python_version()}
+    for name in ("torch", "diffusers", "transformers", "safetensors"):
+        try:
+            versions[name] = importlib.import_module(name).__version__
+        except (ImportError, AttributeError):
+            versions[name] = None
+    return versions
+
+
+def read_run_record(path):
+    """이미지 옆의 .json, 없으면 PNG 텍스트에서 실행 기록을 읽음"""
+    record_path = path if path.lower().endswith(".json") else os.path.splitext(path)[0] + ".json"
+    if os.path.exists(record_path):
+        with open(record_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    with Image.open(path) as image:
+        text = image.info.get(RUN_RECORD_KEY)
+    if text is None:
+        raise ValueError(f"No run record found for {path}")
+    return json.loads(text)
+
+
+def save_image_with_record(image, path):
+    """이미지를 저장하고, 실행 기록이 있으면 PNG 텍스트와 path 옆 .json 에 함께 기록"""
+    text = image.info.get(RUN_RECORD_KEY)
+    if text is None:
+        image.save(path)
+        return
+    from PIL import PngImagePlugin
+    pnginfo = PngImagePlugin.PngInfo()
+    pnginfo.add_text(RUN_RECORD_KEY, text)
+    image.save(path, pnginfo=pnginfo)
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as f:
+        f.write(text)
+
+# ---------------------------------------------------------
+# 메모리 정책
+# - none: 최적화 없음 (가장 빠름, 기본값 - 결과와 속도가 정책 도입 전과 같음)
+# - balanced: VAE 슬라이싱(여러 장 디코드 시 한 장씩) + 타일링(큰 해상도), GPU 에 다 안 들어가면 컴포넌트 단위 offload
+# - minimal: 위에 더해 attention 을 head 단위로 나눠 계산하고, VAE 를 더 작은 타일로 디코드 (GPU 는 레이어 단위 offload)
+#   16 GB RAM CPU 에서 SDXL 1024x1024 를 생성할 수 있도록 최대 메모리를 줄이는 대신 느려집니다.
+# ---------------------------------------------------------
+MEMORY_POLICIES = {
+    "none": {"attention_slicing": None, "vae_slicing": False, "vae_tiling": False, "vae_tile_scale": 1},
+    "balanced": {"attention_slicing": None, "vae_slicing": True, "vae_tiling": True, "vae_tile_scale": 1},
+    "minimal": {"attention_slicing": "max", "vae_slicing": True, "vae_tiling": True, "vae_tile_scale": 0.5},
+}
+
+
+def set_vae_tile_scale(vae, scale):
+    """VAE 타일 크기를 기본값(config.sample_size)의 scale 배로 설정"""
+    sample_size = vae.config.sample_size
+    sample_size = sample_size[0] if isinstance(sample_size, (list, tuple)) else sample_size
+    vae.tile_sample_min_size = int(sample_size * scale)
+    vae.tile_latent_min_size = int(sample_size * scale / (2 ** (len(vae.config.block_out_channels) - 1)))
+
+# ---------------------------------------------------------
+# CPU 성능 모드
+# - 스레드 수를 물리 코어 기준으로 맞추고, UNet/VAE 를 channels_last 로 바꾸고,
+#   bfloat16 을 지원하는 CPU 에서는 디노이징(UNet forward)만 bfloat16 autocast 로 실행합니다.
+#   텍스트 인코딩과 VAE 디코딩은 bfloat16 에서 화질이 눈에 띄게 떨어지므로 원래 정밀도로 둡니다.
+# - 선택적으로 UNet 을 torch.compile 로 감싸고 로드 시 한 번 실행해 미리 컴파일합니다.
+# ---------------------------------------------------------
+_default_cpu_threads = None
+
+
+def physical_cpu_count():
+    try:
+        import psutil
+        count = psutil.cpu_count(logical=False)
+    except ImportError:
+        count = None
+    return count or os.cpu_count() or 1
+
+
+def configure_cpu_threads(enabled):
+    """
+    enabled: intra-op = 물리 코어 수, inter-op = 물리 코어 수 / 4.
+    False 면 처음 값으로 되돌림. 프로세스 전체 설정입니다. (intra, inter) 반환
+    """
+    global _default_cpu_threads
+    if _default_cpu_threads is None:
+        _default_cpu_threads = (torch.get_num_threads(), torch.get_num_interop_threads())
+    if enabled:
+        cores = physical_cpu_count()
+        intra, inter = cores, max(1, cores // 4)
+    else:
+        intra, inter = _default_cpu_threads
+    torch.set_num_threads(intra)
+    # inter-op 스레드 수는 병렬 작업이 한 번이라도 실행된 뒤에는 바꿀 수 없음
+    with contextlib.suppress(RuntimeError):
+        torch.set_num_interop_threads(inter)
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def cpu_supports_bf16():
+    """CPU 가 bfloat16 연산을 하드웨어로 지원하는지 (AVX512-BF16/AMX). 에뮬레이션만 되면 오히려 느려지므로 제외"""
+    try:
+        return bool(torch._C._cpu._is_avx512_bf16_supported() or torch._C._cpu._is_amx_tile_supported())
+    except AttributeError:
+        # 오래된 torch: oneDNN 판단 사용
+        try:
+            return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+        except (AttributeError, RuntimeError):
+            return False
+
+
+def is_compiled_module(module):
+    return hasattr(module, "_orig_mod")
+
+
+def _cast_unet_output(output, dtype):
+    if isinstance(output, tuple):
+        return tuple(t.to(dtype) if torch.is_tensor(t) else t for t in output)
+    if hasattr(output, "sample"):
+        output.sample = output.sample.to(dtype)
+    return output
+
+
+@contextlib.contextmanager
+def unet_autocast(unet, dtype):
+    """
+    with 블록 안에서 unet forward 만 autocast 로 실행하고, 출력은 입력 latent 의 dtype 으로 되돌립니다.
+    (스케줄러 계산과 VAE 디코딩은 원래 정밀도). 컴파일된 UNet 에도 훅이 바깥 모듈에 걸리므로 동작합니다.
+    """
+    active = []
+
+    def before_unet(module, args, kwargs):
+        sample = args[0] if args else kwargs.get("sample")
+        context = torch.autocast("cpu", dtype=dtype)
+        context.__enter__()
+        active.append((context, sample.dtype))
+
+    def after_unet(module, args, output):
+        context, sample_dtype = active.pop()
+        context.__exit__(None, None, None)
+        return _cast_unet_output(output, sample_dtype)
+
+    hooks = [unet.register_forward_pre_hook(before_unet, with_kwargs=True), unet.register_forward_hook(after_unet)]
+    try:
+        yield
+    finally:
+        for hook in hooks:
+            hook.remove()
+        # forward 가 예외로 끝나면 after_unet 이 불리지 않으므로 남은 autocast 를 닫음
+        while active:
+            active.pop()[0].__exit__(None, None, None)
+
+# ---------------------------------------------------------
+# UNet 특징 캐시 (DeepCache 방식)
+# - 인접한 스텝의 깊은 블록 출력은 거의 같으므로 interval 스텝마다 한 번만 UNet 전체를 계산하고,
+#   그 사이 스텝은 얕은 경로(conv_in, 첫 down 블록, 마지막 up 블록)만 계산하고 깊은 블록 출력은 캐시에서 재사용합니다.
+# - UNet.forward 는 그대로 두고 깊은 블록의 forward 만 바꾸므로 SD/SDXL, CFG, int8 모델에 모두 동작합니다.
+# ---------------------------------------------------------
+def _deep_blocks(unet):
+    """캐시할 블록: 첫 down 블록과 마지막 up 블록을 뺀 나머지 (mid 포함)"""
+    blocks = list(unet.down_blocks[1:]) + list(unet.up_blocks[:-1])
+    if unet.mid_block is not None:
+        blocks.append(unet.mid_block)
+    return blocks
+
+
+@contextlib.contextmanager
+def deep_cache(unet, interval):
+    """
+    with 블록 안에서 unet 호출 k 번째 (0 부터) 가 k % interval == 0 이면 전체 계산, 아니면 깊은 블록 출력 재사용.
+    파이프라인은 스텝마다 unet 을 한 번 부르므로 (CFG 는 배치로 묶음) 호출 횟수 = 스텝.
+    """
+    if interval <= 1:
+        yield
+        return
+    outputs = {}
+    state = {"calls": 0, "reuse": False}
+
+    def before_unet(module, args):
+        state["reuse"] = state["calls"] % interval != 0
+        state["calls"] += 1
+
+    def cached_forward(block, original):
+        def forward(*args, **kwargs):
+            if state["reuse"] and block in outputs:
+                return outputs[block]
+            outputs[block] = original(*args, **kwargs)
+            return outputs[block]
+        return forward
+
+    blocks = _deep_blocks(unet)
+    # offload 훅 등이 이미 인스턴스 forward 를 바꿔 두었을 수 있으므로 그대로 되돌릴 값을 보관
+    patched = [(block, block.__dict__.get("forward")) for block in blocks]
+    hook = unet.register_forward_pre_hook(before_unet)
+    for block in blocks:
+        block.forward = cached_forward(block, block.forward)
+    try:
+        yield
+    finally:
+        hook.remove()
+        for block, previous in patched:
+            if previous is None:
+                del block.forward
+            else:
+                block.forward = previous
+        outputs.clear()
+
+# ---------------------------------------------------------
+# int8 동적 양자화 (CPU)
+# - UNet/텍스트 인코더의 nn.Linear (attention q/k/v/out 포함) 가중치를 int8 로 바꿔 메모리를 약 1/4 로 줄이고
+#   CPU 행렬곱을 빠르게 합니다. 활성값은 실행 중에 동적으로 양자화됩니다.
+# - 양자화된 가중치는 cache/quantized/<모델 해시>/ 에 저장해 다음 로드 때 다시 계산하지 않습니다.
+# ---------------------------------------------------------
+QUANTIZED_COMPONENTS = ("unet", "text_encoder", "text_encoder_2")
+DEFAULT_QUANTIZED_CACHE_DIR = os.path.join(get_base_path(), "cache", "quantized")
+
+
+def int8_skeleton(module):
+    """module 의 nn.Linear 를 빈 int8 동적 양자화 Linear 로 바꿈 (캐시된 가중치를 읽어 넣을 틀, in-place)"""
+    from torch.ao.nn.quantized import dynamic as nnqd
+    for name, child in module.named_children():
+        if type(child) is torch.nn.Linear:
+            setattr(module, name, nnqd.Linear(child.in_features, child.out_features,
+                                              bias_=child.bias is not None, dtype=torch.qint8))
+        else:
+            int8_skeleton(child)
+    return module
+
+
+class QuantizedWeightCache:
+    def __init__(self, root=DEFAULT_QUANTIZED_CACHE_DIR):
+        self.root = root
+
+    def _path(self, key, name):
+        return os.path.join(self.root, key, f"{name}.pt")
+
+    def quantize(self, module, key=None, name=None):
+        """
+        module 의 int8 양자화 사본. key(모델 해시) 가 있으면 디스크 캐시를 사용합니다.
+        원본 module 은 다른 파이프라인과 공유 중일 수 있으므로 바꾸지 않습니다.
+        """
+        path = self._path(key, name) if key else None
+        if path and os.path.exists(path):
+            try:
+                state_dict = torch.load(path, map_location="cpu", weights_only=True)
+                quantized = int8_skeleton(copy.deepcopy(module))
+                quantized.load_state_dict(state_dict)
+                print(f"Loaded int8 {name} from cache.")
+                return quantized
+            except Exception as e:
+                print(f"Ignoring unreadable quantized cache {path}: {e}")
+        quantized = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                torch.save(quantized.state_dict(), path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Could not write quantized cache: {e}")
+        return quantized
+
+    def invalidate(self, key=None):
+        import shutil
+        shutil.rmtree(os.path.join(self.root, key) if key else self.root, ignore_errors=True)
+
+# ---------------------------------------------------------
+# Few-step 모드 (4~8 스텝 생성)
+# - lcm: adapters/<이름>/ 의 LCM-LoRA 를 UNet 에 합쳐(fuse) LCM 스케줄러로 실행. 끄면 LoRA 를 빼고 원래 스케줄러로 복원
+# - lcm-native / turbo: 이미 증류된 체크포인트 (LCM 병합 모델, SDXL-Turbo 등). LoRA 없이 스케줄러와 기본값만 바꿈
+# - 가중치는 로컬 폴더에서만 읽습니다 (Hub 에서 받은 pytorch_lora_weights.safetensors 를 폴더에 넣어 두기).
+# - guidance 가 1 이하면 CFG 를 끄므로 스텝당 UNet 실행이 절반이 됩니다.
+# ---------------------------------------------------------
+DEFAULT_ADAPTER_DIR = os.path.join(get_base_path(), "adapters")
+FEW_STEP_PROFILES = {
+    "lcm": {"scheduler": "LCM", "guidance_scale": 1.0,
+            "adapters": {ARCH_SD1: "lcm-lora-sdv1-5", ARCH_SDXL: "lcm-lora-sdxl"}},
+    "lcm-native": {"scheduler": "LCM", "guidance_scale": 1.0, "adapters": None},
+    "turbo": {"scheduler": "Turbo", "guidance_scale": 0.0, "adapters": None},
+}
+FEW_STEP_ADAPTER_NAME = "picgo_few_step"
+# LoRA 파일에서 UNet 에 해당하는 키 (diffusers / kohya 형식). 텍스트 인코더는 다른 모델과 공유될 수 있어 건드리지 않음
+UNET_LORA_PREFIXES = ("unet.", "lora_unet_")
+ADAPTER_WEIGHT_NAME = "pytorch_lora_weights.safetensors"
+
+
+def pipeline_family(pipe):
+    """LoRA 호환성 판단용 모델 계열 (sd1 / sd2 / sdxl / sdxl_refiner)"""
+    if getattr(pipe, "text_encoder_2", None) is not None:
+        return ARCH_SDXL if getattr(pipe, "text_encoder", None) is not None else ARCH_SDXL_REFINER
+    return ARCH_SD2 if pipe.text_encoder.config.hidden_size == 1024 else ARCH_SD1
+
+
+def find_adapter_file(path):
+    """LoRA 폴더(또는 파일) -> .safetensors 파일 경로. 없으면 None"""
+    if os.path.isfile(path):
+        return path
+    if not os.path.isdir(path):
+        return None
+    if os.path.isfile(os.path.join(path, ADAPTER_WEIGHT_NAME)):
+        return os.path.join(path, ADAPTER_WEIGHT_NAME)
+    files = sorted(name for name in os.listdir(path) if name.lower().endswith(".safetensors"))
+    return os.path.join(path, files[0]) if len(files) == 1 else None
+
+
+def unet_lora_state_dict(path):
+    """LoRA 파일의 UNet 가중치만 읽음"""
+    from safetensors.torch import load_file
+    state_dict = {key: value for key, value in load_file(path).items() if key.startswith(UNET_LORA_PREFIXES)}
+    if not state_dict:
+        raise ValueError(f"{os.path.basename(path)} has no UNet LoRA weights.")
+    return state_dict
+
+# ---------------------------------------------------------
+# 실행 백엔드
+# - pytorch: diffusers 파이프라인을 그대로 실행
+# - onnx: 텍스트 인코더/UNet/VAE 디코더를 ONNX 로 내보내 ONNX Runtime CPU 에서 실행 (picgo_onnx 참고)
+# ---------------------------------------------------------
+BACKENDS = ("pytorch", "onnx")
+
+
+def onnx_available():
+    # onnx 패키지는 2GB 가 넘는 그래프(SDXL UNet)를 내보낼 때만 필요
+    return importlib.util.find_spec("onnxruntime") is not None
 
 # ---------------------------------------------------------
 # 모델 로딩 및 생성 클래스 (Diffusers 기반)
 # ---------------------------------------------------------
+# from_single_file 이 체크포인트로부터 만드는 컴포넌트 (진행률 계산용)
+SINGLE_FILE_COMPONENTS = {
+    ARCH_SDXL: ("scheduler", "text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2", "unet", "vae"),
+    None: ("scheduler", "text_encoder", "tokenizer", "unet", "vae"),
+}
+
+
+def component_loader(component_class, folder, subfolder, torch_dtype=None, prefetch=True):
+    """folder/subfolder 컴포넌트를 로드하는 함수 (스레드 풀에서 실행 가능)"""
+    def load():
+        kwargs = {"local_files_only": True}
+        if not issubclass(component_class, torch.nn.Module):
+            return component_class.from_pretrained(folder, subfolder=subfolder, **kwargs)
+        # 파일 읽기는 다른 컴포넌트와 동시에, 모듈 생성은 하나씩
+        if prefetch:
+            prefetch_folder(os.path.join(folder, subfolder))
+        kwargs["torch_dtype"] = torch_dtype
+        with MODULE_CONSTRUCT_LOCK:
+            return component_class.from_pretrained(folder, subfolder=subfolder, **kwargs)
+    return load
+
+
+def run_component_loaders(loaders, workers, progress=None, on_loaded=None):
+    """
+    {이름: 로드 함수} 를 실행해 {이름: 컴포넌트} 반환. workers <= 1 이면 순서대로 로드.
+    on_loaded(name) 은 호출한 스레드에서 컴포넌트가 끝날 때마다 불립니다.
+    """
+    def run(name):
+        if progress is not None:
+            progress.check()
+        return loaders[name]()
+
+    results = {}
+    if workers <= 1:
+        for name in loaders:
+            results[name] = run(name)
+            if on_loaded:
+                on_loaded(name)
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(loaders)) or 1)
+    futures = {pool.submit(run, name): name for name in loaders}
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            if on_loaded:
+                on_loaded(name)
+    finally:
+        # 실패/취소 시 아직 시작하지 않은 로드는 건너뜀
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+def _folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
 class TextToImageModel:
     def __init__(self):
         self.pipe = None
         self.model_path = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        # None 이면 auto: 처음 필요할 때 torch 로 판단 (생성자에서 torch 를 기다리지 않도록)
+        self._device = None
         self.last_error = ""
+        # True: 체크포인트를 mmap 으로 열어 복사 없이 로드 (dtype 변환이 필요한 텐서만 복사)
+        self.mmap_loading = True
+        # single-file 체크포인트를 diffusers 형식으로 변환해 둔 디스크 캐시
+        # 모델마다 대상 dtype 전체 사본(fp16 SDXL 을 fp32 로 쓰면 원본의 약 2배)을 저장하므로 기본은 꺼 둠
+        self.converted_cache = ConvertedModelCache()
+        self.converted_cache_enabled = False
+        # 여러 모델을 메모리에 보관 (A/B 비교 시 재로딩 방지)
+        self.pipeline_cache = PipelineCache(max_models=2, max_bytes=default_memory_budget())
+        # 여러 모델 사이에서 동일한 VAE/텍스트 인코더 공유
+        self.component_pool = ComponentPool()
+        # 체크포인트에 없는 컴포넌트를 Hub 대신 읽어 올 로컬 저장소 (components/<family>)
+        self.component_store = LocalComponentStore()
+        # 동시에 두 모델을 로드하지 않도록 직렬화
+        self._load_lock = threading.Lock()
+        # True: 컴포넌트 파일을 스레드 풀에서 동시에 미리 읽음 (모듈 생성은 MODULE_CONSTRUCT_LOCK 으로 순서대로).
+        # RAM 이 적으면 False 로 미리 읽기 없이 순차 로드
+        self.parallel_component_loading = True
+        self.component_load_workers = 4
+        # 프롬프트 임베딩 캐시 (disk_dir=DEFAULT_EMBEDDING_CACHE_DIR 로 지정하면 디스크에도 저장)
+        self.prompt_cache = PromptEmbeddingCache(max_entries=64)
+        self.prompt_cache_enabled = True
+        # 단계 콜백에 미리보기를 넘기는 최소 간격 (초). 그 사이 단계는 미리보기 없이 진행률만 전달
+        self.preview_interval = 0.5
+        # CPU 성능 모드 (디바이스가 cpu 일 때만 적용). compile_unet 은 첫 로드가 느려지는 대신 생성이 빨라짐
+        self.cpu_performance = False
+        self.compile_unet = False
+        # True: CPU 에서 UNet/텍스트 인코더를 int8 동적 양자화로 실행 (모델을 다시 로드해야 적용)
+        self.quantize_int8 = False
+        self.quantized_cache = QuantizedWeightCache()
+        self._quantized_pipes = weakref.WeakSet()
+        # 메모리 정책: none / balanced / minimal (MEMORY_POLICIES 참고). 절약 모드는 사용자가 고를 때만
+        self.memory_policy = "none"
+        # 마지막으로 실행 설정을 적용한 (파이프라인 weakref, 설정). 바뀐 경우에만 다시 적용
+        self._applied_policy = (None, None)
+        # 파이프라인별로 마지막에 설정한 attention slice 값 (없으면 attention processor 를 건드린 적 없음)
+        self._attention_slices = weakref.WeakKeyDictionary()
+        # 실행 백엔드: pytorch / onnx (ONNX Runtime CPU, 처음 생성할 때 그래프를 모델 옆 <이름>.onnx/ 에 내보냄)
+        self.backend = "pytorch"
+        # ONNX Runtime 세션 설정 (threads=None 이면 ORT 기본값, graph_optimization: disable/basic/extended/all)
+        self.onnx_threads = None
+        self.onnx_inter_threads = 1
+        self.onnx_graph_optimization = "all"
+        self._onnx_runtime = None
+        # Few-step 모드: None / lcm / lcm-native / turbo (FEW_STEP_PROFILES). 다음 생성 시 파이프라인에 적용
+        self.few_step = None
+        self.adapter_dir = DEFAULT_ADAPTER_DIR
+        # 파이프라인 -> 적용한 few-step 상태 {"profile", "adapter", "scheduler": 원래 스케줄러}
+        self._few_step_state = weakref.WeakKeyDictionary()
 
-    def load_model(self, model_path_or_id):
+    @property
+    def device(self):
+        if self._device is None:
+            wait_for_ml_stack()
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+
+    @device.setter
+    def device(self, value):
+        self._device = value
+
+    def _component_workers(self):
+        return self.component_load_workers if self.parallel_component_loading else 1
+
+    def _torch_dtype(self):
+        return torch.float16 if self.device == "cuda" else torch.float32
+
+    def load_model(self, model_path_or_id, progress_callback=None, cancel_token=None):
+        """
+        모델을 로드합니다. progress_callback(event) 으로 단계별 진행 상황을 받고,
+        cancel_token.cancel() 로 컴포넌트 사이에서 로드를 중단할 수 있습니다.
+        """
+        try:
+            wait_for_ml_stack()
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+        progress = LoadProgress(progress_callback, cancel_token)
+        with self._load_lock:
+            cancelled = False
+            try:
+                return self._load_model(model_path_or_id, progress)
+            except OperationCancelled:
+                print("Model loading cancelled.")
+                self.last_error = "Cancelled"
+                cancelled = True
+            except Exception as e:
+                msg = f"Error loading model: {str(e)}"
+                print(msg)
+                self.last_error = str(e)
+            finally:
+                progress.emit("done")
+            if cancelled:
+                # 예외 트레이스백이 해제된 뒤 부분적으로 로드된 가중치 정리
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            return False
+
+    def _load_model(self, model_path_or_id, progress):
         print(f"Loading model from: {model_path_or_id} on {self.device}...")
         self.last_error = ""  # Clear previous errors
-        try:
-            # 로컬 파일(.safetensors/.ckpt)
-            if os.path.isfile(model_path_or_id):
-                # 1. SDXL 시도 (우선순위 높임: 1.5 파이프라인으로 잘못 로드되는 것 방지)
-                try:
-                    print("Attempting to load as SDXL Checkpoint...")
-                    self.pipe = StableDiffusionXLPipeline.from_single_file(
-                        model_path_or_id,
-                        torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                        use_safetensors=True
-                    )
-                except Exception as e_sdxl:
-                    print(f"SDXL load failed: {e_sdxl}")
-                    error_str = str(e_sdxl)
-                    
-                    # SDXL 컴포넌트 누락 시 복구 로직
-                    if any(x in error_str for x in ["CLIPTextModel", "UNet2DConditionModel", "AutoencoderKL", "tokenize", "scheduler"]):
-                        print("Missing components detected. Downloading standard SDXL components from HuggingFace...")
-                        try:
-                            from transformers import CLIPTextModel, CLIPTextModelWithProjection, CLIPTokenizer
-                            from diffusers import UNet2DConditionModel, AutoencoderKL, EulerDiscreteScheduler
-                            
-                            print("Loading standard SDXL components...")
-                            text_encoder = CLIPTextModel.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="text_encoder", torch_dtype=torch.float16 if self.device == "cuda" else torch.float32)
-                            text_encoder_2 = CLIPTextModelWithProjection.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="text_encoder_2", torch_dtype=torch.float16 if self.device == "cuda" else torch.float32)
-                            tokenizer = CLIPTokenizer.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="tokenizer")
-                            tokenizer_2 = CLIPTokenizer.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="tokenizer_2")
-                            unet = UNet2DConditionModel.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="unet", torch_dtype=torch.float16 if self.device == "cuda" else torch.float32)
-                            vae = AutoencoderKL.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="vae", torch_dtype=torch.float16 if self.device == "cuda" else torch.float32)
-                            scheduler = EulerDiscreteScheduler.from_pretrained("stabilityai/stable-diffusion-xl-base-1.0", subfolder="scheduler")
-
-                            self.pipe = StableDiffusionXLPipeline.from_single_file(
-                                model_path_or_id,
-                                text_encoder=text_encoder,
-                                text_encoder_2=text_encoder_2,
-                                tokenizer=tokenizer,
-                                tokenizer_2=tokenizer_2,
-                                unet=unet,
-                                vae=vae,
-                                scheduler=scheduler,
-                                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                                use_safetensors=True
-                            )
-                        except Exception as e_fallback:
-                            print(f"SDXL fallback failed: {e_fallback}")
-                            # 실패 시 무시하고 아래 SD1.5 시도로 넘어감
-                            pass
-                    else:
-                         print("Not a component error. Trying SD1.5...")
-                    
-                    # SDXL 실패 시 (파이프라인이 생성되지 않았으면) SD1.5 시도
-                    if not self.pipe:
-                        try:
-                            print("Attempting to load as SD1.5/2.1 Checkpoint...")
-                            self.pipe = StableDiffusionPipeline.from_single_file(
-                                model_path_or_id, 
-                                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                                use_safetensors=True
-                            )
-                        except Exception as e_sd:
-                             raise Exception(f"Failed to load as both SDXL and SD1.5.\nSDXL error: {e_sdxl}\nSD1.5 error: {e_sd}")
-
-            # HuggingFace Model ID
-            else:
-                self.pipe = AutoPipelineForText2Image.from_pretrained(
-                    model_path_or_id,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    use_safetensors=True
-                )
-            
-            self.pipe.to(self.device)
-            # Mac(MPS) 최적화
-            if self.device == "mps":
-                self.pipe.enable_attention_slicing()
-            
+
+        # .ckpt 를 변환해 둔 .safetensors 가 있으면 그쪽을 사용 (mmap/헤더 판별 가능)
+        sibling = converted_sibling(model_path_or_id)
+        if sibling:
+            print(f"Using converted checkpoint: {os.path.basename(sibling)}")
+            model_path_or_id = sibling
+
+        # 이미 메모리에 있는 모델이면 즉시 전환
+        cache_key = self._pipeline_cache_key(model_path_or_id)
+        pipe = self.pipeline_cache.get(cache_key)
+        if pipe is not None:
+            self._apply_pipeline_policies(pipe, force=True)
+            self.pipe = pipe
             self.model_path = model_path_or_id
-            print("Model loaded successfully.")
+            print("Model switched from memory cache.")
             return True
+
+        # 로컬 파일(.safetensors/.ckpt)
+        if os.path.isfile(model_path_or_id):
+            self.pipeline_cache.make_room(
+                estimate_loaded_bytes(model_path_or_id, self._torch_dtype().itemsize)
+            )
+            if self.pipe is not None and not self.pipeline_cache.holds(self.pipe):
+                # 캐시에서 내보낸 모델이 현재 모델이면 참조도 놓아야 실제로 메모리가 비워짐
+                # (그러지 않으면 로딩 중 최대 메모리 = 이전 모델 + 새 모델)
+                print("Unloading the current model to make room for the new one.")
+                self.pipe = None
+                self.model_path = None
+                self._onnx_runtime = None
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            pipe = self._load_converted(model_path_or_id, progress)
+            if pipe is None:
+                progress.plan(["read", "components", "save", "device"])
+                prefault_file(model_path_or_id, progress)
+                with single_file_loading(model_path_or_id, self.mmap_loading, progress):
+                    pipe = self._load_single_file(model_path_or_id, progress)
+                progress.emit("save")
+                self._save_converted(model_path_or_id, pipe)
+
+        # HuggingFace Model ID
+        else:
+            progress.plan(["components", "device"])
+            progress.emit("components")
+            pipe = AutoPipelineForText2Image.from_pretrained(
+                model_path_or_id,
+                torch_dtype=self._torch_dtype(),
+                use_safetensors=True
+            )
+
+        progress.check()
+        progress.emit("device")
+        if self._quantize_active():
+            self._quantize_pipeline(pipe, model_path_or_id)
+        self._apply_pipeline_policies(pipe, force=True)
+
+        saved = self.component_pool.share(pipe)
+        if saved:
+            print(f"Shared components saved {saved / 1024 ** 2:.0f} MB.")
+            gc.collect()
+            # 공유 모듈로 바뀐 컴포넌트에도 offload/슬라이싱 설정을 다시 적용
+            self._apply_pipeline_policies(pipe, force=True)
+
+        self.pipe = pipe
+        self.model_path = model_path_or_id
+        self.pipeline_cache.put(cache_key, pipe, os.path.basename(model_path_or_id))
+        print("Model loaded successfully.")
+        return True
+
+    def _pipeline_cache_key(self, model_path_or_id):
+        if os.path.isfile(model_path_or_id):
+            model_path_or_id = os.path.abspath(model_path_or_id)
+        return (model_path_or_id, str(self._torch_dtype()), "int8" if self._quantize_active() else "")
+
+    def _quantize_active(self):
+        # 양자화 커널은 CPU 전용
+        return self.quantize_int8 and self.device == "cpu"
+
+    def _quantize_pipeline(self, pipe, model_path_or_id):
+        """UNet/텍스트 인코더를 int8 양자화 모듈로 교체 (변환 캐시 저장 뒤, 디바이스 배치 전에 호출)"""
+        start = time.perf_counter()
+        # 캐시 키: 모델 파일 내용 해시 + torch 버전 (Hub 모델은 디스크 캐시 없이 매번 양자화)
+        key = None
+        if os.path.isfile(model_path_or_id):
+            digest = self.converted_cache.hash_memo.content_hash(model_path_or_id)
+            key = f"{digest[:32]}-torch{torch.__version__.split('+')[0]}"
+        before = pipeline_nbytes(pipe)
+        for name in QUANTIZED_COMPONENTS:
+            module = getattr(pipe, name, None)
+            if isinstance(module, torch.nn.Module):
+                pipe.register_modules(**{name: self.quantized_cache.quantize(module, key, name)})
+        self._quantized_pipes.add(pipe)
+        gc.collect()
+        print(f"Int8 quantization: {before / 1024 ** 2:.0f} MB -> {pipeline_nbytes(pipe) / 1024 ** 2:.0f} MB "
+              f"in {time.perf_counter() - start:.1f}s.")
+
+    def is_quantized(self, pipe=None):
+        pipe = pipe if pipe is not None else self.pipe
+        return pipe is not None and pipe in self._quantized_pipes
+
+    def resident_models(self):
+        """메모리에 있는 모델 [(경로/ID, 표시 이름, 바이트)]"""
+        return [(key[0], label, nbytes) for key, label, nbytes in self.pipeline_cache.resident()]
+
+    def _converted_cache_key(self, path):
+        dtype_name = str(self._torch_dtype()).replace("torch.", "")
+        return self.converted_cache.make_key(path, dtype_name, diffusers.__version__)
+
+    def _load_converted(self, path, progress):
+        """변환 캐시에 있으면 로컬 diffusers 폴더에서 바로 로드. 없으면 None"""
+        if not self.converted_cache_enabled:
+            return None
+        key = self._converted_cache_key(path)
+        folder = self.converted_cache.lookup(key)
+        if folder is None:
+            return None
+        print(f"Loading converted model from cache: {key}")
+        progress.plan(["components", "device"])
+        try:
+            return self._assemble_pipeline(folder, progress)
+        except OperationCancelled:
+            raise
         except Exception as e:
-            msg = f"Error loading model: {str(e)}"
-            print(msg)
-            self.last_error = str(e)
-            return False
+            print(f"Converted cache entry is unusable, converting again: {e}")
+            self.converted_cache.invalidate(path)
+            return None
+
+    def _assemble_pipeline(self, folder, progress):
+        """diffusers 폴더의 컴포넌트를 하나씩 로드해 파이프라인 구성 (컴포넌트 사이마다 취소 확인)"""
+        with open(os.path.join(folder, "model_index.json"), "r", encoding="utf-8") as f:
+            model_index = json.load(f)
+        pipeline_class = getattr(diffusers, model_index["_class_name"])
+        names = [name for name, value in model_index.items()
+                 if not name.startswith("_") and isinstance(value, list) and value[0] is not None]
+        sizes = {name: _folder_size(os.path.join(folder, name)) for name in names}
+        progress.emit("components", components_done=0, components_total=len(names),
+                      bytes_read=0, bytes_total=sum(sizes.values()))
+
+        # 큰 컴포넌트(UNet)부터 시작해야 다른 컴포넌트 읽기가 그 뒤에 숨음
+        loaders = {}
+        parallel = self.parallel_component_loading
+        for name in sorted(names, key=lambda n: -sizes[n]):
+            library, class_name = model_index[name]
+            component_class = getattr(importlib.import_module(library), class_name)
+            loaders[name] = component_loader(component_class, folder, name, self._torch_dtype(), prefetch=parallel)
+
+        def on_loaded(name):
+            progress.emit("components", components_done=progress.components_done + 1,
+                          bytes_read=progress.bytes_read + sizes[name])
+
+        components = run_component_loaders(loaders, self._component_workers(), progress, on_loaded)
+
+        # null 컴포넌트와 설정값(requires_safety_checker 등)은 그대로 전달
+        parameters = inspect.signature(pipeline_class.__init__).parameters
+        for name, value in model_index.items():
+            if name in parameters and name not in components:
+                components[name] = None if isinstance(value, list) else value
+        return pipeline_class(**components)
+
+    def _save_converted(self, path, pipe):
+        """변환 결과를 캐시에 저장 (실패해도 로딩은 계속)"""
+        if not self.converted_cache_enabled:
+            return
+        try:
+            key = self._converted_cache_key(path)
+            staging = self.converted_cache.staging_dir(key)
+            print(f"Saving converted model to cache: {key}")
+            pipe.save_pretrained(staging, safe_serialization=True)
+            self.converted_cache.commit(key, staging, path)
+        except Exception as e:
+            print(f"Failed to write converted model cache: {e}")
+
+    def _begin_components(self, progress, arch, passed=()):
+        names = set(SINGLE_FILE_COMPONENTS.get(arch, SINGLE_FILE_COMPONENTS[None])) - set(passed)
+        progress.emit("components", components_done=0, components_total=len(names))
+
+    def _load_single_file(self, path, progress):
+        """헤더로 구조를 먼저 판별한 뒤 맞는 파이프라인으로 바로 로드"""
+        info = detect_architecture(path)
+        if info is None:
+            # 헤더를 읽을 수 없는 파일(구형 .ckpt 등)은 기존 방식대로 순차 시도
+            print("Could not detect checkpoint architecture from header. Trying each pipeline...")
+            return self._load_single_file_by_trial(path, progress)
+
+        print(f"Detected architecture: {info['label']} ({info['prediction_type'] or 'prediction type from model config'})")
+        if info["arch"] == ARCH_SDXL_REFINER:
+            raise Exception("SDXL Refiner checkpoints only refine existing images and cannot be used for text-to-image.")
+        if info["inpainting"]:
+            raise Exception("Inpainting checkpoints are not supported for text-to-image generation.")
+
+        if info["arch"] == ARCH_SDXL:
+            pipe = self._load_sdxl_single_file(path, progress)
+        else:
+            self._begin_components(progress, info["arch"])
+            pipe = StableDiffusionPipeline.from_single_file(
+                path,
+                torch_dtype=self._torch_dtype(),
+                use_safetensors=True,
+                **self._store_config_kwargs(info["arch"])
+            )
+
+        # 파일에 prediction type 이 명시돼 있고 diffusers 가 추론한 값과 다를 때만 스케줄러 교체
+        if info["prediction_type"] and pipe.scheduler.config.get("prediction_type") != info["prediction_type"]:
+            print(f"Switching scheduler prediction type to {info['prediction_type']}")
+            pipe.scheduler = pipe.scheduler.__class__.from_config(
+                pipe.scheduler.config, prediction_type=info["prediction_type"]
+            )
+        return pipe
+
+    def _store_config_kwargs(self, family):
+        """로컬 저장소에 family 설정이 있으면 Hub 대신 그 폴더를 config 로 사용"""
+        if family in (ARCH_SD1, ARCH_SDXL) and self.component_store.has_family(family):
+            return {"config": self.component_store.family_dir(family)}
+        return {}
+
+    def _load_sdxl_single_file(self, path, progress):
+        try:
+            self._begin_components(progress, ARCH_SDXL)
+            return StableDiffusionXLPipeline.from_single_file(
+                path,
+                torch_dtype=self._torch_dtype(),
+                use_safetensors=True,
+                **self._store_config_kwargs(ARCH_SDXL)
+            )
+        except OperationCancelled:
+            raise
+        except Exception as e_sdxl:
+            print(f"SDXL load failed: {e_sdxl}")
+            error_str = str(e_sdxl)
+            
+            # SDXL 컴포넌트 누락 시 복구 로직
+            if not any(x in error_str for x in ["CLIPTextModel", "UNet2DConditionModel", "AutoencoderKL", "tokenize", "scheduler"]):
+                raise
+
+            dtype = self._torch_dtype()
+            workers = self._component_workers()
+            # 체크포인트에 없는 컴포넌트만 밖에서 가져옴 (UNet 과 들어 있는 가중치는 항상 체크포인트 것)
+            missing = missing_components(path, ARCH_SDXL)
+            # 1) 로컬 컴포넌트 저장소 (오프라인, 한 번 로드한 컴포넌트는 재사용)
+            in_store = set(self.component_store.available(ARCH_SDXL))
+            from_store = [n for n in missing if n in in_store]
+            from_hub = [n for n in missing if n not in in_store]
+            loaders = {n: functools.partial(self.component_store.load, ARCH_SDXL, n, dtype, workers > 1) for n in from_store}
+            if from_store:
+                print(f"Missing components detected. Using local component store: {', '.join(from_store)}")
+
+            # 2) 저장소에 없는 나머지는 Hub 에서 표준 SDXL 컴포넌트 다운로드 (체크포인트에 있는 컴포넌트는 설정만 받음)
+            folder = None
+            if from_hub:
+                print(f"Downloading standard SDXL components from HuggingFace: {', '.join(from_hub)}")
+                print("(Run 'python picgo_checkpoint.py stage sdxl' once to keep them locally.)")
+                folder = self._download_sdxl_components(from_hub)
+                for name in from_hub:
+                    loaders[name] = component_loader(component_class(name), folder, name, dtype, prefetch=workers > 1)
+
+            # 진행률: 여기서 가져올 컴포넌트 + from_single_file 이 체크포인트에서 만들 나머지 = 전체 컴포넌트 수
+            progress.emit("components", components_done=0, components_total=len(SINGLE_FILE_COMPONENTS[ARCH_SDXL]))
+            components = run_component_loaders(
+                loaders, workers, progress,
+                on_loaded=lambda name: progress.emit("components", components_done=progress.components_done + 1)
+            )
+            progress.check()
+            # 저장소에 설정(model_index.json)이 있으면 그것을, 없으면 방금 받은 Hub 설정을 사용
+            config_kwargs = self._store_config_kwargs(ARCH_SDXL) or ({"config": folder} if folder else {})
+            return StableDiffusionXLPipeline.from_single_file(
+                path,
+                torch_dtype=dtype,
+                use_safetensors=True,
+                **components,
+                **config_kwargs
+            )
+
+    def _download_sdxl_components(self, names):
+        """표준 SDXL 저장소에서 names 컴포넌트와 모든 설정 파일만 받아 로컬 폴더 경로 반환"""
+        from huggingface_hub import snapshot_download
+
+        # 필요한 파일만 한 번에 받음 (snapshot_download 가 파일들을 동시에 다운로드)
+        patterns = ["model_index.json", "*/config.json"]
+        for name in names:
+            patterns += [f"{name}/*.json", f"{name}/*.txt", f"{name}/model.safetensors",
+                         f"{name}/diffusion_pytorch_model.safetensors"]
+        return snapshot_download(FAMILY_HUB_REPOS[ARCH_SDXL], allow_patterns=patterns)
+
+    def _load_single_file_by_trial(self, path, progress):
+        # 1. SDXL 시도 (우선순위 높임: 1.5 파이프라인으로 잘못 로드되는 것 방지)
+        try:
+            print("Attempting to load as SDXL Checkpoint...")
+            return self._load_sdxl_single_file(path, progress)
+        except OperationCancelled:
+            raise
+        except Exception as e_sdxl:
+            # 에러는 _load_sdxl_single_file 에서 이미 출력됨
+            e_sdxl_msg = str(e_sdxl)
+
+        # SDXL 실패 시 SD1.5 시도
+        try:
+            print("Attempting to load as SD1.5/2.1 Checkpoint...")
+            self._begin_components(progress, None)
+            return StableDiffusionPipeline.from_single_file(
+                path, 
+                torch_dtype=self._torch_dtype(),
+                use_safetensors=True
+            )
+        except OperationCancelled:
+            raise
+        except Exception as e_sd:
+            raise Exception(f"Failed to load as both SDXL and SD1.5.\nSDXL error: {e_sdxl_msg}\nSD1.5 error: {e_sd}")
 
     def set_device(self, device_name):
+        """
+        디바이스 변경. 로드된 모델은 바로 옮기고 False 를 반환합니다.
+        int8 모델은 CPU 전용이라 옮길 수 없으므로 True 를 반환하며, 호출한 쪽이 load_model 로 다시 로드해야 합니다.
+        """
         if device_name == "auto":
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            self._device = None
         else:
-            self.device = device_name
-        
-        print(f"Device set to: {self.device}")
+            self._device = device_name
+
+        if self.pipe and self.is_quantized() and self.device != "cpu":
+            print(f"Device set to: {self.device} (the int8 model must be reloaded without quantization)")
+            return True
+        if self.pipe:
+            print(f"Device set to: {self.device}")
+            self._apply_pipeline_policies(self.pipe)
+        else:
+            print(f"Device set to: {device_name}")
+        return False
+
+    def set_cpu_performance(self, enabled, compile_unet=False):
+        """CPU 성능 모드 변경. 로드된 모델에는 바로 적용 (compile_unet 이면 여기서 컴파일까지 진행)"""
+        self.cpu_performance = enabled
+        self.compile_unet = compile_unet
         if self.pipe:
-            self.pipe.to(self.device)
+            self._apply_pipeline_policies(self.pipe)
+
+    def _cpu_performance_active(self):
+        return self.cpu_performance and self.device == "cpu"
+
+    def _autocast(self, pipe):
+        """디노이징 실행 컨텍스트: CPU 성능 모드이고 bfloat16 을 지원하면 UNet forward 만 bfloat16 autocast"""
+        # int8 양자화 Linear 는 float32 입력만 받으므로 autocast 를 쓰지 않음
+        if self._cpu_performance_active() and cpu_supports_bf16() and not self.is_quantized(pipe):
+            return unet_autocast(pipe.unet, torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def set_backend(self, backend):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        if backend == "onnx" and not onnx_available():
+            raise Exception("ONNX Runtime is not installed.\npip install onnx onnxruntime")
+        self.backend = backend
+        if backend == "onnx" and self.device != "cpu":
+            print("The ONNX backend runs on CPU only; PyTorch is used while the device is not CPU.")
+        if backend != "onnx":
+            # 세션이 들고 있는 가중치 해제
+            self._onnx_runtime = None
+            gc.collect()
+        print(f"Backend set to: {backend}")
+
+    def _onnx_active(self):
+        # ORT 는 CPUExecutionProvider 만 사용
+        return self.backend == "onnx" and self.device == "cpu"
+
+    def _execution_pipeline(self):
+        """
+        생성에 쓸 파이프라인: 기본은 self.pipe, ONNX 백엔드면 같은 모델의 OnnxDiffusionRuntime.
+        그래프가 없거나 모델 파일이 바뀌었으면 여기서 한 번 내보냅니다 (모델 크기에 따라 수 분).
+        """
+        self._sync_few_step(self.pipe)
+        if not self._onnx_active():
+            return self.pipe
+        from picgo_onnx import OnnxDiffusionRuntime, ensure_exported, onnx_folder_for
+
+        source_hash = self.model_hash()
+        adapter = self._few_step_state.get(self.pipe, {}).get("adapter")
+        if adapter:
+            # LoRA 를 합친 UNet 은 따로 내보냄 (<이름>.<모드>.onnx)
+            folder = onnx_folder_for(self.model_path, variant=self.few_step)
+            source_hash = f"{source_hash}+{self.converted_cache.hash_memo.content_hash(adapter)}"
+        else:
+            folder = onnx_folder_for(self.model_path)
+        settings = (self.onnx_threads, self.onnx_inter_threads, self.onnx_graph_optimization)
+        runtime = self._onnx_runtime
+        if (runtime is None or runtime.folder != folder or runtime.settings != settings
+                or runtime.manifest.get("source_hash") != source_hash):
+            if self.is_quantized():
+                raise Exception("The ONNX backend exports the float model. Turn off Int8 to use it.")
+            self._onnx_runtime = runtime = None
+            gc.collect()
+            self._apply_pipeline_policies(self.pipe)
+            ensure_exported(self.pipe, folder, source_hash)
+            runtime = self._onnx_runtime = OnnxDiffusionRuntime(folder, *settings)
+        # Default 스케줄러는 PyTorch 파이프라인과 같게 (few-step 모드의 스케줄러 교체 포함)
+        runtime.scheduler = self.pipe.scheduler
+        return runtime
+
+    def set_few_step(self, profile):
+        """few-step 모드 변경 (None 이면 끄고 LoRA/스케줄러를 원래대로). 로드된 모델에는 바로 적용"""
+        if profile is not None and profile not in FEW_STEP_PROFILES:
+            raise ValueError(f"Unknown few-step mode: {profile}")
+        self.few_step = profile
+        if self.pipe:
+            self._sync_few_step(self.pipe)
+
+    def few_step_adapter(self, pipe=None):
+        """현재 few-step 모드에서 pipe 에 합칠 LoRA 파일 (LoRA 를 쓰지 않는 모드면 None). 파일이 없으면 예외"""
+        pipe = pipe if pipe is not None else self.pipe
+        profile = FEW_STEP_PROFILES.get(self.few_step)
+        if profile is None or profile["adapters"] is None:
+            return None
+        family = pipeline_family(pipe)
+        name = profile["adapters"].get(family)
+        if name is None:
+            raise Exception(f"No {self.few_step} LoRA is available for {ARCH_LABELS.get(family, family)} models.")
+        folder = os.path.join(self.adapter_dir, name)
+        path = find_adapter_file(folder)
+        if path is None:
+            raise Exception(f"LCM LoRA not found.\nPut {ADAPTER_WEIGHT_NAME} from latent-consistency/{name} into {folder}")
+        return path
+
+    def request_defaults(self, scheduler="Default", preset="standard"):
+        """현재 모드의 기본 생성 설정 {scheduler, steps, guidance_scale}. few-step 모드면 그 스케줄러의 스텝과 guidance"""
+        profile = FEW_STEP_PROFILES.get(self.few_step)
+        if profile is not None and scheduler == "Default":
+            return {"scheduler": scheduler, "steps": scheduler_steps(profile["scheduler"], preset),
+                    "guidance_scale": profile["guidance_scale"]}
+        return {"scheduler": scheduler, "steps": scheduler_steps(scheduler, preset), "guidance_scale": DEFAULT_GUIDANCE_SCALE}
+
+    def _sync_few_step(self, pipe):
+        """pipe 의 few-step 상태를 현재 설정에 맞춤 (LoRA 합치기/되돌리기, 스케줄러 교체)"""
+        wanted = (self.few_step, self.few_step_adapter(pipe)) if self.few_step else None
+        state = self._few_step_state.get(pipe)
+        if wanted == ((state["profile"], state["adapter"]) if state else None):
+            return
+        if state:
+            self._detach_few_step(pipe, state)
+        if wanted:
+            self._attach_few_step(pipe, *wanted)
+        # 컴파일/offload 설정을 바뀐 UNet 에 다시 적용
+        self._apply_pipeline_policies(pipe, force=True)
+
+    def _attach_few_step(self, pipe, profile, adapter):
+        start = time.perf_counter()
+        if adapter is not None:
+            if self.is_quantized(pipe):
+                raise Exception("A LoRA cannot be fused into an int8 model. Turn off Int8 or use a distilled checkpoint.")
+            if importlib.util.find_spec("peft") is None:
+                raise Exception("Loading a LoRA needs peft.\npip install peft")
+            if is_compiled_module(pipe.unet):
+                pipe.unet = pipe.unet._orig_mod
+            pipe.load_lora_weights(unet_lora_state_dict(adapter), adapter_name=FEW_STEP_ADAPTER_NAME)
+            # 가중치에 합쳐 스텝마다 LoRA 연산을 따로 하지 않음
+            pipe.fuse_lora(fuse_text_encoder=False, adapter_names=[FEW_STEP_ADAPTER_NAME])
+        spec = SCHEDULERS[FEW_STEP_PROFILES[profile]["scheduler"]]
+        self._few_step_state[pipe] = {"profile": profile, "adapter": adapter, "scheduler": pipe.scheduler}
+        pipe.scheduler = getattr(diffusers, spec["class"]).from_config(pipe.scheduler.config, **spec["config"])
+        source = os.path.basename(adapter) if adapter else "distilled checkpoint"
+        print(f"Few-step mode {profile} on ({source}) in {time.perf_counter() - start:.1f}s.")
+
+    def _detach_few_step(self, pipe, state):
+        if state["adapter"] is not None:
+            if is_compiled_module(pipe.unet):
+                pipe.unet = pipe.unet._orig_mod
+            pipe.unfuse_lora(unfuse_text_encoder=False)
+            pipe.unload_lora_weights()
+        pipe.scheduler = state["scheduler"]
+        del self._few_step_state[pipe]
+        print(f"Few-step mode {state['profile']} off.")
+
+    def set_memory_policy(self, policy):
+        if policy not in MEMORY_POLICIES:
+            raise ValueError(f"Unknown memory policy: {policy}")
+        self.memory_policy = policy
+        if self.pipe:
+            self._apply_pipeline_policies(self.pipe)
+
+    def _offload_mode(self, pipe):
+        """GPU 에서 쓸 offload 방식: None / "model" / "sequential" """
+        if self.device != "cuda" or self.memory_policy == "none":
+            return None
+        if self.memory_policy == "minimal":
+            return "sequential"
+        # balanced: 모델이 VRAM 에 여유 있게 들어가지 않을 때만 컴포넌트 단위 offload
+        vram = torch.cuda.get_device_properties(0).total_memory
+        return "model" if pipeline_nbytes(pipe) > vram * 0.8 else None
+
+    def _apply_pipeline_policies(self, pipe, force=False):
+        """
+        디바이스/설정에 맞는 실행 옵션을 pipe 에 적용합니다 (로드, 메모리 캐시 전환, set_device, 생성 직전).
+        1) 디바이스 배치 (offload 또는 .to), 2) 메모리 정책 (attention/VAE 슬라이싱, VAE 타일링), 3) CPU 성능 모드.
+        직전에 같은 파이프라인에 같은 설정을 적용했다면 force 가 아닌 한 아무것도 하지 않습니다.
+        """
+        perf = self._cpu_performance_active()
+        offload = self._offload_mode(pipe)
+        compile_unet = perf and self.compile_unet and not self.is_quantized(pipe)
+        state = (self.device, self.memory_policy, offload, perf, compile_unet)
+        applied_ref, applied_state = self._applied_policy
+        if not force and applied_ref is not None and applied_ref() is pipe and applied_state == state:
+            return
+
+        # 1) 배치: 이전 offload 훅을 지운 뒤 다시 배치
+        if any(hasattr(module, "_hf_hook") for module in pipe.components.values()):
+            pipe.remove_all_hooks()
+        if offload == "sequential":
+            pipe.enable_sequential_cpu_offload(device=self.device)
+        elif offload == "model":
+            pipe.enable_model_cpu_offload(device=self.device)
+        else:
+            pipe.to(self.device)
+        if offload:
+            print(f"Memory policy {self.memory_policy}: {offload} CPU offload enabled.")
+
+        # 2) 메모리 정책 (VAE 는 다른 모델과 공유 중일 수 있지만 전환 시 다시 적용됨)
+        settings = MEMORY_POLICIES[self.memory_policy]
+        attention_slice = settings["attention_slicing"] or ("auto" if self.device == "mps" else None)
+        # set_attention_slice 는 attention processor 를 새로 만들므로 값이 바뀔 때만 호출
+        if self._attention_slices.get(pipe) != attention_slice:
+            pipe.set_attention_slice(attention_slice)
+            self._attention_slices[pipe] = attention_slice
+        vae = getattr(pipe, "vae", None)
+        if vae is not None and hasattr(vae, "enable_tiling"):
+            if settings["vae_slicing"]:
+                vae.enable_slicing()
+            else:
+                vae.disable_slicing()
+            if settings["vae_tiling"]:
+                vae.enable_tiling()
+            else:
+                vae.disable_tiling()
+            set_vae_tile_scale(vae, settings["vae_tile_scale"])
+
+        # 3) CPU 성능 모드
+        if self.device == "cpu":
+            intra, inter = configure_cpu_threads(perf)
+            if perf:
+                print(f"CPU performance mode: {intra} threads ({inter} inter-op), "
+                      f"bfloat16 autocast {'on' if cpu_supports_bf16() and not self.is_quantized(pipe) else 'off'}.")
+
+        # channels_last: 합성곱이 많은 UNet/VAE 에서 oneDNN 이 더 빠른 커널 사용
+        # (VAE 가 다른 모델과 공유 중이면 그쪽도 같이 바뀌지만 결과에는 영향 없음)
+        memory_format = torch.channels_last if perf else torch.contiguous_format
+        for name in ("unet", "vae"):
+            module = getattr(pipe, name, None)
+            if isinstance(module, torch.nn.Module):
+                module.to(memory_format=memory_format)
+
+        if state[-1] and not is_compiled_module(pipe.unet):
+            pipe.unet = torch.compile(pipe.unet)
+            if not self._warmup_compiled(pipe):
+                pipe.unet = pipe.unet._orig_mod
+                self.compile_unet = False
+                state = state[:-1] + (False,)
+        elif not state[-1] and is_compiled_module(pipe.unet):
+            pipe.unet = pipe.unet._orig_mod
+        self._applied_policy = (weakref.ref(pipe), state)
+
+    def _warmup_compiled(self, pipe):
+        """컴파일된 UNet 을 기본 해상도로 한 번 실행해 컴파일을 미리 끝냄. 실패하면 False"""
+        print("Compiling UNet (one-time warm-up)...")
+        start = time.perf_counter()
+        try:
+            with self._autocast(pipe):
+                pipe(prompt="", num_inference_steps=1, output_type="latent")
+        except Exception as e:
+            print(f"torch.compile is not available here, using the regular UNet: {e}")
+            return False
+        print(f"UNet compiled in {time.perf_counter() - start:.1f}s.")
+        return True
+
+    def generate_image(self, prompt, negative_prompt="", step_callback=None, cancel_token=None,
+                       scheduler="Default", preset="standard"):
+        """이미지 한 장 생성. 스텝 수/guidance 는 request_defaults (scheduler 의 preset 권장값, few-step 모드 반영)"""
+        request = GenerationRequest(prompt, negative_prompt, **self.request_defaults(scheduler, preset))
+        return self.generate_images(request, step_callback=step_callback, cancel_token=cancel_token)[0]
+
+    def _make_step_callback(self, pipe, step_callback, cancel_token=None):
+        """
+        diffusers callback_on_step_end 로 쓸 함수.
+        step_callback(step, total_steps, previews) 를 매 단계 호출하며, previews 는 preview_interval 마다
+        이미지별 미리보기 리스트 (그 외 단계와 마지막 단계는 None).
+        cancel_token 이 취소되면 다음 단계 경계에서 OperationCancelled 를 발생시킵니다 (VAE 디코드도 건너뜀).
+        """
+        if step_callback is None and cancel_token is None:
+            return None
+        factors = latent_rgb_factors(pipe) if step_callback is not None else None
+        last_preview = [0.0]
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            if cancel_token is not None:
+                cancel_token.check()
+            if step_callback is None:
+                return callback_kwargs
+            total = pipe.num_timesteps
+            previews = None
+            now = time.perf_counter()
+            if factors is not None and step + 1 < total and now - last_preview[0] >= self.preview_interval:
+                last_preview[0] = now
+                latents = callback_kwargs["latents"]
+                with contextlib.suppress(Exception):
+                    # Euler 계열은 latents 가 sigma 배로 커져 있으므로 모델 입력 스케일로 맞춤 (다른 스케줄러는 그대로)
+                    latents = pipe.scheduler.scale_model_input(latents, timestep)
+                previews = latents_to_previews(latents, *factors)
+            step_callback(step + 1, total, previews)
+            return callback_kwargs
+        return on_step_end
+
+    def _make_generators(self, seeds):
+        # 이미지마다 생성기 하나 (배치 크기와 무관하게 같은 시드 = 같은 결과)
+        # CPU 생성기를 쓰면 디바이스와 관계없이 같은 시드 = 같은 초기 노이즈
+        return [torch.Generator("cpu").manual_seed(seed) for seed in seeds]
 
-    def generate_image(self, prompt, negative_prompt=""):
+    def model_hash(self):
+        """현재 모델 파일의 내용 해시 (Hub ID/폴더면 None). 해시 메모에 저장되므로 두 번째부터는 즉시 반환"""
+        if self.model_path and os.path.isfile(self.model_path):
+            return self.converted_cache.hash_memo.content_hash(self.model_path)
+        return None
+
+    def _run_record(self, request, seeds, scheduler, deep_cache_interval=1):
+        base = {
+            "version": RUN_RECORD_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "model": {"path": self.model_path, "hash": self.model_hash(), "pipeline": type(self.pipe).__name__},
+            "request": request.to_dict(),
+            "scheduler": {"name": request.scheduler, "class": type(scheduler).__name__, "config": dict(scheduler.config)},
+            "device": str(self.device),
+            "dtype": str(self.pipe.dtype),
+            "cpu_performance": self._cpu_performance_active(),
+            "autocast": ("bfloat16" if self._cpu_performance_active() and cpu_supports_bf16() and not self.is_quantized()
+                         and not self._onnx_active() else None),
+            "int8": self.is_quantized(),
+            "backend": "onnx" if self._onnx_active() else "pytorch",
+            "few_step": self._few_step_record(),
+            # 실제로 적용한 값 (ONNX 백엔드/컴파일된 UNet 에서는 1)
+            "deep_cache_interval": deep_cache_interval,
+            "libraries": library_versions(),
+        }
+        return [dict(base, seed=seed, batch_index=k) for k, seed in enumerate(seeds)]
+
+    def _deep_cache_interval(self, pipe, request):
+        """이번 생성에 적용할 DeepCache 간격 (적용할 수 없으면 1)"""
+        interval = request.deep_cache_interval
+        if interval > 1 and pipe is not self.pipe:
+            print("Deep cache is not available with the ONNX backend; running the full UNet.")
+            return 1
+        if interval > 1 and is_compiled_module(pipe.unet):
+            print("Deep cache is not used with a compiled UNet; running the full UNet.")
+            return 1
+        return interval
+
+    def _few_step_record(self):
+        state = self._few_step_state.get(self.pipe)
+        if state is None:
+            return None
+        adapter = state["adapter"]
+        return {"profile": state["profile"], "adapter": adapter,
+                "adapter_hash": self.converted_cache.hash_memo.content_hash(adapter) if adapter else None}
+
+    def _make_scheduler(self, name):
+        """요청한 스케줄러 (모델 기본 스케줄러 설정을 바탕으로 생성). Default 면 None"""
+        spec = SCHEDULERS[name]
+        if spec["class"] is None:
+            return None
+        return getattr(diffusers, spec["class"]).from_config(self.pipe.scheduler.config, **spec["config"])
+
+    def _prompt_identity(self, pipe):
+        """임베딩 캐시 키의 모델 부분: 파이프라인 종류, 디바이스, 텍스트 인코더 지문, 토크나이저 설정"""
+        identity = getattr(pipe, "embedding_identity", None)
+        if identity is not None:
+            # ONNX 런타임: 내보낸 모델 해시
+            return identity
+        parts = [type(pipe).__name__, str(pipe._execution_device), str(pipe.config.get("force_zeros_for_empty_prompt"))]
+        for name in ("text_encoder", "text_encoder_2"):
+            module = getattr(pipe, name, None)
+            parts.append(self.component_pool.fingerprint(module) if module is not None else "-")
+        for name in ("tokenizer", "tokenizer_2"):
+            tokenizer = getattr(pipe, name, None)
+            parts.append(tokenizer_signature(tokenizer) if tokenizer is not None else "-")
+        return "|".join(parts)
+
+    def _prompt_embeddings(self, pipe, request):
+        """
+        요청 프롬프트의 pipe 임베딩 {prompt_embeds, negative_prompt_embeds, (pooled...)}.
+        캐시를 쓸 수 없는 파이프라인이면 None (파이프라인이 직접 인코딩)
+        """
+        if not self.prompt_cache_enabled or not hasattr(pipe, "encode_prompt"):
+            return None
+        device = pipe._execution_device
+        key = self.prompt_cache.make_key(self._prompt_identity(pipe), request.prompt, request.negative_prompt,
+                                         request.clip_skip)
+        embeds = self.prompt_cache.get(key, device)
+        if embeds is not None:
+            return embeds
+        # 이미지 1장 기준으로 저장. 배치 복제는 파이프라인이 num_images_per_prompt 로 처리
+        with torch.no_grad():
+            outputs = pipe.encode_prompt(
+                prompt=request.prompt,
+                device=device,
+                num_images_per_prompt=1,
+                do_classifier_free_guidance=True,
+                negative_prompt=request.negative_prompt,
+                clip_skip=request.clip_skip,
+            )
+        embeds = {name: tensor for name, tensor in zip(PROMPT_EMBED_FIELDS, outputs) if tensor is not None}
+        self.prompt_cache.put(key, embeds)
+        return embeds
+
+    def replay(self, record):
+        """실행 기록의 이미지를 다시 생성 (모델이 다르면 기록된 모델을 먼저 로드)"""
+        path = record["model"]["path"]
+        if path != self.model_path:
+            if not self.load_model(path):
+                raise Exception(f"Failed to load {path}: {self.last_error}")
+        expected = record["model"].get("hash")
+        if expected and self.model_hash() != expected:
+            print(f"Warning: {path} has changed since the image was generated; the result may differ.")
+        few_step = (record.get("few_step") or {}).get("profile")
+        if few_step != self.few_step:
+            print(f"Warning: the image was generated with few-step mode {few_step or 'off'}; the result may differ.")
+        return self.generate_images(GenerationRequest.from_record(record))[0]
+
+    def generate_images(self, request, step_callback=None, cancel_token=None):
+        """
+        요청한 수만큼의 이미지를 한 번의 배치 호출로 생성해 리스트로 반환.
+        각 이미지의 info[RUN_RECORD_KEY] 에 실행 기록(JSON)이 들어 있습니다.
+        step_callback/cancel_token 은 _make_step_callback 참고. 취소되면 OperationCancelled 발생.
+        """
         if not self.pipe:
             raise Exception("Model is not loaded.")
-        
-        # 이미지 생성
-        image = self.pipe(
-            prompt, 
-            negative_prompt=negative_prompt, 
-            num_inference_steps=30,
-            guidance_scale=7.5
-        ).images[0]
-        
-        return image
+        request.validate()
+
+        cancelled = False
+        try:
+            return self._generate(request, step_callback, cancel_token)
+        except OperationCancelled:
+            print("Generation cancelled.")
+            cancelled = True
+        # 예외 트레이스백이 해제된 뒤 중간 latent 등 생성 중 텐서 정리
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if cancelled:
+            raise OperationCancelled("Generation cancelled.")
+
+    def _generate(self, request, step_callback, cancel_token):
+        pipe = self._execution_pipeline()
+        torch_backend = pipe is self.pipe
+        original_scheduler = pipe.scheduler
+        scheduler = self._make_scheduler(request.scheduler)
+        if scheduler is not None:
+            pipe.scheduler = scheduler
+        try:
+            if cancel_token is not None:
+                cancel_token.check()
+            if torch_backend:
+                if self.is_quantized(pipe) and self.device != "cpu":
+                    # set_device 후 다시 로드하지 않은 경우 (로드 취소 등)
+                    raise Exception("The int8 model only runs on CPU. Reload the model or switch the device back to CPU.")
+                self._apply_pipeline_policies(pipe)
+            embeds = self._prompt_embeddings(pipe, request)
+            if embeds is None:
+                text_kwargs = {"prompt": request.prompt, "negative_prompt": request.negative_prompt}
+                if request.clip_skip is not None:
+                    text_kwargs["clip_skip"] = request.clip_skip
+            else:
+                text_kwargs = embeds
+            seeds = expand_seeds(request.seed, request.num_images_per_prompt)
+            interval = self._deep_cache_interval(pipe, request)
+            with self._autocast(pipe) if torch_backend else contextlib.nullcontext(), \
+                    deep_cache(pipe.unet, interval) if interval > 1 else contextlib.nullcontext():
+                images = pipe(
+                    **text_kwargs,
+                    width=request.width,
+                    height=request.height,
+                    num_inference_steps=request.steps,
+                    guidance_scale=request.guidance_scale,
+                    num_images_per_prompt=request.num_images_per_prompt,
+                    generator=self._make_generators(seeds),
+                    # 미리보기 계수는 모델 종류로 정해지므로 ONNX 백엔드도 self.pipe 기준
+                    callback_on_step_end=self._make_step_callback(self.pipe, step_callback, cancel_token),
+                ).images
+            for image, record in zip(images, self._run_record(request, seeds, pipe.scheduler, interval)):
+                image.info[RUN_RECORD_KEY] = json.dumps(record, default=str)
+            print(f"Seeds: {', '.join(str(seed) for seed in seeds)}")
+            return images
+        finally:
+            # 캐시된 파이프라인의 기본 스케줄러는 유지
+            pipe.scheduler = original_scheduler
 
 # ---------------------------------------------------------
 # GUI 클래스
 # ---------------------------------------------------------
+def make_contact_sheet(images, size):
+    """여러 이미지를 size 안에 격자로 배치한 한 장의 이미지"""
+    if len(images) == 1:
+        return images[0].resize(size, Image.Resampling.LANCZOS)
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    cell = (size[0] // columns, size[1] // rows)
+    sheet = Image.new("RGB", size, "#f0f0f0")
+    for i, image in enumerate(images):
+        thumb = image.copy()
+        thumb.thumbnail(cell, Image.Resampling.LANCZOS)
+        x = (i % columns) * cell[0] + (cell[0] - thumb.width) // 2
+        y = (i // columns) * cell[1] + (cell[1] - thumb.height) // 2
+        sheet.paste(thumb, (x, y))
+    return sheet
+
 class ImageGeneratorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("PicGo Local - AI Image Generator")
-        self.root.geometry("600x850") # Height increased
+        self.root.geometry("600x1040") # Height increased
         
         self.model_engine = TextToImageModel()
+        # model 폴더 카탈로그 (구조/정밀도/크기 인덱스)
+        # 창을 열 때는 헤더/quick hash 만 읽고, 전체 내용 해시는 Hash 버튼으로 필요할 때만
+        self.catalog = ModelCatalog(os.path.join(get_base_path(), "model"), hash_files=False)
 
         if not DEPENDENCIES_INSTALLED:
             messagebox.showerror("Missing Libraries", f"핵심 라이브러리({MISSING_LIB})가 설치되지 않았습니다.\n\n터미널에서 아래 명령어를 실행하세요:\npip install torch diffusers transformers accelerate")
@@ -160,6 +2010,30 @@ class ImageGeneratorApp:
         # 1. 모델 선택 영역 (2/3 Width)
         frame_model = tk.LabelFrame(frame_top, text="Model Settings", padx=10, pady=10)
         frame_model.pack(side="left", fill="both", expand=True, padx=(0, 5)) 
+
+        # 로딩 진행률 + 취소
+        frame_progress = tk.Frame(frame_model)
+        frame_progress.pack(side="bottom", fill="x", pady=(5, 0))
+        self.load_progress = ttk.Progressbar(frame_progress, mode="determinate", maximum=100)
+        self.load_progress.pack(side="left", fill="x", expand=True)
+        self.btn_cancel_load = tk.Button(frame_progress, text="Cancel", command=self.cancel_load, state="disabled")
+        self.btn_cancel_load.pack(side="left", padx=(5, 0))
+        self.load_cancel_token = None
+        self.generate_cancel_token = None
+
+        # 메모리에 올라가 있는 모델 목록 (선택 시 즉시 전환)
+        frame_resident = tk.Frame(frame_model)
+        frame_resident.pack(side="bottom", fill="x", pady=(5, 0))
+        tk.Label(frame_resident, text="In memory:").pack(side="left")
+        self.resident_var = tk.StringVar()
+        self.cmb_resident = ttk.Combobox(frame_resident, textvariable=self.resident_var, state="readonly")
+        self.cmb_resident.pack(side="left", fill="x", expand=True, padx=(5, 0))
+        self.cmb_resident.bind("<<ComboboxSelected>>", self.on_resident_select)
+        self.resident_paths = []
+        # 변환 캐시: 다음 로드가 빨라지지만 모델마다 디스크를 원본 크기 이상 사용
+        self.converted_cache_var = tk.BooleanVar(value=self.model_engine.converted_cache_enabled)
+        tk.Checkbutton(frame_resident, text="Cache converted models (extra disk)", variable=self.converted_cache_var,
+                       command=self.on_converted_cache_change).pack(side="left", padx=(5, 0))
         
         self.lbl_model = tk.Label(frame_model, text="No model loaded", fg="red")
         self.lbl_model.pack(side="left", expand=True)
@@ -167,6 +2041,9 @@ class ImageGeneratorApp:
         btn_load = tk.Button(frame_model, text="Load Model...", command=self.load_model_dialog)
         btn_load.pack(side="right")
 
+        btn_catalog = tk.Button(frame_model, text="Catalog...", command=self.open_catalog)
+        btn_catalog.pack(side="right", padx=(0, 5))
+
         # 1.5 Help Button Area (1/3 approx visual weight)
         frame_help = tk.LabelFrame(frame_top, text="Help & Info", padx=10, pady=10)
         frame_help.pack(side="right", fill="both", padx=(5, 0))
@@ -190,9 +2067,16 @@ class ImageGeneratorApp:
         self.txt_neg_prompt.pack(fill="x", pady=2)
         self.txt_neg_prompt.insert("1.0", "low quality, bad anatomy, blurry")
 
+        # 2.5 생성 설정 (해상도, 스텝, CFG, 시드, 스케줄러, 이미지 수)
+        self.create_generation_settings_ui()
+
         # 3. 실행 버튼
-        self.btn_generate = tk.Button(self.root, text="Generate Image", command=self.start_generation, bg="lightblue", font=("Arial", 12, "bold"))
-        self.btn_generate.pack(fill="x", padx=10, pady=10)
+        frame_generate = tk.Frame(self.root)
+        frame_generate.pack(fill="x", padx=10, pady=10)
+        self.btn_cancel_generate = tk.Button(frame_generate, text="Cancel", command=self.cancel_generation, state="disabled", font=("Arial", 12))
+        self.btn_cancel_generate.pack(side="right", padx=(5, 0))
+        self.btn_generate = tk.Button(frame_generate, text="Generate Image", command=self.start_generation, bg="lightblue", font=("Arial", 12, "bold"))
+        self.btn_generate.pack(side="left", fill="x", expand=True)
 
         # 4. 이미지 표시 영역
         self.lbl_image = tk.Label(self.root, text="Generated image will appear here", bg="#f0f0f0", height=20)
@@ -203,6 +2087,100 @@ class ImageGeneratorApp:
         self.btn_save.pack(pady=10)
 
         self.current_image = None
+        self.current_images = []
+
+    def create_generation_settings_ui(self):
+        """생성 파라미터 입력 UI"""
+        frame_gen = tk.LabelFrame(self.root, text="Generation Settings", padx=10, pady=5)
+        frame_gen.pack(fill="x", padx=10, pady=5)
+
+        sizes = ["Auto", "512", "576", "640", "768", "832", "896", "1024", "1152", "1216"]
+        tk.Label(frame_gen, text="Width:").grid(row=0, column=0, sticky="w")
+        self.width_var = tk.StringVar(value="Auto")
+        ttk.Combobox(frame_gen, textvariable=self.width_var, values=sizes, width=6).grid(row=0, column=1, padx=(2, 10))
+        tk.Label(frame_gen, text="Height:").grid(row=0, column=2, sticky="w")
+        self.height_var = tk.StringVar(value="Auto")
+        ttk.Combobox(frame_gen, textvariable=self.height_var, values=sizes, width=6).grid(row=0, column=3, padx=(2, 10))
+        tk.Label(frame_gen, text="Steps:").grid(row=0, column=4, sticky="w")
+        self.steps_var = tk.StringVar(value="30")
+        tk.Spinbox(frame_gen, from_=1, to=150, textvariable=self.steps_var, width=5).grid(row=0, column=5, padx=(2, 10))
+        tk.Label(frame_gen, text="CFG:").grid(row=0, column=6, sticky="w")
+        self.guidance_var = tk.StringVar(value="7.5")
+        tk.Spinbox(frame_gen, from_=0.0, to=30.0, increment=0.5, textvariable=self.guidance_var, width=5).grid(row=0, column=7, padx=(2, 0))
+
+        tk.Label(frame_gen, text="Seed:").grid(row=1, column=0, sticky="w", pady=(5, 0))
+        self.seed_var = tk.StringVar(value="")  # 비우면 무작위
+        tk.Entry(frame_gen, textvariable=self.seed_var, width=12).grid(row=1, column=1, columnspan=2, sticky="w", padx=(2, 10), pady=(5, 0))
+        tk.Label(frame_gen, text="Scheduler:").grid(row=1, column=3, sticky="w", pady=(5, 0))
+        self.scheduler_var = tk.StringVar(value="Default")
+        cmb_scheduler = ttk.Combobox(frame_gen, textvariable=self.scheduler_var, values=list(SCHEDULERS), state="readonly", width=14)
+        cmb_scheduler.grid(row=1, column=4, columnspan=2, sticky="w", padx=(2, 10), pady=(5, 0))
+        cmb_scheduler.bind("<<ComboboxSelected>>", self.on_step_preset_change)
+        tk.Label(frame_gen, text="Images:").grid(row=1, column=6, sticky="w", pady=(5, 0))
+        self.num_images_var = tk.StringVar(value="1")
+        tk.Spinbox(frame_gen, from_=1, to=8, textvariable=self.num_images_var, width=5).grid(row=1, column=7, padx=(2, 0), pady=(5, 0))
+
+        # 스텝 프리셋: 스케줄러/프리셋을 바꾸면 Steps 를 권장값으로 채움 (직접 수정 가능)
+        tk.Label(frame_gen, text="Preset:").grid(row=2, column=0, sticky="w", pady=(5, 0))
+        self.step_preset_var = tk.StringVar(value="standard")
+        cmb_preset = ttk.Combobox(frame_gen, textvariable=self.step_preset_var, values=list(STEP_PRESETS), state="readonly", width=9)
+        cmb_preset.grid(row=2, column=1, columnspan=2, sticky="w", padx=(2, 10), pady=(5, 0))
+        cmb_preset.bind("<<ComboboxSelected>>", self.on_step_preset_change)
+        # Few-step 모드 (LCM-LoRA / 증류 모델): 다음 생성 시 적용
+        tk.Label(frame_gen, text="Few-step:").grid(row=2, column=3, sticky="w", pady=(5, 0))
+        self.few_step_var = tk.StringVar(value="off")
+        cmb_few_step = ttk.Combobox(frame_gen, textvariable=self.few_step_var, values=["off"] + list(FEW_STEP_PROFILES), state="readonly", width=11)
+        cmb_few_step.grid(row=2, column=4, columnspan=2, sticky="w", padx=(2, 10), pady=(5, 0))
+        cmb_few_step.bind("<<ComboboxSelected>>", self.on_few_step_change)
+        # DeepCache: 깊은 UNet 블록을 N 스텝마다 한 번만 계산 (1 = 끔)
+        tk.Label(frame_gen, text="Deep cache:").grid(row=2, column=6, sticky="w", pady=(5, 0))
+        self.deep_cache_var = tk.StringVar(value="1")
+        tk.Spinbox(frame_gen, from_=1, to=5, textvariable=self.deep_cache_var, width=5).grid(row=2, column=7, padx=(2, 0), pady=(5, 0))
+
+    def on_step_preset_change(self, event=None):
+        defaults = self.model_engine.request_defaults(self.scheduler_var.get(), self.step_preset_var.get())
+        self.steps_var.set(str(defaults["steps"]))
+
+    def on_few_step_change(self, event=None):
+        profile = None if self.few_step_var.get() == "off" else self.few_step_var.get()
+        engine = self.model_engine
+        previous = engine.few_step
+        engine.few_step = profile
+        if engine.pipe is not None:
+            # LoRA 파일이 있는지 미리 확인 (실제 적용은 생성 중일 수 있으므로 다음 생성 시작 시)
+            try:
+                engine.few_step_adapter()
+            except Exception as e:
+                engine.few_step = previous
+                self.few_step_var.set(previous or "off")
+                messagebox.showwarning("Few-step", str(e))
+                return
+        # 스케줄러는 모드가 정하므로 Default 로, 스텝/CFG 는 모드 기본값으로
+        self.scheduler_var.set("Default")
+        defaults = engine.request_defaults("Default", self.step_preset_var.get())
+        self.steps_var.set(str(defaults["steps"]))
+        self.guidance_var.set(str(defaults["guidance_scale"]))
+
+    def read_generation_request(self, prompt, neg_prompt):
+        """UI 값으로 GenerationRequest 생성 (잘못된 값이면 ValueError)"""
+        def size(value):
+            return None if value.strip().lower() in ("", "auto") else int(value)
+
+        seed_text = self.seed_var.get().strip()
+        request = GenerationRequest(
+            prompt,
+            neg_prompt,
+            width=size(self.width_var.get()),
+            height=size(self.height_var.get()),
+            steps=int(self.steps_var.get()),
+            guidance_scale=float(self.guidance_var.get()),
+            seed=int(seed_text) if seed_text else None,
+            scheduler=self.scheduler_var.get(),
+            num_images_per_prompt=int(self.num_images_var.get()),
+            deep_cache_interval=int(self.deep_cache_var.get()),
+        )
+        request.validate()
+        return request
 
     def create_device_selection_ui(self):
         """디바이스 선택(토글) UI 생성 함수"""
@@ -210,16 +2188,90 @@ class ImageGeneratorApp:
         frame_device.pack(fill="x", padx=10, pady=5)
 
         self.device_var = tk.StringVar(value="auto")
+        # 마지막으로 적용한 선택 (생성/로딩 중 변경을 되돌릴 때 사용)
+        self.device_choice = "auto"
+        # torch import 완료를 기다리는 디바이스 변경이 있는지 (root.after 로 다시 확인)
+        self.device_change_pending = False
         
         # 토글 버튼 (Radiobutton)
         rb_auto = tk.Radiobutton(frame_device, text="Auto (Recommended)", variable=self.device_var, value="auto", command=self.on_device_change)
         rb_cpu = tk.Radiobutton(frame_device, text="CPU (Slow)", variable=self.device_var, value="cpu", command=self.on_device_change)
         rb_cuda = tk.Radiobutton(frame_device, text="GPU (CUDA/NVIDIA)", variable=self.device_var, value="cuda", command=self.on_device_change)
         
+        # 메모리 정책 (다음 생성/로드부터 적용)
+        frame_memory = tk.Frame(frame_device)
+        frame_memory.pack(side="bottom", fill="x", pady=(5, 0))
+        tk.Label(frame_memory, text="Memory:").pack(side="left", padx=(10, 0))
+        self.memory_policy_var = tk.StringVar(value=self.model_engine.memory_policy)
+        cmb_memory = ttk.Combobox(frame_memory, textvariable=self.memory_policy_var, values=list(MEMORY_POLICIES), state="readonly", width=10)
+        cmb_memory.pack(side="left", padx=5)
+        cmb_memory.bind("<<ComboboxSelected>>", self.on_memory_policy_change)
+        tk.Label(frame_memory, text="(minimal = least memory)", fg="gray").pack(side="left")
+        # 실행 백엔드 (onnx: 첫 생성 때 그래프를 한 번 내보냄)
+        tk.Label(frame_memory, text="Backend:").pack(side="left", padx=(10, 0))
+        self.backend_var = tk.StringVar(value=self.model_engine.backend)
+        cmb_backend = ttk.Combobox(frame_memory, textvariable=self.backend_var, values=list(BACKENDS), state="readonly", width=8)
+        cmb_backend.pack(side="left", padx=5)
+        cmb_backend.bind("<<ComboboxSelected>>", self.on_backend_change)
+
+        # CPU 성능 모드 (다음 생성/로드부터 적용)
+        frame_perf = tk.Frame(frame_device)
+        frame_perf.pack(side="bottom", fill="x", pady=(5, 0))
+        self.cpu_perf_var = tk.BooleanVar(value=False)
+        self.compile_unet_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_perf, text="CPU performance mode", variable=self.cpu_perf_var, command=self.on_cpu_performance_change).pack(side="left", padx=10)
+        self.chk_compile_unet = tk.Checkbutton(frame_perf, text="Compile UNet (slow first run)", variable=self.compile_unet_var, command=self.on_cpu_performance_change, state="disabled")
+        self.chk_compile_unet.pack(side="left", padx=10)
+        self.int8_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_perf, text="Int8 (CPU)", variable=self.int8_var, command=self.on_int8_change).pack(side="left", padx=10)
+
         rb_auto.pack(side="left", padx=10)
         rb_cpu.pack(side="left", padx=10)
         rb_cuda.pack(side="left", padx=10)
 
+    def on_converted_cache_change(self):
+        self.model_engine.converted_cache_enabled = self.converted_cache_var.get()
+
+    def on_memory_policy_change(self, event=None):
+        # 생성 중일 수 있으므로 설정만 바꾸고, 실제 적용은 다음 생성/로드 시작 시
+        self.model_engine.memory_policy = self.memory_policy_var.get()
+
+    def on_backend_change(self, event=None):
+        # 실제 전환(ONNX 내보내기/세션 생성)은 다음 생성 시작 시
+        try:
+            self.model_engine.set_backend(self.backend_var.get())
+        except Exception as e:
+            messagebox.showerror("Backend", str(e))
+            self.backend_var.set(self.model_engine.backend)
+
+    def on_cpu_performance_change(self):
+        enabled = self.cpu_perf_var.get()
+        self.chk_compile_unet.config(state="normal" if enabled else "disabled")
+        # 생성 중일 수 있으므로 여기서는 설정만 바꾸고, 실제 적용은 다음 생성/로드 시작 시
+        self.model_engine.cpu_performance = enabled
+        self.model_engine.compile_unet = enabled and self.compile_unet_var.get()
+
+    def on_int8_change(self):
+        # 양자화는 로드 시 적용되므로 현재 모델을 다시 로드 (float/int8 모델은 메모리 캐시에 따로 보관)
+        if self.model_engine.pipe and self.is_busy():
+            messagebox.showwarning("Int8", "Wait for the current generation or model load to finish.")
+            self.int8_var.set(self.model_engine.quantize_int8)
+            return
+        self.model_engine.quantize_int8 = self.int8_var.get()
+        if self.model_engine.pipe:
+            self.reload_current_model()
+
+    def is_busy(self):
+        """생성 또는 모델 로딩이 진행 중인지 (그동안 파이프라인을 옮기거나 다시 로드하면 안 됨)"""
+        return self.generate_cancel_token is not None or self.load_cancel_token is not None
+
+    def reload_current_model(self):
+        """현재 모델을 로딩 스레드에서 다시 로드 (진행률/취소 사용, 끝날 때까지 Generate 비활성화)"""
+        self.lbl_model.config(text="Loading...", fg="orange")
+        self.btn_generate.config(state="disabled")
+        threading.Thread(target=self._load_model_thread, args=(self.model_engine.model_path,),
+                         kwargs={"block_generate": True}, daemon=True).start()
+
     def open_help(self):
         help_win = tk.Toplevel(self.root)
         help_win.title("PicGo Help")
@@ -256,6 +2308,18 @@ class ImageGeneratorApp:
     def on_device_change(self):
         """토글 변경 시 하드웨어 체크 및 적용"""
         selected_device = self.device_var.get()
+        if self.is_busy():
+            # 생성/로딩 스레드가 쓰고 있는 파이프라인을 옮기지 않도록 끝날 때까지 변경 불가
+            messagebox.showwarning("Device", "Wait for the current generation or model load to finish before changing the device.")
+            self.device_var.set(self.device_choice)
+            return
+        if selected_device == "cuda" and DEPENDENCIES_INSTALLED and not ml_import_finished():
+            # CUDA 확인에는 torch 가 필요. GUI 스레드에서 import 를 기다리지 않고 끝난 뒤 다시 확인
+            if not self.device_change_pending:
+                self.device_change_pending = True
+                start_ml_import()
+                self.root.after(100, self.retry_device_change)
+            return
         
         # 하드웨어 체크
         if not self.check_hardware_availability(selected_device):
@@ -263,11 +2327,24 @@ class ImageGeneratorApp:
             self.device_var.set("cpu")
             selected_device = "cpu"
         
-        self.model_engine.set_device(selected_device)
+        self.device_choice = selected_device
+        if self.model_engine.set_device(selected_device):
+            # int8 모델은 GPU 로 옮길 수 없으므로 일반 모델로 다시 로드
+            self.reload_current_model()
+
+    def retry_device_change(self):
+        if not ml_import_finished():
+            self.root.after(100, self.retry_device_change)
+            return
+        self.device_change_pending = False
+        # 그 사이 사용자가 다른 장치를 골랐으면 마지막 선택을 적용
+        self.on_device_change()
 
     def check_hardware_availability(self, device_mode):
-        """선택한 장치가 실제로 사용 가능한지 확인"""
+        """선택한 장치가 실제로 사용 가능한지 확인 (torch import 가 끝난 뒤에만 호출)"""
         if device_mode == "cuda":
+            if not ml_stack_ready():
+                return False
             if not torch.cuda.is_available():
                 messagebox.showwarning(
                     "GPU Not Found", 
@@ -284,12 +2361,7 @@ class ImageGeneratorApp:
             return
 
         # PyInstaller 빌드 시 경로 처리
-        if getattr(sys, 'frozen', False):
-            base_path = os.path.dirname(sys.executable)
-        else:
-            base_path = os.path.dirname(__file__)
-
-        initial_dir = os.path.join(base_path, "model")
+        initial_dir = os.path.join(get_base_path(), "model")
         if not os.path.exists(initial_dir):
             os.makedirs(initial_dir, exist_ok=True)
 
@@ -299,22 +2371,180 @@ class ImageGeneratorApp:
             filetypes=[("Model checkpotins", "*.safetensors *.ckpt"), ("All files", "*.*")]
         )
         if file_path:
-            self.lbl_model.config(text="Loading...", fg="orange")
+            # .ckpt 는 한 번 safetensors 로 변환해 두면 다음부터 빠르게 로드됨
+            convert = False
+            if file_path.lower().endswith(".ckpt") and not converted_sibling(file_path):
+                convert = messagebox.askyesno(
+                    "Convert Checkpoint",
+                    ".ckpt 파일은 로딩이 느립니다.\n"
+                    "같은 폴더에 .safetensors 로 변환해 두고 사용할까요? (EMA 가중치 제거, 최초 1회)"
+                )
+
+            # import 가 아직 진행 중이면 로딩 스레드가 완료를 기다림
+            status = "Loading..." if ml_stack_ready() else "Loading libraries..."
+            self.lbl_model.config(text=status, fg="orange")
             self.root.update()
             
             # 스레드에서 로딩
-            threading.Thread(target=self._load_model_thread, args=(file_path,), daemon=True).start()
+            threading.Thread(target=self._load_model_thread, args=(file_path, convert), daemon=True).start()
+
+    def cancel_load(self):
+        if self.load_cancel_token is not None:
+            self.load_cancel_token.cancel()
+            self.btn_cancel_load.config(state="disabled")
+            self.lbl_model.config(text="Cancelling...", fg="orange")
+
+    def on_load_progress(self, event):
+        """로딩 스레드에서 호출됨 -> UI 스레드에서 진행률 갱신"""
+        def update():
+            self.load_progress["value"] = event["fraction"] * 100
+            if event["phase"] == "read" and event["bytes_total"]:
+                text = f"Reading {event['bytes_read'] / 1024 ** 3:.1f} / {event['bytes_total'] / 1024 ** 3:.1f} GB"
+            elif event["phase"] == "components" and event["components_total"]:
+                text = f"Loading components {event['components_done']} / {event['components_total']}"
+            elif event["phase"] == "save":
+                text = "Saving converted model..."
+            elif event["phase"] == "device":
+                text = "Moving to device..."
+            else:
+                return
+            self.lbl_model.config(text=text, fg="orange")
+        self.root.after(0, update)
 
-    def _load_model_thread(self, path):
-        success = self.model_engine.load_model(path)
+    def _load_model_thread(self, path, convert=False, block_generate=False):
+        token = CancelToken()
+        self.load_cancel_token = token
+        self.root.after(0, lambda: self.btn_cancel_load.config(state="normal"))
+        try:
+            self._load_model_with_token(path, convert, token)
+        finally:
+            if self.load_cancel_token is token:
+                self.load_cancel_token = None
+                self.root.after(0, lambda: self.btn_cancel_load.config(state="disabled"))
+            if block_generate:
+                self.root.after(0, lambda: self.btn_generate.config(state="normal"))
+
+    def _load_model_with_token(self, path, convert, token):
+        if convert:
+            try:
+                wait_for_ml_stack()
+                self.root.after(0, lambda: self.lbl_model.config(text="Converting...", fg="orange"))
+                # 변환 중에도 Cancel 로 중단 가능 (텐서마다 확인)
+                convert_ckpt_to_safetensors(path, progress=lambda done, total: token.check())
+            except OperationCancelled:
+                self.root.after(0, lambda: self.lbl_model.config(text="Load cancelled", fg="red"))
+                return
+            except Exception as e:
+                # 변환 실패 시 원본 .ckpt 로 로드
+                print(f"Conversion failed: {e}")
+            self.root.after(0, lambda: self.lbl_model.config(text="Loading...", fg="orange"))
+        success = self.model_engine.load_model(path, progress_callback=self.on_load_progress, cancel_token=token)
+        self.root.after(0, self.refresh_resident_models)
         if success:
             self.root.after(0, lambda: self.lbl_model.config(text=f"Loaded: {os.path.basename(path)}", fg="green"))
+        elif token.cancelled:
+            self.root.after(0, lambda: (self.lbl_model.config(text="Load cancelled", fg="red"),
+                                        self.load_progress.config(value=0)))
         else:
             self.root.after(0, lambda: self.lbl_model.config(text="Load Failed", fg="red"))
             # 에러 메시지를 팝업에 표시
             error_msg = self.model_engine.last_error
             self.root.after(0, lambda: messagebox.showerror("Load Failed", f"모델 로딩 실패:\n{error_msg}"))
 
+    def refresh_resident_models(self):
+        resident = self.model_engine.resident_models()
+        self.resident_paths = [path for path, _, _ in resident]
+        self.cmb_resident["values"] = [f"{label} ({nbytes / 1024 ** 3:.1f} GB)" for _, label, nbytes in resident]
+        if resident and self.model_engine.model_path:
+            current = os.path.abspath(self.model_engine.model_path) if os.path.isfile(self.model_engine.model_path) else self.model_engine.model_path
+            if current in self.resident_paths:
+                self.cmb_resident.current(self.resident_paths.index(current))
+
+    def on_resident_select(self, event=None):
+        index = self.cmb_resident.current()
+        if index < 0:
+            return
+        path = self.resident_paths[index]
+        self.lbl_model.config(text="Loading...", fg="orange")
+        threading.Thread(target=self._load_model_thread, args=(path,), daemon=True).start()
+
+    def open_catalog(self):
+        """model 폴더 카탈로그 창 (구조/정밀도/크기 확인 후 바로 로드)"""
+        win = tk.Toplevel(self.root)
+        win.title("Model Catalog")
+        win.geometry("640x400")
+
+        columns = ("type", "precision", "size")
+        tree = ttk.Treeview(win, columns=columns)
+        tree.heading("#0", text="File")
+        tree.heading("type", text="Type")
+        tree.heading("precision", text="Precision")
+        tree.heading("size", text="Size")
+        tree.column("#0", width=320)
+        tree.column("type", width=110)
+        tree.column("precision", width=80)
+        tree.column("size", width=80, anchor="e")
+        tree.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+
+        frame_buttons = tk.Frame(win)
+        frame_buttons.pack(fill="x", padx=10, pady=(0, 10))
+        lbl_status = tk.Label(frame_buttons, text="")
+        lbl_status.pack(side="left")
+
+        def fill():
+            tree.delete(*tree.get_children())
+            for entry in self.catalog.entries():
+                kind = entry["label"] or "Unknown"
+                if entry["inpainting"]:
+                    kind += " (inpaint)"
+                tree.insert("", "end", iid=entry["path"], text=entry["name"],
+                            values=(kind, entry["precision"] or "-", f"{entry['size'] / 1024 ** 3:.2f} GB"))
+
+        def on_progress(done, total, name, verb="Reading"):
+            text = f"{verb} {done + 1}/{total}: {name}" if name else ""
+            self.root.after(0, lambda: lbl_status.config(text=text) if win.winfo_exists() else None)
+
+        def rescan():
+            lbl_status.config(text="Scanning...")
+
+            def worker():
+                stats = self.catalog.scan(progress=on_progress)
+                summary = f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed"
+                self.root.after(0, lambda: (fill(), lbl_status.config(text=summary)) if win.winfo_exists() else None)
+
+            threading.Thread(target=worker, daemon=True).start()
+
+        def hash_selected():
+            # 선택한 파일 (없으면 아직 해시가 없는 모든 파일) 의 내용 해시 계산
+            paths = list(tree.selection()) or None
+            lbl_status.config(text="Hashing...")
+
+            def worker():
+                hashed = self.catalog.hash_entries(paths, progress=lambda d, t, n: on_progress(d, t, n, "Hashing"))
+                self.root.after(0, lambda: lbl_status.config(text=f"{hashed} hashed") if win.winfo_exists() else None)
+
+            threading.Thread(target=worker, daemon=True).start()
+
+        def load_selected(event=None):
+            selection = tree.selection()
+            if not selection:
+                return
+            if not DEPENDENCIES_INSTALLED:
+                messagebox.showerror("Error", "Required libraries (torch, diffusers) are missing.")
+                return
+            path = selection[0]
+            win.destroy()
+            self.lbl_model.config(text="Loading...", fg="orange")
+            threading.Thread(target=self._load_model_thread, args=(path,), daemon=True).start()
+
+        tree.bind("<Double-1>", load_selected)
+        tk.Button(frame_buttons, text="Load", command=load_selected).pack(side="right")
+        tk.Button(frame_buttons, text="Rescan", command=rescan).pack(side="right", padx=5)
+        tk.Button(frame_buttons, text="Hash", command=hash_selected).pack(side="right")
+
+        fill()
+        rescan()
+
     def start_generation(self):
         if not self.model_engine.pipe:
             messagebox.showwarning("Warning", "Please load a model first!")
@@ -327,16 +2557,32 @@ class ImageGeneratorApp:
             
         # Main Thread에서 UI 값 읽기
         neg_prompt = self.txt_neg_prompt.get("1.0", "end").strip()
+        try:
+            request = self.read_generation_request(prompt, neg_prompt)
+        except ValueError as e:
+            messagebox.showwarning("Invalid Settings", str(e))
+            return
         
         self.btn_generate.config(state="disabled", text="Generating...", bg="orange")
+        self.generate_cancel_token = CancelToken()
+        self.btn_cancel_generate.config(state="normal")
         
         # 스레드에서 생성 (데이터 전달)
-        threading.Thread(target=self._generate_thread, args=(prompt, neg_prompt), daemon=True).start()
+        threading.Thread(target=self._generate_thread, args=(request, self.generate_cancel_token), daemon=True).start()
+
+    def cancel_generation(self):
+        if self.generate_cancel_token is not None:
+            self.generate_cancel_token.cancel()
+            self.btn_cancel_generate.config(state="disabled")
+            self.btn_generate.config(text="Cancelling...")
 
-    def _generate_thread(self, prompt, neg_prompt):
+    def _generate_thread(self, request, cancel_token):
         try:
-            image = self.model_engine.generate_image(prompt, neg_prompt)
-            self.root.after(0, lambda: self.show_image(image))
+            wait_for_ml_stack()
+            images = self.model_engine.generate_images(request, step_callback=self.on_generation_step, cancel_token=cancel_token)
+            self.root.after(0, lambda: self.show_images(images))
+        except OperationCancelled:
+            self.root.after(0, self.restore_image_view)
         except Exception as e:
             import traceback
             tb = traceback.format_exc()
@@ -350,33 +2596,61 @@ class ImageGeneratorApp:
             self.root.after(0, lambda: messagebox.showerror("Generation Error", f"{str(e)}\n\n(See picgo_error.log)"))
         finally:
             self.root.after(0, lambda: self.btn_generate.config(state="normal", text="Generate Image", bg="lightblue"))
+            self.root.after(0, lambda: self.btn_cancel_generate.config(state="disabled"))
+            self.root.after(0, lambda: setattr(self, "generate_cancel_token", None) if self.generate_cancel_token is cancel_token else None)
+
+    def on_generation_step(self, step, total, previews):
+        """생성 스레드에서 호출됨 -> UI 스레드에서 단계 표시와 미리보기 갱신"""
+        def update():
+            self.btn_generate.config(text=f"Generating... ({step}/{total})")
+            if previews:
+                # latent 해상도(1/8) 미리보기를 표시 크기로 확대
+                sheet = make_contact_sheet([p.resize((p.width * 8, p.height * 8), Image.Resampling.BILINEAR) for p in previews], (512, 512))
+                tk_img = ImageTk.PhotoImage(sheet)
+                self.lbl_image.config(image=tk_img, text="")
+                self.lbl_image.image = tk_img
+        self.root.after(0, update)
+
+    def restore_image_view(self):
+        """취소 후 미리보기를 지우고 마지막 결과(없으면 안내 문구)를 다시 표시"""
+        if self.current_images:
+            self.show_images(self.current_images)
+        else:
+            self.lbl_image.config(image="", text="Generation cancelled")
+            self.lbl_image.image = None
 
     def show_image(self, image):
-        self.current_image = image
-        # 리사이즈해서 표시
+        self.show_images([image])
+
+    def show_images(self, images):
+        self.current_images = list(images)
+        self.current_image = self.current_images[0]
+        # 리사이즈해서 표시 (여러 장이면 격자로 모아서)
         display_size = (512, 512)
-        img_resized = image.resize(display_size, Image.Resampling.LANCZOS)
+        img_resized = make_contact_sheet(self.current_images, display_size)
         tk_img = ImageTk.PhotoImage(img_resized)
         
         self.lbl_image.config(image=tk_img, text="")
         self.lbl_image.image = tk_img # 참조 유지
-        self.btn_save.config(state="normal")
+        self.btn_save.config(state="normal", text="Save Image" if len(self.current_images) == 1 else f"Save {len(self.current_images)} Images")
 
     def save_image(self):
-        if self.current_image:
+        if self.current_images:
             file_path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG files", "*.png")])
             if file_path:
-                self.current_image.save(file_path)
-                messagebox.showinfo("Saved", f"Image saved to {file_path}")
+                if len(self.current_images) == 1:
+                    saved = [file_path]
+                else:
+                    # 여러 장이면 name_1.png, name_2.png ... 로 저장
+                    base, ext = os.path.splitext(file_path)
+                    saved = [f"{base}_{i + 1}{ext}" for i in range(len(self.current_images))]
+                for image, path in zip(self.current_images, saved):
+                    save_image_with_record(image, path)
+                messagebox.showinfo("Saved", f"Image saved to {saved[0]}" if len(saved) == 1 else f"{len(saved)} images saved to {os.path.dirname(saved[0])}")
 
 if __name__ == "__main__":
     # Ensure model folder exists at startup
-    if getattr(sys, 'frozen', False):
-        base_path = os.path.dirname(sys.executable)
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    
-    model_dir = os.path.join(base_path, "model")
+    model_dir = os.path.join(get_base_path(), "model")
     if not os.path.exists(model_dir):
         try:
             os.makedirs(model_dir, exist_ok=True)
@@ -384,6 +2658,14 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"Failed to create model directory: {e}")
 
+    # 콜드 스타트 측정: python picgo_local.py --import-time
+    if "--import-time" in sys.argv:
+        wait_for_ml_stack()
+        print(json.dumps({name: round(seconds, 3) for name, seconds in ML_IMPORT_TIMINGS.items()}))
+        sys.exit(0)
+
     root = tk.Tk()
     app = ImageGeneratorApp(root)
+    # 창을 먼저 띄운 뒤 ML 라이브러리 import
+    root.after(0, start_ml_import)
     root.mainloop()
@@ -0,0 +1,424 @@
+import importlib.util
+import itertools
+import json
+import os
+import shutil
+import time
+import types
+import warnings
+
+import numpy as np
+import torch
+from PIL import Image
+
+from picgo_checkpoint import get_base_path
+
+# ---------------------------------------------------------
+# ONNX Runtime 실행 백엔드 (CPU)
+# - 로드된 파이프라인의 텍스트 인코더, UNet, VAE 디코더를 한 번 ONNX 로 내보내 모델 옆 <모델 이름>.onnx/ 폴더에 저장하고,
+#   디노이징 루프를 ONNX Runtime CPUExecutionProvider 에서 실행합니다.
+# - 스케줄러, 토크나이저, 초기 노이즈는 diffusers 파이프라인과 같은 것을 쓰므로 같은 시드 = 거의 같은 이미지입니다.
+# - OnnxDiffusionRuntime 은 diffusers 파이프라인과 같은 encode_prompt/__call__ 인터페이스를 제공합니다
+#   (엔진의 생성 경로, 프롬프트 캐시, 미리보기/취소 콜백을 그대로 사용).
+# ---------------------------------------------------------
+MANIFEST_FILE = "picgo_onnx.json"
+MANIFEST_VERSION = 1
+DEFAULT_OPSET = 17
+DEFAULT_ONNX_CACHE_DIR = os.path.join(get_base_path(), "cache", "onnx")
+# protobuf 한 파일 한도. 가중치가 이보다 큰 그래프는 외부 데이터로 저장되며, 합칠 때 onnx 패키지가 필요
+PROTOBUF_LIMIT_BYTES = 2 ** 31
+
+# 이름 -> onnxruntime.GraphOptimizationLevel 속성
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def onnx_folder_for(model_path_or_id, variant=None):
+    """
+    ONNX 그래프 폴더: 파일이면 옆의 <이름>.onnx/, Hub ID/폴더면 cache/onnx/<ID>.onnx/
+    variant (예: LoRA 를 합친 UNet) 가 있으면 <이름>.<variant>.onnx/
+    """
+    suffix = f".{variant}.onnx" if variant else ".onnx"
+    if os.path.isfile(model_path_or_id):
+        return os.path.splitext(os.path.abspath(model_path_or_id))[0] + suffix
+    name = model_path_or_id.strip("/\\").replace("/", "--").replace("\\", "--").replace(":", "")
+    return os.path.join(DEFAULT_ONNX_CACHE_DIR, name + suffix)
+
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+# ---------------------------------------------------------
+# 내보내기
+# ---------------------------------------------------------
+class _TextEncoderGraph(torch.nn.Module):
+    """input_ids -> hidden (hidden_layer 가 None 이면 last_hidden_state), with_pooled 면 (hidden, pooled)"""
+
+    def __init__(self, encoder, hidden_layer=None, with_pooled=False):
+        super().__init__()
+        self.encoder = encoder
+        self.hidden_layer = hidden_layer
+        self.with_pooled = with_pooled
+
+    def forward(self, input_ids):
+        out = self.encoder(input_ids, output_hidden_states=True)
+        hidden = out[0] if self.hidden_layer is None else out.hidden_states[self.hidden_layer]
+        if self.with_pooled:
+            # CLIPTextModelWithProjection 의 text_embeds (diffusers SDXL encode_prompt 와 동일)
+            return hidden, out[0]
+        return hidden
+
+
+class _UNetGraph(torch.nn.Module):
+    """(sample, timestep, encoder_hidden_states[, text_embeds, time_ids]) -> noise_pred"""
+
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, encoder_hidden_states, *added):
+        added_cond_kwargs = {"text_embeds": added[0], "time_ids": added[1]} if added else None
+        return self.unet(sample, timestep, encoder_hidden_states,
+                         added_cond_kwargs=added_cond_kwargs, return_dict=False)[0]
+
+
+class _VaeDecoderGraph(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latent):
+        return self.vae.decode(latent, return_dict=False)[0]
+
+
+def _export_graph(module, args, folder, name, input_names, output_names, dynamic_axes, opset):
+    """module 을 folder/<name>.onnx 로 내보냄. 2GB 를 넘는 가중치는 <name>.onnx.data 한 파일에 저장"""
+    tmp_dir = os.path.join(folder, f".{name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    tmp_path = os.path.join(tmp_dir, f"{name}.onnx")
+    with torch.no_grad(), warnings.catch_warnings():
+        # 트레이싱 중 python 분기에 대한 경고는 고정 해상도/배치가 아닌 이상 무시해도 됨
+        warnings.simplefilter("ignore")
+        torch.onnx.export(module, args, tmp_path, input_names=input_names, output_names=output_names,
+                          dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True)
+    path = os.path.join(folder, f"{name}.onnx")
+    if len(os.listdir(tmp_dir)) > 1:
+        # 큰 모델은 텐서마다 파일이 하나씩 생기므로 한 파일로 합침
+        import onnx
+        model = onnx.load(tmp_path)
+        onnx.save_model(model, path, save_as_external_data=True, all_tensors_to_one_file=True,
+                        location=f"{name}.onnx.data")
+        del model
+    else:
+        os.replace(tmp_path, path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _unwrap(module):
+    # torch.compile 된 모듈은 원본 모듈로 내보냄
+    return getattr(module, "_orig_mod", module)
+
+
+def _needs_external_data(module):
+    tensors = itertools.chain(module.parameters(), module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) >= PROTOBUF_LIMIT_BYTES
+
+
+def _check_export_dependencies(pipe):
+    """2GB 가 넘는 그래프가 있는데 onnx 패키지가 없으면, 오래 걸리는 트레이싱 전에 실패"""
+    modules = {"text_encoder": pipe.text_encoder, "text_encoder_2": getattr(pipe, "text_encoder_2", None),
+               "unet": pipe.unet, "vae": pipe.vae}
+    large = [name for name, module in modules.items() if module is not None and _needs_external_data(_unwrap(module))]
+    if large and importlib.util.find_spec("onnx") is None:
+        raise RuntimeError(f"Exporting {', '.join(large)} to ONNX (over 2 GB) needs the onnx package. "
+                           "Install it with: pip install onnx")
+
+
+def export_pipeline(pipe, folder, source_hash=None, opset=DEFAULT_OPSET, progress=None):
+    """
+    SD 1.x/2.x, SDXL 파이프라인을 folder 에 ONNX 로 내보냄 (float32, CPU 모듈이어야 함).
+    progress(name) 는 컴포넌트를 내보내기 시작할 때마다 호출됩니다.
+    """
+    if pipe.dtype != torch.float32 or pipe.device.type != "cpu":
+        raise ValueError("ONNX export needs the float32 model on CPU.")
+    text_encoder_2 = getattr(pipe, "text_encoder_2", None)
+    sdxl = text_encoder_2 is not None
+    if pipe.text_encoder is None:
+        raise ValueError("ONNX export needs a pipeline with a text encoder (SDXL refiners are not supported).")
+    _check_export_dependencies(pipe)
+
+    start = time.perf_counter()
+    partial = folder + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    def step(name):
+        print(f"Exporting {name} to ONNX...")
+        if progress:
+            progress(name)
+
+    batch = {0: "batch"}
+    tokenizers = [pipe.tokenizer] + ([pipe.tokenizer_2] if sdxl else [])
+    encoders = [pipe.text_encoder] + ([text_encoder_2] if sdxl else [])
+    for k, (tokenizer, encoder) in enumerate(zip(tokenizers, encoders)):
+        name = "text_encoder" if k == 0 else "text_encoder_2"
+        step(name)
+        ids = tokenizer("", padding="max_length", max_length=tokenizer.model_max_length, truncation=True,
+                        return_tensors="pt").input_ids
+        # SDXL 은 끝에서 두 번째 hidden state 를 쓰고 풀링 임베딩은 두 번째 인코더에서 가져옴
+        with_pooled = sdxl and k == 1
+        graph = _TextEncoderGraph(_unwrap(encoder), -2 if sdxl else None, with_pooled)
+        outputs = ["hidden_states", "pooled"] if with_pooled else ["hidden_states"]
+        _export_graph(graph, (ids,), partial, name, ["input_ids"], outputs,
+                      {"input_ids": batch, **{output: batch for output in outputs}}, opset)
+        tokenizer.save_pretrained(os.path.join(partial, name.replace("text_encoder", "tokenizer")))
+
+    step("unet")
+    unet = _unwrap(pipe.unet)
+    size = max(8, unet.config.sample_size // 2 // 8 * 8)
+    spatial = {0: "batch", 2: "height", 3: "width"}
+    args = [
+        torch.randn(1, unet.config.in_channels, size, size),
+        torch.tensor([999.0]),
+        torch.randn(1, pipe.tokenizer.model_max_length, unet.config.cross_attention_dim),
+    ]
+    inputs = ["sample", "timestep", "encoder_hidden_states"]
+    if sdxl:
+        args += [torch.randn(1, text_encoder_2.config.projection_dim), torch.randn(1, 6)]
+        inputs += ["text_embeds", "time_ids"]
+    dynamic_axes = {"sample": spatial, "encoder_hidden_states": batch, "noise_pred": spatial}
+    dynamic_axes.update({name: batch for name in inputs[3:]})
+    _export_graph(_UNetGraph(unet), tuple(args), partial, "unet", inputs, ["noise_pred"], dynamic_axes, opset)
+
+    step("vae_decoder")
+    latent = torch.randn(1, pipe.vae.config.latent_channels, size, size)
+    _export_graph(_VaeDecoderGraph(_unwrap(pipe.vae)), (latent,), partial, "vae_decoder", ["latent"], ["sample"],
+                  {"latent": spatial, "sample": spatial}, opset)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "source_hash": source_hash,
+        "pipeline": type(pipe).__name__,
+        "sdxl": sdxl,
+        "opset": opset,
+        "torch": torch.__version__,
+        "in_channels": unet.config.in_channels,
+        "sample_size": unet.config.sample_size,
+        "vae_scale_factor": pipe.vae_scale_factor,
+        "scaling_factor": pipe.vae.config.scaling_factor,
+        "force_zeros_for_empty_prompt": bool(pipe.config.get("force_zeros_for_empty_prompt", False)),
+        "scheduler": dict(pipe.scheduler.config),
+    }
+    with open(os.path.join(partial, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    # 끝까지 성공한 내보내기만 제자리로 옮김 (중간에 실패하면 .partial 만 남음)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(partial, folder)
+    print(f"ONNX export finished in {time.perf_counter() - start:.1f}s: {folder}")
+    return manifest
+
+
+def ensure_exported(pipe, folder, source_hash=None, progress=None):
+    """folder 에 같은 모델(source_hash)의 그래프가 있으면 그대로, 없거나 다르면 새로 내보냄. manifest 반환"""
+    manifest = read_manifest(folder)
+    if manifest is not None and manifest.get("source_hash") == source_hash:
+        return manifest
+    return export_pipeline(pipe, folder, source_hash, progress=progress)
+
+# ---------------------------------------------------------
+# 실행
+# ---------------------------------------------------------
+def session_options(threads=None, inter_threads=1, graph_optimization="all"):
+    """
+    ORT 세션 옵션. threads 가 None 이면 ORT 기본값 (물리 코어 수).
+    inter_threads 는 그래프의 독립 노드를 동시에 실행할 스레드 수 (1 = 순차 실행)
+    """
+    import onnxruntime as ort
+
+    if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[graph_optimization])
+    if threads:
+        options.intra_op_num_threads = threads
+    if inter_threads and inter_threads > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.inter_op_num_threads = inter_threads
+    else:
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return options
+
+
+class OnnxDiffusionRuntime:
+    def __init__(self, folder, threads=None, inter_threads=1, graph_optimization="all"):
+        import onnxruntime as ort
+        import diffusers
+        from transformers import CLIPTokenizer
+
+        manifest = read_manifest(folder)
+        if manifest is None:
+            raise ValueError(f"No ONNX export found in {folder}")
+        self.folder = folder
+        self.manifest = manifest
+        self.settings = (threads, inter_threads, graph_optimization)
+        start = time.perf_counter()
+        options = session_options(threads, inter_threads, graph_optimization)
+
+        def session(name):
+            return ort.InferenceSession(os.path.join(folder, f"{name}.onnx"), options,
+                                        providers=["CPUExecutionProvider"])
+
+        self.sdxl = manifest["sdxl"]
+        names = ["text_encoder", "text_encoder_2"] if self.sdxl else ["text_encoder"]
+        self.text_encoders = [session(name) for name in names]
+        self.tokenizers = [CLIPTokenizer.from_pretrained(os.path.join(folder, name.replace("text_encoder", "tokenizer")))
+                           for name in names]
+        self.unet = session("unet")
+        self.vae_decoder = session("vae_decoder")
+        scheduler_config = manifest["scheduler"]
+        self.scheduler = getattr(diffusers, scheduler_config["_class_name"]).from_config(scheduler_config)
+
+        # diffusers 파이프라인과 같은 이름의 속성 (엔진의 생성 경로에서 사용)
+        self.config = {"force_zeros_for_empty_prompt": manifest["force_zeros_for_empty_prompt"]}
+        self.dtype = torch.float32
+        self.device = torch.device("cpu")
+        self._execution_device = self.device
+        self.vae_scale_factor = manifest["vae_scale_factor"]
+        self.num_timesteps = 0
+        print(f"ONNX Runtime sessions ready in {time.perf_counter() - start:.1f}s "
+              f"(optimization: {graph_optimization}, threads: {threads or 'default'}).")
+
+    @property
+    def embedding_identity(self):
+        """프롬프트 임베딩 캐시 키의 모델 부분"""
+        return f"onnx|{self.manifest['pipeline']}|{self.manifest.get('source_hash') or self.folder}"
+
+    # --- 텍스트 인코딩 ---
+    def _encode(self, text):
+        """텍스트 하나의 (hidden, pooled). SDXL 은 두 인코더의 hidden 을 이어 붙임"""
+        hidden_states = []
+        pooled = None
+        for tokenizer, encoder in zip(self.tokenizers, self.text_encoders):
+            ids = tokenizer(text, padding="max_length", max_length=tokenizer.model_max_length, truncation=True,
+                            return_tensors="np").input_ids.astype(np.int64)
+            outputs = encoder.run(None, {"input_ids": ids})
+            hidden_states.append(outputs[0])
+            if len(outputs) > 1:
+                pooled = outputs[1]
+        hidden = torch.from_numpy(np.concatenate(hidden_states, axis=-1))
+        return hidden, (torch.from_numpy(pooled) if pooled is not None else None)
+
+    def encode_prompt(self, prompt, device=None, num_images_per_prompt=1, do_classifier_free_guidance=True,
+                      negative_prompt=None, clip_skip=None, **kwargs):
+        """
+        diffusers encode_prompt 와 같은 값을 반환:
+        SD 는 (prompt_embeds, negative_prompt_embeds), SDXL 은 (.., pooled_prompt_embeds, negative_pooled_prompt_embeds)
+        """
+        if clip_skip is not None:
+            raise ValueError("clip_skip is not supported by the ONNX backend.")
+        embeds, pooled = self._encode(prompt)
+        negative = negative_pooled = None
+        if do_classifier_free_guidance:
+            if negative_prompt is None and self.config["force_zeros_for_empty_prompt"]:
+                negative = torch.zeros_like(embeds)
+                negative_pooled = torch.zeros_like(pooled) if pooled is not None else None
+            else:
+                negative, negative_pooled = self._encode(negative_prompt or "")
+        if num_images_per_prompt > 1:
+            embeds = embeds.repeat_interleave(num_images_per_prompt, dim=0)
+            negative = negative.repeat_interleave(num_images_per_prompt, dim=0) if negative is not None else None
+            pooled = pooled.repeat_interleave(num_images_per_prompt, dim=0) if pooled is not None else None
+            if negative_pooled is not None:
+                negative_pooled = negative_pooled.repeat_interleave(num_images_per_prompt, dim=0)
+        if self.sdxl:
+            return embeds, negative, pooled, negative_pooled
+        return embeds, negative
+
+    # --- 생성 ---
+    def _prepare_latents(self, batch, height, width, generator):
+        shape = (batch, self.manifest["in_channels"], height // self.vae_scale_factor, width // self.vae_scale_factor)
+        # diffusers randn_tensor 와 같은 순서로 생성 (생성기 리스트면 이미지마다 따로)
+        if isinstance(generator, list):
+            latents = torch.cat([torch.randn((1,) + shape[1:], generator=g, dtype=torch.float32) for g in generator])
+        else:
+            latents = torch.randn(shape, generator=generator, dtype=torch.float32)
+        return latents * self.scheduler.init_noise_sigma
+
+    def _step_kwargs(self, generator):
+        import inspect
+        accepted = set(inspect.signature(self.scheduler.step).parameters)
+        kwargs = {}
+        if "eta" in accepted:
+            kwargs["eta"] = 0.0
+        if "generator" in accepted:
+            kwargs["generator"] = generator
+        return kwargs
+
+    def __call__(self, prompt=None, negative_prompt=None, prompt_embeds=None, negative_prompt_embeds=None,
+                 pooled_prompt_embeds=None, negative_pooled_prompt_embeds=None, width=None, height=None,
+                 num_inference_steps=30, guidance_scale=7.5, num_images_per_prompt=1, generator=None,
+                 callback_on_step_end=None, clip_skip=None):
+        """diffusers 파이프라인 호출과 같은 인자/반환 (결과의 .images 는 PIL 이미지 리스트)"""
+        do_cfg = guidance_scale > 1.0
+        if prompt_embeds is None:
+            encoded = self.encode_prompt(prompt, num_images_per_prompt=1, do_classifier_free_guidance=do_cfg,
+                                         negative_prompt=negative_prompt, clip_skip=clip_skip)
+            prompt_embeds, negative_prompt_embeds = encoded[:2]
+            if self.sdxl:
+                pooled_prompt_embeds, negative_pooled_prompt_embeds = encoded[2:]
+        default_size = self.manifest["sample_size"] * self.vae_scale_factor
+        height = height or default_size
+        width = width or default_size
+
+        batch = prompt_embeds.shape[0] * num_images_per_prompt
+        embeds = prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+        if do_cfg:
+            embeds = torch.cat([negative_prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0), embeds])
+        feeds = {"encoder_hidden_states": embeds.float().numpy()}
+        if self.sdxl:
+            text_embeds = pooled_prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+            if do_cfg:
+                negative = negative_pooled_prompt_embeds.repeat_interleave(num_images_per_prompt, dim=0)
+                text_embeds = torch.cat([negative, text_embeds])
+            # original_size + crop (0, 0) + target_size
+            time_ids = np.array([[height, width, 0, 0, height, width]], dtype=np.float32)
+            feeds["text_embeds"] = text_embeds.float().numpy()
+            feeds["time_ids"] = np.repeat(time_ids, text_embeds.shape[0], axis=0)
+
+        self.scheduler.set_timesteps(num_inference_steps, device="cpu")
+        timesteps = self.scheduler.timesteps
+        self.num_timesteps = len(timesteps)
+        latents = self._prepare_latents(batch, height, width, generator)
+        step_kwargs = self._step_kwargs(generator)
+        for i, t in enumerate(timesteps):
+            model_input = torch.cat([latents] * 2) if do_cfg else latents
+            model_input = self.scheduler.scale_model_input(model_input, t)
+            feeds["sample"] = model_input.numpy()
+            feeds["timestep"] = np.array([float(t)], dtype=np.float32)
+            noise_pred = torch.from_numpy(self.unet.run(None, feeds)[0])
+            if do_cfg:
+                noise_uncond, noise_text = noise_pred.chunk(2)
+                noise_pred = noise_uncond + guidance_scale * (noise_text - noise_uncond)
+            latents = self.scheduler.step(noise_pred, t, latents, **step_kwargs, return_dict=False)[0]
+            if callback_on_step_end is not None:
+                outputs = callback_on_step_end(self, i, t, {"latents": latents})
+                latents = outputs.pop("latents", latents)
+
+        decoded = [self.vae_decoder.run(None, {"latent": (latent[None] / self.manifest["scaling_factor"]).numpy()})[0]
+                   for latent in latents]
+        images = []
+        for sample in decoded:
+            # diffusers VaeImageProcessor.postprocess(output_type="pil") 와 같은 변환
+            pixels = np.clip(sample[0] / 2 + 0.5, 0, 1).transpose(1, 2, 0)
+            images.append(Image.fromarray((pixels * 255).round().astype("uint8")))
+        return types.SimpleNamespace(images=images)